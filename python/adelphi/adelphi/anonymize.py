@@ -14,9 +14,11 @@
 
 
 # Functions and constants related to the anonymization process
-from adelphi.store import get_standard_columns_from_table_metadata
+import json
 import re
 
+from adelphi.store import get_column_index, invalidate_column_index
+
 # default prefixes for the anonymized names
 KEYSPACE_PREFIX = "ks"
 TABLE_PREFIX = "tbl"
@@ -25,95 +27,191 @@ TYPE_PREFIX = "udt"
 FIELD_PREFIX = "fld"
 INDEX_PREFIX = "idx"
 
-# maps the original schema names to the replacement names
-name_map = {
-    KEYSPACE_PREFIX: {},
-    TABLE_PREFIX: {},
-    COLUMN_PREFIX: {},
-    TYPE_PREFIX: {},
-    FIELD_PREFIX: {},
-    INDEX_PREFIX: {}
-}
+ALL_PREFIXES = [KEYSPACE_PREFIX, TABLE_PREFIX, COLUMN_PREFIX, TYPE_PREFIX, FIELD_PREFIX, INDEX_PREFIX]
 
-def get_name(original_name, prefix):
+# Matches quoted and unquoted identifiers within a CQL type string
+TYPE_IDENTIFIER_RE = re.compile(r'"(?:[^"]|"")*"|[A-Za-z_][A-Za-z0-9_]*')
+
+# Index targets can wrap the column name in a function such as keys(), values(), entries() or full()
+INDEX_TARGET_RE = re.compile(r'^(\w+)\((.+)\)$')
+
+
+def unquote(identifier):
+    if identifier.startswith('"') and identifier.endswith('"'):
+        return identifier[1:-1].replace('""', '"')
+    return identifier
+
+
+def quote_str(s):
+    return "\"{}\"".format(s)
+
+
+def build_name_map():
+    return {prefix: {} for prefix in ALL_PREFIXES}
+
+
+# maps the original schema names to the replacement names.  Used by the module-level
+# functions below; exporters use an Anonymizer with their own mapping instead.
+name_map = build_name_map()
+
+
+class Anonymizer:
     """
-    Looks up the anonymized name for the provided original name in the cache.
-    If not present, one is created, inserted into the cache and returned.
+    Anonymizes keyspaces using a mapping of original names to anonymized names owned by
+    this instance.  The mapping can be saved and loaded again later, in which case names
+    already in the mapping are re-used and new names are only generated for identifiers
+    which haven't been seen before.
     """
-    count = len(name_map[prefix])
-    anonymized_named_prefixed = "%s_%s" % (prefix, count)
-    return name_map[prefix].setdefault(original_name, anonymized_named_prefixed)
 
+    def __init__(self, name_map=None):
+        self.name_map = name_map if name_map is not None else build_name_map()
+        for prefix in ALL_PREFIXES:
+            self.name_map.setdefault(prefix, {})
 
-def anonymize_keyspace(keyspace):
-    keyspace.name = get_name(keyspace.name, KEYSPACE_PREFIX)
 
-    # anonymize udts at once because they can reference
-    # one another
-    udts = sorted(keyspace.user_types.values(), key=lambda v: v.name)
-    anonymize_udts(udts)
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
 
-    for table in sorted(keyspace.tables.values(), key=lambda v: v.name):
-        anonymize_table(table)
 
-    # remove functions, aggregates and views for now
-    keyspace.functions = {}
-    keyspace.aggregates = {}
-    keyspace.views = {}
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.name_map, f, indent=4, sort_keys=True)
 
-    return keyspace
 
-def anonymize_type(original_type):
-    name = original_type
-    for udt in name_map[TYPE_PREFIX]:
-        name = name.replace(udt, name_map[TYPE_PREFIX][udt])
-    return name
+    def get_name(self, original_name, prefix):
+        """
+        Looks up the anonymized name for the provided original name in the cache.
+        If not present, one is created, inserted into the cache and returned.
+        """
+        count = len(self.name_map[prefix])
+        anonymized_named_prefixed = "%s_%s" % (prefix, count)
+        return self.name_map[prefix].setdefault(original_name, anonymized_named_prefixed)
 
 
-def anonymize_udts(udts):
-    # anonymize all udt names first
-    for udt in udts:
-        udt.keyspace = get_name(udt.keyspace, KEYSPACE_PREFIX)
-        udt.name = get_name(udt.name, TYPE_PREFIX)
-    
-    for udt in udts:
-        # field names
-        udt.field_names = [get_name(field_name, FIELD_PREFIX) for field_name in udt.field_names]
-        # field types
-        udt.field_types = [anonymize_type(field_type) for field_type in udt.field_types]
+    def anonymize_keyspace(self, keyspace):
+        keyspace.name = self.get_name(keyspace.name, KEYSPACE_PREFIX)
 
-def anonymize_column(column):
-    column.name = get_name(column.name, COLUMN_PREFIX)
-    column.cql_type = anonymize_type(column.cql_type)
+        # anonymize udts at once because they can reference
+        # one another
+        udts = sorted(keyspace.user_types.values(), key=lambda v: v.name)
+        self.anonymize_udts(udts)
 
+        for table in sorted(keyspace.tables.values(), key=lambda v: v.name):
+            self.anonymize_table(table)
 
-def anonymize_index(index):
-    index.name = get_name(index.name, INDEX_PREFIX)
-    index.index_options['target'] = get_name(index.index_options["target"], COLUMN_PREFIX)
-    index.keyspace_name = get_name(index.keyspace_name, KEYSPACE_PREFIX)
-    index.table_name = get_name(index.table_name, TABLE_PREFIX)
+        # remove functions, aggregates and views for now
+        keyspace.functions = {}
+        keyspace.aggregates = {}
+        keyspace.views = {}
+
+        return keyspace
+
+
+    def anonymize_type(self, original_type):
+        """
+        Replaces every UDT name referenced in the type with its anonymized name.
+        The type is scanned once and only whole identifiers are replaced, so UDT names
+        which are substrings of other identifiers are left alone.
+        """
+        udt_map = self.name_map[TYPE_PREFIX]
+        if not udt_map:
+            return original_type
+
+        def replace(match):
+            identifier = match.group(0)
+            if identifier.startswith('"'):
+                return udt_map.get(identifier[1:-1].replace('""', '"'), identifier)
+            return udt_map.get(identifier, identifier)
+        return TYPE_IDENTIFIER_RE.sub(replace, original_type)
+
+
+    def anonymize_udts(self, udts):
+        # anonymize all udt names first
+        for udt in udts:
+            udt.keyspace = self.get_name(udt.keyspace, KEYSPACE_PREFIX)
+            udt.name = self.get_name(udt.name, TYPE_PREFIX)
+
+        for udt in udts:
+            # field names
+            udt.field_names = [self.get_name(field_name, FIELD_PREFIX) for field_name in udt.field_names]
+            # field types
+            udt.field_types = [self.anonymize_type(field_type) for field_type in udt.field_types]
 
-def anonymize_table(table):
-    table.keyspace_name = get_name(table.keyspace_name, KEYSPACE_PREFIX)
-    table.name = get_name(table.name, TABLE_PREFIX)
 
-    for pk in table.partition_key:
-        anonymize_column(pk)
+    def anonymize_column(self, column):
+        column.name = self.get_name(column.name, COLUMN_PREFIX)
+        column.cql_type = self.anonymize_type(column.cql_type)
 
-    for ck in table.clustering_key:
-        anonymize_column(ck)
 
-    # remove comment since it may contain sensitive information
-    table.options["comment"] = ""
+    def anonymize_index(self, index):
+        index.name = self.get_name(index.name, INDEX_PREFIX)
+        # Replace only the column name within the target so that it still refers to the (anonymized) column
+        target = index.index_options["target"]
+        match = INDEX_TARGET_RE.match(target)
+        if match:
+            index.index_options['target'] = "{}({})".format(match.group(1), self.get_name(unquote(match.group(2)), COLUMN_PREFIX))
+        else:
+            index.index_options['target'] = self.get_name(unquote(target), COLUMN_PREFIX)
+        index.keyspace_name = self.get_name(index.keyspace_name, KEYSPACE_PREFIX)
+        index.table_name = self.get_name(index.table_name, TABLE_PREFIX)
 
-    # The CQL python driver holds the same object references for clustering keys
-    # and regular columns, so we have to separate them otherwise the names
-    # will be re-anonymized.
-    for column in get_standard_columns_from_table_metadata(table):
-        anonymize_column(column)
 
-    for index in sorted(list(table.indexes.values()), key=lambda v: v.name):
-        if (index.kind == "CUSTOM"):
-            del table.indexes[index.name]
-            continue
-        anonymize_index(index)
+    def anonymize_table(self, table):
+        table.keyspace_name = self.get_name(table.keyspace_name, KEYSPACE_PREFIX)
+        table.name = self.get_name(table.name, TABLE_PREFIX)
+
+        # The CQL python driver holds the same object references for clustering keys
+        # and regular columns, so we have to separate them otherwise the names
+        # will be re-anonymized.  Column roles have to be determined before any
+        # columns are renamed.
+        columns = get_column_index(table)
+
+        for pk in columns.partition_key:
+            self.anonymize_column(pk)
+
+        for ck in columns.clustering_key:
+            self.anonymize_column(ck)
+
+        # remove comment since it may contain sensitive information
+        table.options["comment"] = ""
+
+        for column in columns.non_key:
+            self.anonymize_column(column)
+        invalidate_column_index(table)
+
+        for index in sorted(list(table.indexes.values()), key=lambda v: v.name):
+            if (index.kind == "CUSTOM"):
+                del table.indexes[index.name]
+                continue
+            self.anonymize_index(index)
+
+
+# Module-level functions operating on the module-level name_map
+def get_name(original_name, prefix):
+    return Anonymizer(name_map).get_name(original_name, prefix)
+
+
+def anonymize_keyspace(keyspace):
+    return Anonymizer(name_map).anonymize_keyspace(keyspace)
+
+
+def anonymize_type(original_type):
+    return Anonymizer(name_map).anonymize_type(original_type)
+
+
+def anonymize_udts(udts):
+    Anonymizer(name_map).anonymize_udts(udts)
+
+
+def anonymize_column(column):
+    Anonymizer(name_map).anonymize_column(column)
+
+
+def anonymize_index(index):
+    Anonymizer(name_map).anonymize_index(index)
+
+
+def anonymize_table(table):
+    Anonymizer(name_map).anonymize_table(table)
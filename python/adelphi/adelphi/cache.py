@@ -0,0 +1,151 @@
+# Copyright DataStax, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# On-disk cache of keyspace metadata fetched from a cluster
+
+import hashlib
+import json
+import logging
+import os
+import os.path
+import pickle
+import tempfile
+import time
+
+log = logging.getLogger('adelphi')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "adelphi")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+# Highest protocol supported by Python 2.7
+PICKLE_PROTOCOL = 2
+
+CACHE_FILE_SUFFIX = ".pickle"
+
+def get_schema_version(session):
+    """Return the schema version of the cluster or None if the nodes in the cluster don't agree on one"""
+    local_version = session.execute("SELECT schema_version FROM system.local WHERE key='local'").one()[0]
+    peer_versions = set(row[0] for row in session.execute("SELECT schema_version FROM system.peers") if row[0])
+    if peer_versions - set([local_version]):
+        log.info("Schema versions in cluster do not agree, schema cache will not be used")
+        return None
+    return str(local_version)
+
+
+def build_cache_key(schema_version, keyspaces = None, tables = None):
+    key_data = [schema_version, sorted(keyspaces or []), sorted(tables or [])]
+    m = hashlib.sha256()
+    m.update(json.dumps(key_data).encode("utf-8"))
+    return m.hexdigest()
+
+
+class SchemaCache:
+    """Stores dicts of keyspace name to cassandra.metadata.KeyspaceMetadata in a directory, one file per key.
+
+    Entries created more than max_age seconds ago are never returned.  Whenever an entry is added the least recently
+    used entries are evicted until the total size of the cache is below max_bytes.  Each file holds the creation time
+    of the entry followed by the keyspaces, while its mtime records when the entry was last used."""
+
+    def __init__(self, cache_dir = DEFAULT_CACHE_DIR, max_bytes = DEFAULT_MAX_BYTES, max_age = DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+
+    def __path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+
+    def __entries(self):
+        """Return a list of (mtime, size, path) tuples for every entry in the cache, oldest first"""
+        rv = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_FILE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            rv.append((stat.st_mtime, stat.st_size, path))
+        return sorted(rv)
+
+
+    def __remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+    def get(self, key):
+        path = self.__path(key)
+        now = time.time()
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        # An entry is never last used before it was created, so entries unused for max_age seconds have expired
+        # without having to read their creation time
+        expired = now - mtime > self.max_age
+        if not expired:
+            try:
+                with open(path, "rb") as f:
+                    created = pickle.load(f)
+                    if not isinstance(created, float):
+                        raise ValueError("Schema cache entry has no creation time")
+                    expired = now - created > self.max_age
+                    rv = None if expired else pickle.load(f)
+            except Exception:
+                log.info("Discarding unreadable schema cache entry {}".format(key), exc_info=True)
+                self.__remove(path)
+                return None
+        if expired:
+            log.info("Discarding expired schema cache entry {}".format(key))
+            self.__remove(path)
+            return None
+        os.utime(path, (now, now))
+        return rv
+
+
+    def put(self, key, keyspaces):
+        # Write to a temp file and rename so that concurrent readers never see a partial entry
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(float(time.time()), f, PICKLE_PROTOCOL)
+            pickle.dump(dict(keyspaces), f, PICKLE_PROTOCOL)
+        os.rename(tmp_path, self.__path(key))
+        self.evict()
+
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        for entry in self.__entries():
+            if now - entry[0] > self.max_age:
+                self.__remove(entry[2])
+            else:
+                entries.append(entry)
+
+        total = sum(entry[1] for entry in entries)
+        for (_, size, path) in entries:
+            if total <= self.max_bytes:
+                break
+            log.debug("Evicting schema cache entry {}".format(path))
+            self.__remove(path)
+            total -= size
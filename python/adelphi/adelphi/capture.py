@@ -0,0 +1,325 @@
+# Copyright DataStax, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Streaming summaries of captured traffic, either the output of "fqltool dump" for a full query log or a CSV export
+# of system_traces.sessions.  Queries are reduced to signatures (the query with all literals replaced by bind markers)
+# and only a bounded number of signatures and keys are tracked so memory use doesn't grow with the size of the capture.
+import csv
+import logging
+import math
+import re
+from collections import namedtuple
+from itertools import chain
+
+from adelphi.anonymize import unquote
+
+log = logging.getLogger('adelphi')
+
+# Maximum number of distinct query signatures tracked; queries with any other signature are only counted
+MAX_SIGNATURES = 10000
+
+# Number of keys tracked for each signature when estimating the skew of key accesses
+DEFAULT_KEY_CAPACITY = 1000
+
+# Keys are truncated to this length before they're tracked
+MAX_KEY_LENGTH = 256
+
+# Number of the most frequent keys used to fit a zipf distribution, and the minimum number required for a fit
+ZIPF_FIT_RANKS = 100
+MIN_ZIPF_FIT_RANKS = 5
+
+SELECT = "select"
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+LOGGED = "logged"
+UNLOGGED = "unlogged"
+
+# A statement parsed from a query signature.  conditions is a tuple of (column, operator) pairs from the where clause,
+# ttl is true for writes using a TTL and batch is LOGGED or UNLOGGED for the first statement of a batch (None otherwise).
+Statement = namedtuple('Statement', ['kind', 'keyspace', 'table', 'conditions', 'ttl', 'batch'])
+
+IDENT = r'(?:"(?:[^"]|"")+"|\w+)'
+TABLE = r'(?:(?P<keyspace>{0})\.)?(?P<table>{0})'.format(IDENT)
+SELECT_RE = re.compile(r'^select\s.*?\sfrom\s+' + TABLE + r'(?P<rest>.*)$', re.I | re.S)
+INSERT_RE = re.compile(r'^insert\s+into\s+' + TABLE + r'(?P<rest>.*)$', re.I | re.S)
+UPDATE_RE = re.compile(r'^update\s+' + TABLE + r'(?P<rest>.*)$', re.I | re.S)
+DELETE_RE = re.compile(r'^delete\s.*?\bfrom\s+' + TABLE + r'(?P<rest>.*)$', re.I | re.S)
+BATCH_RE = re.compile(r'^begin\s+(?P<type>unlogged\s+|counter\s+|logged\s+)?batch\s+(?P<body>.*?)\s*;?\s*apply\s+batch\s*;?$', re.I | re.S)
+
+WHERE_RE = re.compile(r'\bwhere\b(?P<where>.*)$', re.I | re.S)
+WHERE_END_RE = re.compile(r'\s+(?:limit|per\s+partition\s+limit|order\s+by|allow\s+filtering|if)\b.*$', re.I | re.S)
+AND_RE = re.compile(r'\s+and\s+', re.I)
+OPERATOR = r'(?P<op>>=|<=|!=|=|>|<|\bin\b|\bcontains\s+key\b|\bcontains\b|\blike\b)'
+CONDITION_RE = re.compile(r'^(?P<cols>{})\s*{}'.format(IDENT, OPERATOR), re.I)
+MULTI_CONDITION_RE = re.compile(r'^\((?P<cols>[^)]*)\)\s*{}'.format(OPERATOR), re.I)
+TTL_RE = re.compile(r'\busing\b[^;]*?\bttl\b', re.I)
+
+# Quoted identifiers are matched (and preserved) so that literals within them aren't replaced
+LITERAL_RE = re.compile(r'(?P<ident>"(?:[^"]|"")*")'
+                        r"|'(?:[^']|'')*'"
+                        r'|\$\$.*?\$\$'
+                        r'|\b0x[0-9a-fA-F]*\b'
+                        r'|\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'
+                        r'|(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b', re.S)
+
+# Fields of the records written by "fqltool dump"
+FQL_FIELD_RE = re.compile(r'^(?P<field>Type|Query start time|Protocol version|Generated timestamp|Generated nowInSeconds|'
+                          r'Keyspace|Batch type|Query|Values):\s?(?P<value>.*)$')
+FQL_VALUE_SEPARATOR = "-----"
+
+# Entries of the parameters map of system_traces.sessions
+TRACE_QUERY_RE = re.compile(r"'query'\s*:\s*'((?:[^']|'')*)'", re.S)
+TRACE_BOUND_VALUE_RE = re.compile(r"'bound_var_\d+[^']*'\s*:\s*'((?:[^']|'')*)'", re.S)
+
+
+def normalize_identifier(identifier):
+    return unquote(identifier) if identifier.startswith('"') else identifier.lower()
+
+
+def normalize_query(query):
+    """Returns the signature of query (the query with each literal replaced by a bind marker and whitespace collapsed)
+    along with a list of the literals found after the where keyword, which usually identify the keys accessed"""
+    literals = []
+    def replace(match):
+        if match.group("ident"):
+            return match.group(0)
+        literals.append((match.start(), match.group(0)))
+        return "?"
+    signature = " ".join(LITERAL_RE.sub(replace, query).split())
+    where = re.search(r'\bwhere\b', query, re.I)
+    keys = [literal for (start, literal) in literals if where and start > where.start()]
+    return (signature, keys)
+
+
+def parse_conditions(rest):
+    match = WHERE_RE.search(rest)
+    if not match:
+        return ()
+    rv = []
+    for condition in AND_RE.split(WHERE_END_RE.sub("", match.group("where")).strip()):
+        condition = condition.strip()
+        multi = MULTI_CONDITION_RE.match(condition)
+        if multi:
+            op = multi.group("op").lower()
+            rv.extend((normalize_identifier(col.strip()), op) for col in multi.group("cols").split(","))
+            continue
+        single = CONDITION_RE.match(condition)
+        if single:
+            rv.append((normalize_identifier(single.group("cols")), " ".join(single.group("op").lower().split())))
+    return tuple(rv)
+
+
+def parse_statement(signature):
+    """Parse the signature of a query into a Statement.  Returns None for anything other than a select, insert,
+    update, delete or batch of these."""
+    signature = signature.strip().rstrip(";").strip()
+    batch = BATCH_RE.match(signature)
+    if batch:
+        first = parse_statement(batch.group("body").split(";")[0])
+        if first is None:
+            return None
+        batch_type = (batch.group("type") or "").strip().lower()
+        return first._replace(batch=LOGGED if batch_type in ("", "logged") else UNLOGGED)
+    for (kind, regex) in [(SELECT, SELECT_RE), (INSERT, INSERT_RE), (UPDATE, UPDATE_RE), (DELETE, DELETE_RE)]:
+        match = regex.match(signature)
+        if match:
+            keyspace = match.group("keyspace")
+            rest = match.group("rest")
+            return Statement(kind, normalize_identifier(keyspace) if keyspace else None, normalize_identifier(match.group("table")),
+                             parse_conditions(rest) if kind != INSERT else (), bool(TTL_RE.search(rest)), None)
+    return None
+
+
+class FrequentItems(object):
+    """Approximate counts of the most frequent items in a stream using at most capacity counters (the Misra-Gries
+    algorithm).  Counts are underestimated by at most the number of decrements applied."""
+
+    def __init__(self, capacity=DEFAULT_KEY_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.decrements = 0
+
+
+    def add(self, item):
+        if item in self.counts:
+            self.counts[item] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = 1
+        else:
+            # Each decrement is paid for by the capacity + 1 items it discards so the cost is amortized
+            self.decrements += 1
+            self.counts = {k: v - 1 for (k, v) in self.counts.items() if v > 1}
+
+
+    def estimates(self):
+        """Estimated counts of the tracked items, most frequent first.  Each count is the midpoint of its bounds."""
+        return sorted((count + self.decrements / 2.0 for count in self.counts.values()), reverse=True)
+
+
+def estimate_zipf_exponent(counts, ranks=ZIPF_FIT_RANKS):
+    """Fit a zipf distribution to the counts of the most frequent keys (in descending order) by least squares on a
+    log-log scale.  Returns None if there are too few keys to fit."""
+    counts = [c for c in counts[:ranks] if c > 0]
+    if len(counts) < MIN_ZIPF_FIT_RANKS:
+        return None
+    xs = [math.log(rank) for rank in range(1, len(counts) + 1)]
+    ys = [math.log(count) for count in counts]
+    (mean_x, mean_y) = (sum(xs) / len(xs), sum(ys) / len(ys))
+    slope = sum((x - mean_x) * (y - mean_y) for (x, y) in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+    return -slope
+
+
+class SignatureStats(object):
+    """Number of queries with a given signature along with the most frequently accessed keys"""
+
+    def __init__(self, statement, key_capacity):
+        self.statement = statement
+        self.count = 0
+        self.keys = FrequentItems(key_capacity)
+
+
+class TrafficCapture(object):
+    """Summary of the queries in a capture grouped by signature"""
+
+    def __init__(self, key_capacity=DEFAULT_KEY_CAPACITY, max_signatures=MAX_SIGNATURES):
+        self.key_capacity = key_capacity
+        self.max_signatures = max_signatures
+        self.signatures = {}
+        self.queries = 0
+        self.untracked = 0
+
+
+    def add(self, query, values=None, keyspace=None):
+        """Add a query to the capture.  values are the bound values of a prepared query if known, while keyspace is
+        the keyspace of the session which executed it (if known) and applies to tables which aren't qualified by a
+        keyspace.  Signatures are tracked separately for each session keyspace."""
+        self.queries += 1
+        (signature, literals) = normalize_query(query)
+        stats = self.signatures.get((signature, keyspace))
+        if stats is None:
+            if len(self.signatures) >= self.max_signatures:
+                self.untracked += 1
+                return
+            statement = parse_statement(signature)
+            if statement is not None and statement.keyspace is None and keyspace is not None:
+                statement = statement._replace(keyspace=keyspace)
+            stats = SignatureStats(statement, self.key_capacity)
+            self.signatures[(signature, keyspace)] = stats
+        stats.count += 1
+        if stats.statement is None:
+            return
+        # Bound values are only used as keys for statements which don't also bind the values being written
+        keys = literals
+        if values and stats.statement.kind in (SELECT, DELETE):
+            keys = values
+        if keys:
+            stats.keys.add("|".join(keys)[:MAX_KEY_LENGTH])
+
+
+    def statements(self):
+        """Yields a (statement, count, key counts) tuple for each parsed signature"""
+        for stats in self.signatures.values():
+            if stats.statement is not None:
+                yield (stats.statement, stats.count, stats.keys.estimates())
+
+
+def iter_fql_queries(lines):
+    """Yields a (query, values, keyspace) tuple for each record in the output of "fqltool dump", where keyspace is the
+    keyspace of the session which executed the query (None if it had none).  Batches are returned as a single batch
+    statement."""
+    record = None
+    value_lines = None
+    def finish(record):
+        if record is None or not record["queries"]:
+            return None
+        if record["batch_type"] is not None:
+            batch_type = "" if record["batch_type"].upper() == "LOGGED" else record["batch_type"] + " "
+            return ("BEGIN {}BATCH {}; APPLY BATCH".format(batch_type, "; ".join(record["queries"])), None, record["keyspace"])
+        return (record["queries"][0], record["values"], record["keyspace"])
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = FQL_FIELD_RE.match(line)
+        if match is None:
+            if value_lines is not None:
+                if line.strip() == FQL_VALUE_SEPARATOR:
+                    if value_lines:
+                        record["values"].append("".join(value_lines))
+                    value_lines = []
+                elif line.strip():
+                    value_lines.append(line.strip())
+            continue
+        if value_lines:
+            record["values"].append("".join(value_lines))
+        value_lines = None
+        (field, value) = (match.group("field"), match.group("value").strip())
+        if field == "Type":
+            query = finish(record)
+            if query:
+                yield query
+            record = {"batch_type": None, "keyspace": None, "queries": [], "values": []}
+        elif record is None:
+            continue
+        elif field == "Keyspace":
+            record["keyspace"] = value if value and value != "null" else None
+        elif field == "Batch type":
+            record["batch_type"] = value
+        elif field == "Query":
+            record["queries"].append(value)
+        elif field == "Values":
+            value_lines = [value] if value else []
+    if value_lines:
+        record["values"].append("".join(value_lines))
+    query = finish(record)
+    if query:
+        yield query
+
+
+def iter_trace_queries(lines):
+    """Yields a (query, values, keyspace) tuple for each row of a CSV export of system_traces.sessions.  The query and
+    any bound values are taken from the parameters of the session, wherever that column appears in the row.  Sessions
+    don't record their keyspace so keyspace is always None."""
+    for row in csv.reader(lines):
+        for field in row:
+            match = TRACE_QUERY_RE.search(field)
+            if match:
+                values = [v.replace("''", "'") for v in TRACE_BOUND_VALUE_RE.findall(field)]
+                yield (match.group(1).replace("''", "'"), values or None, None)
+                break
+
+
+def iter_capture_queries(lines):
+    """Yields (query, values, keyspace) tuples from either format of capture, detected from its first line"""
+    lines = iter(lines)
+    for first in lines:
+        if not first.strip():
+            continue
+        rest = chain([first], lines)
+        return iter_fql_queries(rest) if FQL_FIELD_RE.match(first.rstrip("\r\n")) else iter_trace_queries(rest)
+    return iter([])
+
+
+def read_capture(path, key_capacity=DEFAULT_KEY_CAPACITY):
+    """Stream the capture at path into a TrafficCapture"""
+    capture = TrafficCapture(key_capacity)
+    with open(path) as f:
+        for (query, values, keyspace) in iter_capture_queries(f):
+            capture.add(query, values, keyspace)
+    log.info("Read {} queries with {} distinct signatures from {}".format(capture.queries, len(capture.signatures), path))
+    if capture.untracked:
+        log.info("{} queries with signatures beyond the first {} were ignored".format(capture.untracked, capture.max_signatures))
+    return capture
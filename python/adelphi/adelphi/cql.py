@@ -14,10 +14,49 @@
 
 
 import json
+import re
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 from adelphi.export import BaseExporter
 from adelphi.store import set_replication_factor
 
+# Statements which should only be executed if the corresponding object doesn't already exist
+IF_NOT_EXISTS_RE = re.compile(r"CREATE (TABLE|KEYSPACE|TYPE|INDEX)")
+
+# Separator between statements and keyspaces; matches KeyspaceMetadata.export_as_string()
+STATEMENT_SEPARATOR = "\n\n"
+
+
+def keyspace_statements(ks_obj):
+    """Generator returning the same CQL as KeyspaceMetadata.export_as_string() but one (formatted) statement at a
+    time.  Tables are returned along with any indexes, triggers and views defined on them."""
+    if ks_obj._exc_info or ks_obj.virtual:
+        # Keyspace is returned as a single block wrapped in a comment; let the driver handle it
+        yield ks_obj.export_as_string()
+        return
+
+    yield ks_obj.as_cql_query() + ";"
+    for udt_str in ks_obj.user_type_strings():
+        yield udt_str
+    for fn in ks_obj.functions.values():
+        yield fn.export_as_string()
+    for agg in ks_obj.aggregates.values():
+        yield agg.export_as_string()
+
+    # Make sure tables with vertex are exported before tables with edges
+    tables_with_vertex = [t for t in ks_obj.tables.values() if getattr(t, "vertex", None)]
+    other_tables = [t for t in ks_obj.tables.values() if t not in tables_with_vertex]
+    for table in tables_with_vertex + other_tables:
+        yield table.export_as_string()
+
+
+def add_if_not_exists(cql_str):
+    return IF_NOT_EXISTS_RE.sub(r"CREATE \1 IF NOT EXISTS", cql_str)
+
 
 class CqlExporter(BaseExporter):
 
@@ -28,26 +67,46 @@ class CqlExporter(BaseExporter):
 
 
     def export_all(self):
-        metadata_str = json.dumps(self.export_metadata_dict(), indent=4)
-        metadata_comments = "\n".join("//{}".format(line).strip() for line in metadata_str.splitlines())
+        out = StringIO()
+        self.write_all(out)
+        return out.getvalue()
 
-        return metadata_comments + "\n\n" + self.export_schema()
+
+    def write_all(self, out):
+        metadata_str = json.dumps(self.export_metadata_dict(), indent=4)
+        for line in metadata_str.splitlines():
+            out.write("//{}".format(line).strip())
+            out.write("\n")
+        out.write("\n")
+        self.write_schema(out)
 
 
     def export_schema(self, keyspace=None):
+        out = StringIO()
+        self.write_schema(out, keyspace)
+        return out.getvalue()
 
+
+    def write_schema(self, out, keyspace=None):
+        """Write the schema to a file-like object one statement at a time so that the full schema never has to be
+        held in memory."""
         ks_objs = [self.keyspaces[keyspace].ks_obj] if keyspace else [t.ks_obj for t in self.keyspaces.values()]
 
         set_replication_factor(ks_objs, self.props['rf'])
 
-        # TODO: shift this around to a regex so that we can do the whole thing in a single pass
-        cql_str = "\n\n".join(ks_obj.export_as_string() for ks_obj in ks_objs)
-        return cql_str.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS") \
-                      .replace("CREATE KEYSPACE", "CREATE KEYSPACE IF NOT EXISTS") \
-                      .replace("CREATE TYPE", "CREATE TYPE IF NOT EXISTS") \
-                      .replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS")
+        first = True
+        for ks_obj in ks_objs:
+            for stmt in keyspace_statements(ks_obj):
+                if not first:
+                    out.write(STATEMENT_SEPARATOR)
+                out.write(add_if_not_exists(stmt))
+                first = False
 
 
     def each_keyspace(self, ks_fn):
         for (ks_name, ks_tuple) in self.keyspaces.items():
             ks_fn(ks_tuple.ks_obj, ks_tuple.ks_id)
+
+
+    def get_keyspace(self, keyspace_name):
+        return self.keyspaces[keyspace_name].ks_obj
@@ -14,3 +14,8 @@ class TableSelectionException(SelectionException):
 
 class ExportException(Exception):
     pass
+
+
+class SchemaParseException(Exception):
+    """Exception indicating an error reading a schema from a local source"""
+    pass
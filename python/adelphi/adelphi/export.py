@@ -13,7 +13,11 @@
 # limitations under the License.
 
 import hashlib
+import json
 import logging
+import multiprocessing
+import os.path
+import sys
 from base64 import urlsafe_b64encode
 from collections import namedtuple
 from datetime import datetime, tzinfo, timedelta
@@ -23,8 +27,9 @@ try:
 except ImportError:
     from itertools import filterfalse
 
-from adelphi.anonymize import anonymize_keyspace
-from adelphi.exceptions import KeyspaceSelectionException
+from adelphi.anonymize import Anonymizer
+from adelphi.exceptions import KeyspaceSelectionException, ExportException
+from adelphi.fingerprint import build_keyspace_fingerprint
 from adelphi.store import build_keyspace_objects
 
 
@@ -44,6 +49,10 @@ except ImportError:
     utc = UTC()
 
 KsTuple = namedtuple('KsTuple',['ks_id', 'ks_obj'])
+KsWriteResult = namedtuple('KsWriteResult', ['schema_path', 'metadata_path', 'digest', 'written'])
+
+# Name of the file in the output directory recording the digest of each exported keyspace
+MANIFEST_FILE = "manifest.json"
 
 class BaseExporter:
     
@@ -84,6 +93,9 @@ class BaseExporter:
 
         log.info("Processing the following keyspaces: %s", ','.join((ks.name for ks in keyspaces)))
 
+        # Exporters share an Anonymizer (and thus a mapping of names) only if one is explicitly provided
+        anonymizer = props.get("anonymizer") or Anonymizer()
+
         # anonymize_keyspace mutates keyspace state so we must trap keyspace_id before we (possibly) call it
         ids = {ks.name : self.build_keyspace_id(ks) for ks in keyspaces}
 
@@ -93,7 +105,7 @@ class BaseExporter:
         def make_tuple(ks):
             orig_name = ks.name
             if props['anonymize']:
-                anonymize_keyspace(ks)
+                anonymizer.anonymize_keyspace(ks)
             return KsTuple(ids[orig_name], ks)
         return {t.ks_obj.name : t for t in [make_tuple(ks) for ks in keyspaces]}
 
@@ -117,11 +129,25 @@ class BaseExporter:
         return self.export_schema()
 
 
+    def write_all(self, out):
+        out.write(self.export_all())
+
+
+    def write_schema(self, out, keyspace=None):
+        out.write(self.export_schema(keyspace=keyspace))
+
+
     # Note assumption of keyspace and keyspace_id as attrs
     def each_keyspace(self, ks_fn):
         ks_fn(self.keyspace, self.keyspace_id)
 
 
+    def get_keyspace(self, keyspace_name):
+        if keyspace_name != self.keyspace.name:
+            raise ExportException("Exporter doesn't know about keyspace {}".format(keyspace_name))
+        return self.keyspace
+
+
     # Functions below assume self.metadata as a dict
     def export_metadata_dict(self):
         return {k : self.metadata[k] for k in self.metadata.keys() if self.metadata[k]}
@@ -132,3 +158,134 @@ class BaseExporter:
         need something keyspace-specific you're probably better off just adding it to the
         exported metadata directory."""
         self.metadata[k] = v
+
+
+class DigestWriter(object):
+    """File-like object computing a sha256 digest of all content written through it.  Content is passed on to out
+    if it's provided and discarded otherwise."""
+
+    def __init__(self, out=None):
+        self.out = out
+        self.digest = hashlib.sha256()
+
+
+    def write(self, s):
+        self.digest.update(s.encode("utf-8"))
+        if self.out:
+            self.out.write(s)
+
+
+def load_manifest(export_dir):
+    """Returns the manifest written by the previous export to export_dir, or an empty dict if there isn't one"""
+    manifest_path = os.path.join(export_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(export_dir, manifest):
+    with open(os.path.join(export_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+
+def merge_manifests(old_manifest, new_manifest, complete=True):
+    """Returns the manifest to save after an export which produced the entries in new_manifest.  Exports of a
+    selection of keyspaces (complete is false) carry forward the entries of old_manifest for keyspaces which weren't
+    selected, since their output is still on disk."""
+    if complete:
+        return new_manifest
+    rv = dict(old_manifest)
+    rv.update(new_manifest)
+    return rv
+
+
+def compare_manifests(old_manifest, new_manifest):
+    """Returns a tuple of the (added, changed, removed) keyspace directory names between two manifests"""
+    added = sorted(k for k in new_manifest if k not in old_manifest)
+    changed = sorted(k for k in new_manifest if k in old_manifest and new_manifest[k]["digest"] != old_manifest[k]["digest"])
+    removed = sorted(k for k in old_manifest if k not in new_manifest)
+    return (added, changed, removed)
+
+
+def write_keyspace(exporter, keyspace_name, keyspace_id, keyspace_dir, previous_digest=None):
+    """Write the schema and metadata files for a single keyspace to keyspace_dir.
+
+    The digest covers the schema and all metadata except the creation timestamp.  If it matches previous_digest and
+    both files already exist they're left untouched."""
+    schema_path = os.path.join(keyspace_dir, "schema")
+    metadata_path = os.path.join(keyspace_dir, "metadata.json")
+
+    metadata = exporter.export_metadata_dict()
+    metadata['keyspace_id'] = keyspace_id
+    metadata['schema_fingerprint'] = build_keyspace_fingerprint(exporter.get_keyspace(keyspace_name))
+    metadata_str = json.dumps({k: v for (k, v) in metadata.items() if k != "creation_timestamp"}, sort_keys=True)
+
+    def build_digest(writer):
+        exporter.write_schema(writer, keyspace=keyspace_name)
+        writer.digest.update(metadata_str.encode("utf-8"))
+        return urlsafe_b64encode(writer.digest.digest()).decode('ascii')
+
+    # Only render the schema without writing it if there's a previous export it could match
+    if previous_digest and os.path.exists(schema_path) and os.path.exists(metadata_path):
+        digest = build_digest(DigestWriter())
+        if digest == previous_digest:
+            log.info("Schema for keyspace " + keyspace_name + " is unchanged, skipping")
+            return KsWriteResult(schema_path, metadata_path, digest, False)
+
+    with open(schema_path, 'w') as schema_file:
+        log.info("Writing schema for keyspace " + keyspace_name + " to file " + schema_path)
+        digest = build_digest(DigestWriter(schema_file))
+
+    with open(metadata_path, 'w') as metadata_file:
+        log.info("Writing metadata for keyspace " + keyspace_name + " to file " + metadata_path)
+        metadata_file.write(json.dumps(metadata))
+
+    return KsWriteResult(schema_path, metadata_path, digest, True)
+
+
+# Exporter used by worker processes, set once per process by the pool initializer so that it isn't
+# re-pickled for every keyspace
+_worker_exporter = None
+
+def _init_worker(exporter):
+    global _worker_exporter
+    _worker_exporter = exporter
+
+
+def _write_keyspace_task(args):
+    return write_keyspace(_worker_exporter, *args)
+
+
+def _get_fork_context():
+    """Returns a multiprocessing context whose workers are forked, or None if forking isn't supported.  The exporter
+    holds the complete schema metadata, so handing it to workers started by spawning would pickle all of it for each
+    worker (and needs a picklable exporter)."""
+    try:
+        return multiprocessing.get_context("fork")
+    except AttributeError:
+        # Python 2 forks workers everywhere except Windows
+        return None if sys.platform == "win32" else multiprocessing
+    except ValueError:
+        return None
+
+
+def write_keyspaces(exporter, tasks, jobs=1):
+    """Write each (keyspace_name, keyspace_id, keyspace_dir, previous_digest) task in tasks.  If jobs > 1 keyspaces are rendered and
+    written by a pool of that many processes.  Results are returned in the order of tasks either way.
+
+    Workers are always forked so that they inherit the exporter rather than receiving a pickled copy; keyspaces are
+    written serially on platforms which can't fork.  Anonymization happens when the exporter is built so workers only
+    ever see the final keyspace metadata; output is identical to a serial run."""
+    context = _get_fork_context() if jobs > 1 and len(tasks) > 1 else None
+    if context is None:
+        if jobs > 1 and len(tasks) > 1:
+            log.info("Worker processes can't be forked on this platform, writing keyspaces with a single process")
+        return [write_keyspace(exporter, *task) for task in tasks]
+
+    pool = context.Pool(min(jobs, len(tasks)), _init_worker, (exporter,))
+    try:
+        return pool.map(_write_keyspace_task, tasks)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,141 @@
+# Copyright DataStax, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Structural fingerprints of keyspaces.  A fingerprint depends only on the shape of a schema (column types, key
+# layout, indexes and options) and not on the names used within it, so identical schemas from different clusters
+# (or anonymized differently) share a fingerprint while any structural change produces a new one.
+import hashlib
+import json
+import re
+from base64 import urlsafe_b64encode
+
+from adelphi.anonymize import INDEX_TARGET_RE, TYPE_IDENTIFIER_RE, unquote
+from adelphi.store import get_column_index, PARTITION_KEY, CLUSTERING
+
+# Table options which don't describe the structure of a table
+IGNORED_TABLE_OPTIONS = frozenset(["comment", "id"])
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Stands in for index targets which don't refer to a known column
+UNKNOWN_COLUMN = "unknown"
+
+
+class KeyspaceFingerprinter(object):
+    """Builds the canonical structure of a single keyspace.  UDT references are replaced by a digest of the (canonical)
+    types of their fields, which is computed once per UDT."""
+
+    def __init__(self, ks):
+        self.ks = ks
+        # Anonymization renames UDTs without updating the keys of user_types so look them up by their current name
+        self.udts = {udt.name: udt for udt in ks.user_types.values()}
+        self.udt_types = {}
+
+
+    def canonical_type(self, cql_type):
+        def replace(match):
+            name = unquote(match.group(0))
+            udt = self.udts.get(name)
+            if udt is None:
+                return match.group(0)
+            if name not in self.udt_types:
+                # Refer to UDTs by a digest of their field types so that deeply nested UDTs don't produce huge types
+                m = hashlib.sha256()
+                m.update(",".join(self.canonical_type(t) for t in udt.field_types).encode("utf-8"))
+                self.udt_types[name] = "udt:" + m.hexdigest()
+            return self.udt_types[name]
+        return WHITESPACE_RE.sub("", TYPE_IDENTIFIER_RE.sub(replace, cql_type))
+
+
+    def canonical_column_ref(self, columns, name):
+        """Refer to key columns by their position and to all other columns by their type.  Names never appear in the
+        result, even for columns which can't be found."""
+        role = columns.role(name)
+        if role is None:
+            return UNKNOWN_COLUMN
+        if role.kind in (PARTITION_KEY, CLUSTERING):
+            return "{}[{}]".format(role.kind, role.position)
+        return "{}:{}".format(role.kind, self.canonical_type(role.column.cql_type))
+
+
+    def canonical_index(self, columns, index):
+        options = dict(index.index_options)
+        target = options.pop("target", "")
+        match = INDEX_TARGET_RE.match(target)
+        if match:
+            target = "{}({})".format(match.group(1), self.canonical_column_ref(columns, unquote(match.group(2))))
+        else:
+            target = self.canonical_column_ref(columns, unquote(target))
+        return {"kind": index.kind, "target": target, "options": options}
+
+
+    def canonical_columns(self, table):
+        columns = get_column_index(table)
+        return {
+            "partition_key": [self.canonical_type(c.cql_type) for c in columns.partition_key],
+            "clustering_key": [[self.canonical_type(c.cql_type), "DESC" if c.is_reversed else "ASC"] for c in columns.clustering_key],
+            "static": sorted(self.canonical_type(c.cql_type) for c in columns.static),
+            "regular": sorted(self.canonical_type(c.cql_type) for c in columns.regular),
+            "options": {k: v for (k, v) in table.options.items() if k not in IGNORED_TABLE_OPTIONS}
+        }
+
+
+    def canonical_table(self, table):
+        canonical = self.canonical_columns(table)
+        columns = get_column_index(table)
+        canonical["indexes"] = sorted((self.canonical_index(columns, index) for index in table.indexes.values()), key=_dump)
+        canonical["triggers"] = sorted((trigger.options for trigger in table.triggers.values()), key=_dump)
+        canonical["views"] = sorted((self.canonical_view(view) for view in table.views.values()), key=_dump)
+        return canonical
+
+
+    def canonical_view(self, view):
+        canonical = self.canonical_columns(view)
+        canonical["include_all_columns"] = view.include_all_columns
+        return canonical
+
+
+    def canonical_keyspace(self):
+        ks = self.ks
+        return {
+            "replication_strategy": ks.replication_strategy.__class__.__name__ if ks.replication_strategy else None,
+            "durable_writes": ks.durable_writes,
+            "types": sorted(self.canonical_type(name) for name in self.udts),
+            "tables": sorted((self.canonical_table(table) for table in ks.tables.values()), key=_dump),
+            "functions": sorted(({
+                "argument_types": [self.canonical_type(t) for t in fn.argument_types],
+                "return_type": self.canonical_type(fn.return_type),
+                "language": fn.language,
+                "body": fn.body,
+                "called_on_null_input": fn.called_on_null_input
+            } for fn in ks.functions.values()), key=_dump),
+            "aggregates": sorted(({
+                "argument_types": [self.canonical_type(t) for t in agg.argument_types],
+                "state_type": self.canonical_type(agg.state_type),
+                "return_type": self.canonical_type(agg.return_type) if agg.return_type else None,
+                "initial_condition": agg.initial_condition
+            } for agg in ks.aggregates.values()), key=_dump)
+        }
+
+
+def _dump(obj):
+    return json.dumps(obj, sort_keys=True, default=str)
+
+
+def build_keyspace_fingerprint(ks):
+    """Returns a urlsafe base64 encoded sha256 digest of the canonical structure of keyspace ks"""
+    m = hashlib.sha256()
+    m.update(_dump(KeyspaceFingerprinter(ks).canonical_keyspace()).encode("utf-8"))
+    return urlsafe_b64encode(m.digest()).decode('ascii')
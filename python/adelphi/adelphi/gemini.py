@@ -19,7 +19,7 @@ from cassandra.cqltypes import cqltype_to_python
 
 from adelphi.exceptions import KeyspaceSelectionException, ExportException
 from adelphi.export import BaseExporter
-from adelphi.store import get_standard_columns_from_table_metadata, set_replication_factor
+from adelphi.store import get_column_index, set_replication_factor
 
 
 class GeminiExporter(BaseExporter):
@@ -67,20 +67,21 @@ class GeminiExporter(BaseExporter):
                 "indexes": []
             }
 
-            for pk in t.partition_key:
+            columns = get_column_index(t)
+
+            for pk in columns.partition_key:
                 table_data["partition_keys"].append({
                     "name": pk.name,
                     "type": pk.cql_type
                 })
 
-            for ck in t.clustering_key:
+            for ck in columns.clustering_key:
                 table_data["clustering_keys"].append({
                     "name": ck.name,
                     "type": ck.cql_type
                 })
 
-            columns = get_standard_columns_from_table_metadata(t)
-            for c in columns:
+            for c in columns.non_key:
                 table_data["columns"].append({
                     "name": c.name,
                     "type": self.__cql_type_to_gemini(cqltype_to_python(c.cql_type))
@@ -89,7 +90,7 @@ class GeminiExporter(BaseExporter):
             for index in t.indexes.values():
                 table_data["indexes"].append({
                     "name": index.name,
-                    "column": index.index_props["target"]
+                    "column": index.index_options["target"]
                 })
 
             data["tables"].append(table_data)
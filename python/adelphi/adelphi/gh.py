@@ -15,12 +15,14 @@
 
 # Functionality necessary to create a feature branch + pull request on Github
 
+import hashlib
 import logging
 import os
 import os.path
+import time
 import uuid
 
-from github import Github
+from github import Github, GithubException, InputGitTreeElement
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger('adelphi')
@@ -30,6 +32,18 @@ MAIN_BRANCH_NAME = "main"
 
 ORIGIN_REPO = "datastax/adelphi-schemas"
 
+# Mode for regular (non-executable) files in a git tree
+FILE_MODE = "100644"
+
+# Upper bound on the size of file content sent inline in a single create tree request.  Larger uploads are split
+# across several requests, each building on the tree created by the previous one.
+TREE_BATCH_MAX_BYTES = 4 * 1024 * 1024
+
+# Retry behaviour for requests rejected because of Github rate limits
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 1
+MAX_BACKOFF_SECONDS = 15 * 60
+
 def build_github(token):
     return Github(token)
 
@@ -38,21 +52,82 @@ def build_origin_repo(gh):
     return gh.get_repo(ORIGIN_REPO)
 
 
-def build_branch(gh, repo):
-    main_branch = repo.get_branch(MAIN_BRANCH_NAME)
+def build_branch(gh, repo, base_repo=None):
+    """Create a uniquely named branch in repo starting at the head of the main branch of base_repo (repo if not
+    specified).  A fork shares git objects with its origin so branches in the fork can start from the origin."""
+    main_branch = (base_repo or repo).get_branch(MAIN_BRANCH_NAME)
     branch_name = "_".join([gh.get_user().login, str(uuid.uuid4())])
     repo.create_git_ref(ref="refs/heads/" + branch_name, sha=main_branch.commit.sha)
     return branch_name
 
 
-def commit_schemas(gh, repo, output_dir, branch_name):
+def get_changed_keyspaces(gh, repo, output_dir):
+    """Returns the sorted IDs of keyspaces in output_dir whose schema isn't already in the user's directory on the
+    main branch of repo.  Contributions are merged into the origin repository rather than the user's fork (which is
+    only updated if the user syncs it) so repo should be the origin.  Files are compared using git blob SHAs so no
+    file content is downloaded.
+
+    Metadata files include a creation timestamp and so always differ; a keyspace is only considered changed if its
+    schema file is new or different."""
     curr_user_name = gh.get_user().login
-    for keyspace_id in os.listdir(output_dir):
-        keyspace_dir = os.path.join(output_dir, keyspace_id)
-        for keyspace_file_name in os.listdir(keyspace_dir):
-            repo_path = "/".join([curr_user_name, keyspace_id, keyspace_file_name])
-            keyspace_file = os.path.join(output_dir, keyspace_id, keyspace_file_name)
-            repo.create_file(path=repo_path, message=_get_keyspace_file_msg(keyspace_id, keyspace_file_name), content=open(keyspace_file).read(), branch=branch_name)
+    local_shas = {keyspace_id: git_blob_sha(content) for (keyspace_id, keyspace_file_name, content) in _keyspace_files(output_dir)
+                  if keyspace_file_name == "schema"}
+
+    head_sha = with_backoff(repo.get_branch, MAIN_BRANCH_NAME).commit.sha
+    user_entries = [e for e in with_backoff(repo.get_git_tree, head_sha).tree if e.path == curr_user_name and e.type == "tree"]
+    remote_shas = _get_schema_shas(repo, user_entries[0].sha) if user_entries else {}
+
+    changed = sorted(keyspace_id for (keyspace_id, sha) in local_shas.items() if remote_shas.get(keyspace_id) != sha)
+    log.info("{} of {} keyspaces are new or changed".format(len(changed), len(local_shas)))
+    return changed
+
+
+def git_blob_sha(content):
+    """Returns the SHA git would assign to a blob containing content"""
+    data = content.encode("utf-8")
+    m = hashlib.sha1()
+    m.update("blob {}\0".format(len(data)).encode("utf-8"))
+    m.update(data)
+    return m.hexdigest()
+
+
+def commit_schemas(gh, repo, output_dir, branch_name, keyspace_ids=None):
+    """Commit all schemas in output_dir (or only those for keyspace_ids if specified) to branch_name as a single commit.
+
+    File contents are sent inline when building the git tree so the number of requests doesn't depend on the number
+    of keyspaces; requests are made one at a time as Github recommends for requests which create content."""
+    curr_user_name = gh.get_user().login
+    files = [("/".join([curr_user_name, keyspace_id, keyspace_file_name]), content)
+             for (keyspace_id, keyspace_file_name, content) in _keyspace_files(output_dir)
+             if keyspace_ids is None or keyspace_id in keyspace_ids]
+    if not files:
+        log.info("No schemas found in {}, nothing to commit".format(output_dir))
+        return None
+
+    parent = with_backoff(repo.get_git_commit, with_backoff(repo.get_branch, branch_name).commit.sha)
+    tree = parent.tree
+    for batch in _batch_files(files):
+        elements = [InputGitTreeElement(path=repo_path, mode=FILE_MODE, type="blob", content=content) for (repo_path, content) in batch]
+        tree = with_backoff(repo.create_git_tree, elements, tree)
+
+    keyspace_count = len(set(repo_path.split("/")[1] for (repo_path, _) in files))
+    log.info("Committing {} files for {} keyspaces to branch {}".format(len(files), keyspace_count, branch_name))
+    commit = with_backoff(repo.create_git_commit, _get_commit_msg(curr_user_name, keyspace_count), tree, [parent])
+    with_backoff(repo.get_git_ref("heads/" + branch_name).edit, commit.sha)
+    return commit
+
+
+def with_backoff(fn, *args, **kwargs):
+    """Call fn, retrying with a delay if Github rejects the request because of a rate limit"""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return fn(*args, **kwargs)
+        except GithubException as exc:
+            delay = _get_rate_limit_delay(exc, attempt)
+            if delay is None or attempt == MAX_ATTEMPTS:
+                raise
+            log.info("Github rate limit reached, retrying in {} seconds".format(delay))
+            time.sleep(delay)
 
 
 def build_pull_request(gh, origin_repo, branch_name):
@@ -61,6 +136,66 @@ def build_pull_request(gh, origin_repo, branch_name):
     origin_repo.create_pull(title = title_str, body = title_str, base = MAIN_BRANCH_NAME, head = ":".join([curr_user_name, branch_name]))
 
 
-def _get_keyspace_file_msg(keyspace_id, keyspace_file_name):
-    file_desc = "Schema" if keyspace_file_name == "schema" else "Metadata"
-    return "{} for keyspace with ID {}".format(file_desc, keyspace_id)
+
+def _get_schema_shas(repo, user_tree_sha):
+    """Returns a dict of keyspace ID to the blob SHA of its schema file for the user tree with SHA user_tree_sha.
+
+    A single recursive request is used where possible.  Github truncates recursive listings of very large trees; in
+    that case each keyspace tree is fetched individually."""
+    user_tree = with_backoff(repo.get_git_tree, user_tree_sha, recursive=True)
+    if not user_tree.raw_data.get("truncated", False):
+        return {e.path.split("/")[0]: e.sha for e in user_tree.tree if e.type == "blob" and e.path.endswith("/schema")}
+
+    log.info("Recursive listing of existing schemas was truncated, listing keyspaces individually")
+    user_tree = with_backoff(repo.get_git_tree, user_tree_sha)
+    rv = {}
+    for keyspace_entry in (e for e in user_tree.tree if e.type == "tree"):
+        keyspace_tree = with_backoff(repo.get_git_tree, keyspace_entry.sha)
+        rv.update({keyspace_entry.path: e.sha for e in keyspace_tree.tree if e.type == "blob" and e.path == "schema"})
+    return rv
+
+
+def _keyspace_files(output_dir):
+    """Generator returning a (keyspace ID, file name, content) tuple for each file in a keyspace directory in output_dir"""
+    for keyspace_id in sorted(os.listdir(output_dir)):
+        keyspace_dir = os.path.join(output_dir, keyspace_id)
+        # Skip anything that isn't a keyspace directory (such as the export manifest)
+        if not os.path.isdir(keyspace_dir):
+            continue
+        for keyspace_file_name in sorted(os.listdir(keyspace_dir)):
+            with open(os.path.join(keyspace_dir, keyspace_file_name)) as keyspace_file:
+                yield (keyspace_id, keyspace_file_name, keyspace_file.read())
+
+
+def _batch_files(files):
+    batch = []
+    batch_bytes = 0
+    for (repo_path, content) in files:
+        if batch and batch_bytes + len(content) > TREE_BATCH_MAX_BYTES:
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append((repo_path, content))
+        batch_bytes += len(content)
+    if batch:
+        yield batch
+
+
+def _get_rate_limit_delay(exc, attempt):
+    """Returns the number of seconds to wait before retrying a request which failed with exc, or None if the failure
+    wasn't caused by a rate limit"""
+    if exc.status not in (403, 429):
+        return None
+    headers = {k.lower(): v for (k, v) in (getattr(exc, "headers", None) or {}).items()}
+    if "retry-after" in headers:
+        return min(int(headers["retry-after"]), MAX_BACKOFF_SECONDS)
+    if headers.get("x-ratelimit-remaining") == "0" and "x-ratelimit-reset" in headers:
+        return min(max(int(headers["x-ratelimit-reset"]) - int(time.time()), 1), MAX_BACKOFF_SECONDS)
+    # Secondary rate limits don't always include headers describing when to retry
+    if exc.status == 429 or "rate limit" in str(exc.data).lower():
+        return min(BACKOFF_BASE_SECONDS * (2 ** (attempt - 1)), MAX_BACKOFF_SECONDS)
+    return None
+
+
+def _get_commit_msg(curr_user_name, keyspace_count):
+    return "Schemas for {} keyspaces from user {}".format(keyspace_count, curr_user_name)
@@ -1,15 +1,81 @@
 import logging
+import re
 import yaml
 
+from collections import namedtuple
 from itertools import chain
+from math import ceil
 
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
+
+from adelphi.anonymize import INDEX_TARGET_RE, quote_str, unquote
+from adelphi.capture import SELECT, INSERT, UPDATE, LOGGED, estimate_zipf_exponent, read_capture
 from adelphi.exceptions import KeyspaceSelectionException, TableSelectionException, ExportException
 from adelphi.export import BaseExporter
+from adelphi.profile import sample_table
+from adelphi.store import get_column_index, get_session, fetch_table_traffic
 
 MAX_NUMERIC_VAL = 1000 ** 3
 RAMPUP_SCENARIO = "run driver=cql tags=phase:rampup cycles={} threads=auto"
 MAIN_SCENARIO = "run driver=cql tags=phase:main cycles={} threads=auto"
 
+# Rampup statements for wide partitions rely on each statement receiving a contiguous run of cycles
+CONCAT_SEQUENCER = " seq=concat"
+
+# Capacity search scenarios run the main phase in steps of increasing load, either increasing the target rate (with
+# each step lasting RATE_STEP_SECONDS) or the number of threads.  Each step adds RATE_STEP_PER_HOST ops/s or
+# THREADS_STEP_PER_HOST threads for every host in the cluster.
+CAPACITY_SCENARIO = "capacity"
+CAPACITY_RATE = "rate"
+CAPACITY_THREADS = "threads"
+CAPACITY_MODES = [CAPACITY_RATE, CAPACITY_THREADS]
+DEFAULT_CAPACITY_STEPS = 10
+RATE_STEP_PER_HOST = 1000
+RATE_STEP_SECONDS = 60
+THREADS_STEP_PER_HOST = 8
+CAPACITY_STEP_SCENARIO = "run driver=cql tags=phase:main cycles={} threads={} alias=step{}"
+
+# Schema churn scenarios repeatedly create tables modelled on each exported table, add columns to and create indexes
+# on the new tables, alter a UDT and finally drop the new tables again.  DDL statements are executed by a single thread
+# so that each one completes (including schema agreement) before the next is issued, and in order so that every table
+# is created before it's altered or dropped.  Each round of the churn phase creates tables in slots numbered from 0 to
+# the weight of create-table, and every other statement of the round targets the tables created in that round.
+CHURN_SCENARIO = "churn"
+CHURN_SETUP_SCENARIO = "run driver=cql tags=phase:churn-setup cycles=1 threads=1"
+CHURN_DDL_SCENARIO = "run driver=cql tags=phase:churn-ddl cycles={} threads=1" + CONCAT_SEQUENCER
+CREATE_TABLE_CHURN = "create-table"
+ADD_COLUMN_CHURN = "add-column"
+CREATE_INDEX_CHURN = "create-index"
+ALTER_TYPE_CHURN = "alter-type"
+DROP_TABLE_CHURN = "drop-table"
+CHURN_SHAPES = [CREATE_TABLE_CHURN, ADD_COLUMN_CHURN, CREATE_INDEX_CHURN, ALTER_TYPE_CHURN, DROP_TABLE_CHURN]
+DEFAULT_CHURN_MIX = {CREATE_TABLE_CHURN: 4, ADD_COLUMN_CHURN: 4, CREATE_INDEX_CHURN: 1, ALTER_TYPE_CHURN: 1, DROP_TABLE_CHURN: 4}
+DEFAULT_CHURN_CYCLES = 100
+CHURN_TYPE = "churn_type"
+
+# Ratio of each main phase block for a table with a weight of 1
+DEFAULT_RATIO = 5
+
+# Sum of the ratios of all main phase blocks when ratios are derived from sampled traffic
+SAMPLED_RATIO_TOTAL = 1000
+
+# Sum of the weights of the read (or write) shapes of a table when they're derived from captured traffic
+CAPTURED_MIX_TOTAL = 20
+
+# Sum the weights of the read (and write) shapes of every table are scaled to, so that ratios only need to be scaled by
+# this total to be divided between the shapes of any table.  Totals of common mixes (including CAPTURED_MIX_TOTAL)
+# divide it, so those mixes are reproduced exactly.
+SHAPE_WEIGHT_TOTAL = 120
+
+# Captured key accesses fitting a zipf distribution with a lower exponent than this are treated as uniform
+MIN_CAPTURED_ZIPF_EXPONENT = 0.2
+
+# Maximum number of distinct partition sizes used to approximate a range of rows per partition
+MAX_PARTITION_WIDTHS = 4
+
 CQL_TYPES={}
 CQL_TYPES["text"] = "Mod({}); ToString() -> String"
 CQL_TYPES["ascii"] = "Mod({}); ToString() -> String"
@@ -31,51 +97,575 @@ CQL_TYPES["uuid"] = "Mod({}); ToHashedUUID() -> java.util.UUID"
 CQL_TYPES["timeuuid"] = "Mod({}); ToTimeUUIDMax() -> java.util.UUID"
 CQL_TYPES["inet"] = "Mod({}); ToInetAddress() -> java.net.InetAddress"
 
+# Bindings generating values of a given length for variable-length types, used when a data profile is available
+SIZED_CQL_TYPES={}
+SIZED_CQL_TYPES["text"] = "AlphaNumericString({}) -> String"
+SIZED_CQL_TYPES["ascii"] = "AlphaNumericString({}) -> String"
+SIZED_CQL_TYPES["varchar"] = "AlphaNumericString({}) -> String"
+SIZED_CQL_TYPES["blob"] = "ByteBufferSizedHashed({}) -> java.nio.ByteBuffer"
+
+# Distributions of the keys accessed by main phase statements.  The uniform distribution is the default for tables
+# without a configured distribution.
+UNIFORM = "uniform"
+ZIPF = "zipf"
+HOTSPOT = "hotspot"
+LATEST = "latest"
+DEFAULT_ZIPF_EXPONENT = 0.99
+
+KeyDistribution = namedtuple('KeyDistribution', ['name', 'args'])
+
+# Main phase settings derived from captured traffic.  traffic is a dict of table name to (reads, writes) counts,
+# read_mixes and write_mixes are dicts of table name to a dict of shape weights and key_distributions is a dict of
+# table name to the KeyDistribution fitted to the keys accessed.
+CaptureSummary = namedtuple('CaptureSummary', ['traffic', 'read_mixes', 'write_mixes', 'key_distributions'])
+
+# Shapes of the reads performed by the main phase.  Point reads select a single row by its full primary key.  Reads
+# of a whole partition, slices of a partition (limited to RANGE_LIMIT rows) and reads paging through a partition
+# (PAGE_SIZE rows at a time) are only generated for tables with clustering columns.  Index reads select rows by the
+# value of each column with a secondary index.
+POINT_READ = "point"
+PARTITION_READ = "partition"
+RANGE_READ = "range"
+PAGED_READ = "paged"
+INDEX_READ = "index"
+READ_SHAPES = [POINT_READ, PARTITION_READ, RANGE_READ, PAGED_READ, INDEX_READ]
+CLUSTERED_READ_SHAPES = frozenset([PARTITION_READ, RANGE_READ, PAGED_READ])
+RANGE_LIMIT = 10
+PAGE_SIZE = 10
+
+# Shapes of the writes performed by the main phase.  Inserts write every column of a row, optionally with a TTL of
+# WRITE_TTL seconds.  Updates and deletes write (or delete) a single regular column of a row, while appends add
+# elements to a regular list, set or map column.  Range deletes remove a slice of a partition while batches insert
+# BATCH_SIZE rows into a single partition; all three are only generated for tables with clustering columns.
+INSERT_WRITE = "insert"
+TTL_WRITE = "ttl"
+UPDATE_WRITE = "update"
+APPEND_WRITE = "append"
+DELETE_WRITE = "delete"
+RANGE_DELETE_WRITE = "range-delete"
+BATCH_WRITE = "batch"
+LOGGED_BATCH_WRITE = "logged-batch"
+WRITE_SHAPES = [INSERT_WRITE, TTL_WRITE, UPDATE_WRITE, APPEND_WRITE, DELETE_WRITE, RANGE_DELETE_WRITE, BATCH_WRITE, LOGGED_BATCH_WRITE]
+CLUSTERED_WRITE_SHAPES = frozenset([RANGE_DELETE_WRITE, BATCH_WRITE, LOGGED_BATCH_WRITE])
+COLUMN_WRITE_SHAPES = frozenset([UPDATE_WRITE, DELETE_WRITE])
+WRITE_TTL = 3600
+BATCH_SIZE = 5
+
+# Functions rendering the elements of collections, tuples and UDTs as JSON along with whether the rendered value must
+# be quoted.  Types without an entry here (such as blob, inet, date and time) can't be part of a composite binding.
+JSON_ELEMENTS={}
+JSON_ELEMENTS["text"] = ("ToString()", True)
+JSON_ELEMENTS["ascii"] = ("ToString()", True)
+JSON_ELEMENTS["varchar"] = ("ToString()", True)
+JSON_ELEMENTS["int"] = ("ToInt()", False)
+JSON_ELEMENTS["tinyint"] = ("ToByte()", False)
+JSON_ELEMENTS["smallint"] = ("ToShort()", False)
+JSON_ELEMENTS["bigint"] = ("ToString()", False)
+JSON_ELEMENTS["varint"] = ("ToString()", False)
+JSON_ELEMENTS["float"] = ("ToFloat()", False)
+JSON_ELEMENTS["double"] = ("ToDouble()", False)
+JSON_ELEMENTS["decimal"] = ("ToDouble()", False)
+JSON_ELEMENTS["boolean"] = ("ToBoolean()", False)
+JSON_ELEMENTS["timestamp"] = ("ToString()", False)
+JSON_ELEMENTS["uuid"] = ("ToHashedUUID()", True)
+JSON_ELEMENTS["timeuuid"] = ("ToTimeUUIDMax()", True)
+
+# Number of elements in each generated list, set and map
+DEFAULT_COLLECTION_SIZE = 5
+
+# The libyaml emitter (when available) is several times faster than the pure Python one and produces the same output
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Composite values are bound with fromJson(), which was added in Cassandra 2.2
+JSON_MIN_VERSION = (2, 2)
+RELEASE_VERSION_RE = re.compile(r"^(\d+)\.(\d+)")
+
 log = logging.getLogger('adelphi')
 
 # A collection of functionally static functions
-def dist_binding_name(col):
-    return "{}_dist".format(col.name)
+def dist_binding_name(col, prefix=""):
+    return "{}{}_dist".format(prefix, col.name)
+
+
+def seq_binding_name(col, prefix="", suffix=""):
+    return "{}{}_seq{}".format(prefix, col.name, suffix)
 
 
-def seq_binding_name(col):
-    return "{}_seq".format(col.name)
+def batch_binding_name(col, idx, prefix=""):
+    return "{}{}_batch{}".format(prefix, col.name, idx)
 
 
-def quote_str(s):
-    return "\"{}\"".format(s)
+def is_supported_type(col, types=CQL_TYPES):
+    """Returns true if we have the ability to create a distribution or sequence for this column type, false otherwise.
+    types can include composite types in addition to the scalar types in CQL_TYPES."""
+    return col.cql_type in types
 
 
-def is_supported_type(col):
-    """Returns true if we have the ability to create a distribution or sequence for this column type, false otherwise"""
-    return col.cql_type in CQL_TYPES
+def is_appendable_type(col):
+    """Elements can only be appended to collections which aren't frozen"""
+    return split_type(col.cql_type)[0] in ("list", "set", "map")
+
+
+def is_composite_type(col):
+    """Composite values are bound as JSON strings"""
+    return col.cql_type not in CQL_TYPES
+
+
+def bind_marker(col, binding):
+    marker = "{" + binding + "}"
+    return "fromJson({})".format(marker) if is_composite_type(col) else marker
+
+
+def split_type(cql_type):
+    """Split a type such as "map<int, frozen<list<text>>>" into its name and a list of its (top-level) parameters"""
+    cql_type = cql_type.strip()
+    if "<" not in cql_type:
+        return (cql_type, [])
+    start = cql_type.index("<")
+    (args, depth, arg_start) = ([], 0, start + 1)
+    for idx in range(start + 1, cql_type.rindex(">")):
+        c = cql_type[idx]
+        if c == "<":
+            depth += 1
+        elif c == ">":
+            depth -= 1
+        elif c == "," and depth == 0:
+            args.append(cql_type[arg_start:idx].strip())
+            arg_start = idx + 1
+    args.append(cql_type[arg_start:cql_type.rindex(">")].strip())
+    return (cql_type[:start].strip(), args)
+
+
+def build_json_template(cql_type, udts, size=DEFAULT_COLLECTION_SIZE):
+    """Returns a (template, functions) pair rendering a value of cql_type as JSON, where each "{}" in template is
+    replaced by the value of the corresponding function.  Collections contain size elements.  udts is a dict of UDT
+    name to UserType.  Returns None if the type (or any type it contains) isn't supported."""
+    (name, args) = split_type(cql_type)
+    if name == "frozen":
+        return build_json_template(args[0], udts, size)
+    if name in JSON_ELEMENTS and not args:
+        (function, quoted) = JSON_ELEMENTS[name]
+        return ('"{}"' if quoted else "{}", [function])
+    if name in ("list", "set", "map", "tuple"):
+        parts = [build_json_template(arg, udts, size) for arg in args]
+    elif name in udts and not args:
+        parts = [build_json_template(field_type, udts, size) for field_type in udts[name].field_types]
+    else:
+        return None
+    if None in parts:
+        return None
+
+    if name in ("list", "set"):
+        (template, functions) = parts[0]
+        return ("[" + ",".join([template] * size) + "]", functions * size)
+    if name == "map":
+        ((key_template, key_functions), (value_template, value_functions)) = parts
+        # JSON keys must be strings so only scalar keys are supported
+        if len(key_functions) > 1:
+            return None
+        entry = ('"{}"' if key_template == "{}" else key_template) + ":" + value_template
+        return ("{" + ",".join([entry] * size) + "}", (key_functions + value_functions) * size)
+    functions = list(chain.from_iterable(functions for (_, functions) in parts))
+    if name == "tuple":
+        return ("[" + ",".join(template for (template, _) in parts) + "]", functions)
+    fields = ['"{}":{}'.format(field_name, template) for (field_name, (template, _)) in zip(udts[name].field_names, parts)]
+    return ("{" + ",".join(fields) + "}", functions)
+
+
+def build_composite_types(tables, udts, size=DEFAULT_COLLECTION_SIZE):
+    """Returns a dict of composite type to binding definitions (in the form of CQL_TYPES) for every column of tables
+    with a supported composite type"""
+    rv = {}
+    for table in tables:
+        for col in table.columns.values():
+            if col.cql_type in CQL_TYPES or col.cql_type in rv:
+                continue
+            json = build_json_template(col.cql_type, udts, size)
+            if json is not None:
+                (template, functions) = json
+                # Braces in the template have to survive formatting with the cardinality
+                template = template.replace("{", "{{").replace("}", "}}")
+                rv[col.cql_type] = "Mod({{}}); Template('{}', {}) -> String".format(template, ", ".join(functions))
+    return rv
+
+
+def supports_json(cassandra_versions):
+    """Returns true if every release version in cassandra_versions (a comma-separated string as found in the export
+    metadata) supports fromJson().  Versions which can't be parsed, including the empty string reported for offline
+    schemas, are assumed to support it."""
+    for version in cassandra_versions.split(","):
+        match = RELEASE_VERSION_RE.match(version.strip())
+        if match and tuple(int(g) for g in match.groups()) < JSON_MIN_VERSION:
+            return False
+    return True
 
 
 def partition_cols(table):
-    pk_set = set([c.name for c in table.primary_key])
-    plain_cols = [c for c in table.columns.values() if c.name not in pk_set]
-    return (table.primary_key, plain_cols)
+    columns = get_column_index(table)
+    return (columns.primary_key, columns.non_key)
+
 
+def build_key_conditions(keys, prefix=""):
+    return " and ".join(["{} = {}".format(quote_str(key.name), bind_marker(key, dist_binding_name(key, prefix))) for key in keys])
 
-def build_select_statements(keyspace, table):
+
+def build_select_statements(keyspace, table, prefix=""):
     # Note that we don't need to worry about supported types here.  We're only selecting based on
     # primary keys cols and elsewhere we've already validated that these cols are all of a supported
     # type.
-    key_bindings = " and ".join(["{} = {}".format(quote_str(key.name), "{" + dist_binding_name(key) + "}") for key in table.primary_key])
+    key_bindings = build_key_conditions(get_column_index(table).primary_key, prefix)
+    return "select * from  {}.{} where {}".format(quote_str(keyspace.name), quote_str(table.name), key_bindings)
+
+
+def build_partition_select_statements(keyspace, table, prefix=""):
+    key_bindings = build_key_conditions(get_column_index(table).partition_key, prefix)
     return "select * from  {}.{} where {}".format(quote_str(keyspace.name), quote_str(table.name), key_bindings)
 
 
-def build_insert_statements(keyspace, table):
+def build_range_select_statements(keyspace, table, prefix="", limit=RANGE_LIMIT):
+    # Select a slice of a single partition starting at a random value of the first clustering column
+    first = get_column_index(table).clustering_key[0]
+    return "{} and {} >= {} limit {}".format(build_partition_select_statements(keyspace, table, prefix), quote_str(first.name),
+                                             bind_marker(first, dist_binding_name(first, prefix)), limit)
+
+
+def build_index_select_statements(keyspace, table, col, prefix=""):
+    return "select * from  {}.{} where {} = {}".format(quote_str(keyspace.name), quote_str(table.name), quote_str(col.name),
+                                                      "{" + dist_binding_name(col, prefix) + "}")
+
+
+def indexed_columns(table):
+    """Returns a list of (index, column) pairs for each secondary index of table which can be queried by the value of a
+    column we can generate values for.  Custom indexes and indexes on the keys, values or entries of collections are
+    skipped."""
+    rv = []
+    for index in sorted(table.indexes.values(), key=lambda i: i.name):
+        target = index.index_options.get("target", "")
+        if index.kind == "CUSTOM" or INDEX_TARGET_RE.match(target):
+            continue
+        col = table.columns.get(unquote(target))
+        if col is not None and is_supported_type(col):
+            rv.append((index, col))
+    return rv
+
+
+def build_update_statements(keyspace, table, col, prefix=""):
+    key_bindings = build_key_conditions(get_column_index(table).primary_key, prefix)
+    return "update {}.{} set {} = {} where {}".format(quote_str(keyspace.name), quote_str(table.name), quote_str(col.name),
+                                                      bind_marker(col, dist_binding_name(col, prefix)), key_bindings)
+
+
+def build_append_statements(keyspace, table, col, prefix=""):
+    key_bindings = build_key_conditions(get_column_index(table).primary_key, prefix)
+    return "update {}.{} set {} = {} + {} where {}".format(quote_str(keyspace.name), quote_str(table.name), quote_str(col.name),
+                                                           quote_str(col.name), bind_marker(col, dist_binding_name(col, prefix)), key_bindings)
+
+
+def build_delete_statements(keyspace, table, col, prefix=""):
+    key_bindings = build_key_conditions(get_column_index(table).primary_key, prefix)
+    return "delete {} from {}.{} where {}".format(quote_str(col.name), quote_str(keyspace.name), quote_str(table.name), key_bindings)
+
+
+def build_range_delete_statements(keyspace, table, prefix=""):
+    # Delete a slice of a single partition starting at a random value of the first clustering column
+    columns = get_column_index(table)
+    first = columns.clustering_key[0]
+    return "delete from {}.{} where {} and {} >= {}".format(quote_str(keyspace.name), quote_str(table.name),
+                                                           build_key_conditions(columns.partition_key, prefix),
+                                                           quote_str(first.name), bind_marker(first, dist_binding_name(first, prefix)))
+
+
+def churn_table_name(idx, shape, prefix=""):
+    # Tables are named by the position of the exported table rather than its name to stay within the length limit
+    return "churn_{}_{{churn_round}}_{{{}}}".format(idx, churn_slot_binding_name(shape, prefix))
+
+
+def churn_slot_binding_name(shape, prefix=""):
+    return "{}churn_{}_slot".format(prefix, shape.replace("-", "_"))
+
+
+def churn_index_column(table):
+    """Returns the column indexed by the create-index statements of schema churn: the first regular column which
+    isn't a collection, tuple or UDT, or failing that the first clustering column.  Returns None if there's neither."""
+    columns = get_column_index(table)
+    for col in columns.regular:
+        if not is_composite_type(col) and col.cql_type != "counter":
+            return col
+    return columns.clustering_key[0] if columns.clustering_key else None
+
+
+def churn_column_type(table):
+    """Tables can't mix counter and non-counter regular columns, so columns added to copies of counter tables are
+    counters as well"""
+    return "counter" if any(col.cql_type == "counter" for col in get_column_index(table).regular) else "int"
+
+
+def build_create_table_statements(keyspace, table, name):
+    # Column types are copied as is, so UDTs resolve to the types of the exported keyspace
+    columns = get_column_index(table)
+    cols = ",".join("{} {}{}".format(quote_str(col.name), col.cql_type, " static" if col.is_static else "") for col in table.columns.values())
+    key = ",".join(["({})".format(",".join(quote_str(col.name) for col in columns.partition_key))] +
+                   [quote_str(col.name) for col in columns.clustering_key])
+    return "create table if not exists {}.{} ({},primary key ({}))".format(quote_str(keyspace.name), name, cols, key)
+
+
+def build_batch_statements(keyspace, table, prefix="", logged=False, size=BATCH_SIZE, types=CQL_TYPES):
+    # Every insert in the batch targets the same partition but uses a different binding for the first clustering column
+    first = get_column_index(table).clustering_key[0]
+    def key_binding(idx):
+        return lambda col: batch_binding_name(col, idx, prefix) if col.name == first.name else dist_binding_name(col, prefix)
+    inserts = " ".join("{};".format(build_insert_statements(keyspace, table, prefix, key_binding(idx), types=types)) for idx in range(size))
+    return "begin {}batch {} apply batch".format("" if logged else "unlogged ", inserts)
+
+
+def build_insert_statements(keyspace, table, prefix="", key_binding=None, ttl=None, types=CQL_TYPES):
     # Note that both the sequence of column names and column bindings are built off of
     # the same base sequence (cols below) in order to make sure column names and binding
     # names line up in the generated CQL.  Order is pretty important here.
-    cols = [c for c in table.columns.values() if is_supported_type(c)]
-    primary_keys = set([c.name for c in table.primary_key])
+    #
+    # Primary key columns use sequence bindings unless key_binding (a function of a column
+    # returning a binding name) is specified.
+    cols = [c for c in table.columns.values() if is_supported_type(c, types)]
+    columns = get_column_index(table)
     col_names = ",".join([quote_str(col.name) for col in cols])
+    key_binding = key_binding or (lambda col: seq_binding_name(col, prefix))
     def binding_name(col):
-        return seq_binding_name(col) if col.name in primary_keys else dist_binding_name(col)
-    col_bindings = ",".join(["{" + binding_name(c) + "}" for c in cols])
-    return "insert into {}.{} ({}) values ({})".format(quote_str(keyspace.name), quote_str(table.name), col_names, col_bindings)
+        return key_binding(col) if columns.is_primary_key(col.name) else dist_binding_name(col, prefix)
+    col_bindings = ",".join([bind_marker(c, binding_name(c)) for c in cols])
+    stmt = "insert into {}.{} ({}) values ({})".format(quote_str(keyspace.name), quote_str(table.name), col_names, col_bindings)
+    return stmt + " using ttl {}".format(ttl) if ttl else stmt
+
+
+def build_sized_values(cql_type, lengths):
+    """Build a binding generating values of cql_type (one of SIZED_CQL_TYPES) with lengths drawn from lengths, a list
+    of (length, weight) pairs"""
+    if len(lengths) == 1:
+        return SIZED_CQL_TYPES[cql_type].format(lengths[0][0])
+    (function, return_type) = SIZED_CQL_TYPES[cql_type].split(" -> ")
+    choices = ", ".join("{}, {}".format(weight, function.format(length)) for (length, weight) in lengths)
+    return "WeightedFuncs({}) -> {}".format(choices, return_type)
+
+
+def build_dist(cql_type, numeric_max, profile=None, types=CQL_TYPES):
+    """Build a distribution binding for a column of type cql_type.  If profile (an adelphi.profile.ColumnProfile) is
+    provided values are drawn from the cardinality observed in the sample, and variable-length values are generated
+    with lengths following the observed length histogram."""
+    cardinality = numeric_max
+    if profile is not None and profile.count > 0 and not profile.is_unique():
+        cardinality = profile.cardinality
+    lengths = profile.length_weights() if profile is not None else []
+    if lengths and cql_type in SIZED_CQL_TYPES:
+        return "Hash(); Mod({}); {}".format(cardinality, build_sized_values(cql_type, lengths))
+    return "Hash(); {}".format(types[cql_type].format(cardinality))
+
+
+def parse_key_distribution(spec):
+    """Parse a key distribution specified as one of "uniform", "zipf[:exponent]", "latest[:exponent]" or
+    "hotspot:ops:keys" (ops percent of operations accessing keys percent of the keys).  Raises ValueError if the
+    specification is invalid."""
+    parts = spec.split(":")
+    (name, args) = (parts[0], parts[1:])
+    if name == UNIFORM and not args:
+        return KeyDistribution(UNIFORM, ())
+    if name in (ZIPF, LATEST) and len(args) <= 1:
+        exponent = float(args[0]) if args else DEFAULT_ZIPF_EXPONENT
+        if exponent <= 0:
+            raise ValueError("Exponent of {} distribution must be positive".format(name))
+        return KeyDistribution(name, (exponent,))
+    if name == HOTSPOT and len(args) == 2:
+        (ops, keys) = (int(args[0]), int(args[1]))
+        if not (0 < ops < 100 and 0 < keys < 100):
+            raise ValueError("Percentages of a hotspot distribution must be between 1 and 99")
+        return KeyDistribution(HOTSPOT, (ops, keys))
+    raise ValueError("Unknown key distribution {}".format(spec))
+
+
+def build_hotspot_curve(ops, keys, count):
+    """Points of an interpolation curve mapping ops percent of the unit interval onto keys percent of count values
+    (and the rest of the unit interval onto the remaining values).  Points are evenly spaced so the curve uses as
+    many points as are required to place the hotspot boundary exactly."""
+    steps = 100 // gcd(ops, 100)
+    (hot_ops, hot_keys) = (ops / 100.0, keys / 100.0)
+    def value(fraction):
+        if fraction <= hot_ops:
+            return fraction / hot_ops * hot_keys
+        return hot_keys + (fraction - hot_ops) / (1 - hot_ops) * (1 - hot_keys)
+    return [round(value(i / float(steps)) * (count - 1), 1) for i in range(steps + 1)]
+
+
+def build_key_dist(cql_type, count, distribution, stride=1, offset=0, types=CQL_TYPES):
+    """Build a distribution binding selecting one of count keys according to distribution, an instance of
+    KeyDistribution.  Keys are the values offset, offset + stride, offset + 2 * stride and so on.  Zipf and latest
+    distributions favour the lowest and highest keys (the first and last written during rampup) respectively."""
+    if distribution.name == ZIPF:
+        rv = "Zipf({}, {}); Add(-1); ".format(count, distribution.args[0])
+    elif distribution.name == LATEST:
+        rv = "Zipf({}, {}); Mul(-1); Add({}); ".format(count, distribution.args[0], count)
+    elif distribution.name == HOTSPOT:
+        curve = ",".join(str(v) for v in build_hotspot_curve(distribution.args[0], distribution.args[1], count))
+        rv = "Hash(); Interpolate({}); ".format(curve)
+    elif stride == 1 and not offset:
+        return build_dist(cql_type, count, types=types)
+    else:
+        rv = "Hash(); Mod({}); ".format(count)
+    if stride > 1:
+        rv += "Mul({}); ".format(stride)
+    if offset:
+        rv += "Add({}); ".format(offset)
+    return rv + types[cql_type].format(count * stride)
+
+
+def build_table_ratios(table_names, weights=None, traffic=None):
+    """Returns a dict of table name to the (read, write) ratios used for the main phase blocks of that table.
+
+    If traffic (a dict of table name to (reads, writes) counts sampled from the cluster) is provided ratios are
+    proportional to the observed share of each table, scaled to a total of SAMPLED_RATIO_TOTAL.  Otherwise each table
+    gets DEFAULT_RATIO multiplied by its entry in weights (1 if not specified) for both reads and writes."""
+    if traffic:
+        counts = {name: traffic.get(name, (0, 0)) for name in table_names}
+        total = sum(reads + writes for (reads, writes) in counts.values())
+        if total > 0:
+            def scale(count):
+                return int(round(count * SAMPLED_RATIO_TOTAL / float(total)))
+            return {name: (scale(reads), scale(writes)) for (name, (reads, writes)) in counts.items()}
+        log.info("No traffic sampled for the selected tables, using configured weights")
+    weights = weights or {}
+    return {name: (DEFAULT_RATIO * weights.get(name, 1), DEFAULT_RATIO * weights.get(name, 1)) for name in table_names}
+
+
+def lcm(values):
+    rv = 1
+    for value in values:
+        rv = rv * value // gcd(rv, value)
+    return rv
+
+
+def scale_weights(weights, total):
+    """Scale a list of positive weights to integers summing to total using largest remainder rounding, where every
+    weight is at least 1.  If there are more weights than total every weight is 1."""
+    if len(weights) >= total:
+        return [1] * len(weights)
+    weight_total = float(sum(weights))
+    exact = [weight * total / weight_total for weight in weights]
+    rv = [max(1, int(value)) for value in exact]
+    # The remainder goes to the weights rounded down the most, while weights raised to 1 are paid for by the weights
+    # furthest above their exact value
+    while sum(rv) < total:
+        rv[max(range(len(rv)), key=lambda idx: exact[idx] - rv[idx])] += 1
+    while sum(rv) > total:
+        rv[min((idx for idx in range(len(rv)) if rv[idx] > 1), key=lambda idx: exact[idx] - rv[idx])] -= 1
+    return rv
+
+
+def scale_shapes(shapes, total=SHAPE_WEIGHT_TOTAL):
+    """Scale the weights of a list of (shape, weight, extra) tuples with scale_weights"""
+    return [(shape, weight, extra) for ((shape, _, extra), weight) in zip(shapes, scale_weights([w for (_, w, _) in shapes], total))]
+
+
+def build_capacity_steps(mode, host_count, steps, main_cycles):
+    """Returns the main phase scenario commands for each step of a capacity search against a cluster of host_count
+    hosts.  Steps of a rate search last RATE_STEP_SECONDS at the target rate while steps of a thread search each
+    run main_cycles cycles for every host."""
+    host_count = max(host_count, 1)
+    rv = []
+    for step in range(1, steps + 1):
+        if mode == CAPACITY_RATE:
+            rate = step * RATE_STEP_PER_HOST * host_count
+            rv.append(CAPACITY_STEP_SCENARIO.format(rate * RATE_STEP_SECONDS, "auto", step) + " cyclerate={}".format(rate))
+        else:
+            rv.append(CAPACITY_STEP_SCENARIO.format(main_cycles * host_count, step * THREADS_STEP_PER_HOST * host_count, step))
+    return rv
+
+
+def build_churn_slots(shapes_by_table):
+    """Returns the length of a round of the schema churn phase along with a dict of (table name, shape) to the
+    position within the round at which the statements of that shape start.  shapes_by_table is a list of
+    (table name, [(shape, weight)]) pairs in the order statements are executed."""
+    starts = {}
+    position = 0
+    for (name, shapes) in shapes_by_table:
+        for (shape, weight) in shapes:
+            starts[(name, shape)] = position
+            position += weight
+    return (position, starts)
+
+
+def build_partition_widths(min_rows, max_rows, count=MAX_PARTITION_WIDTHS):
+    """Returns the sorted distinct numbers of rows per partition used to approximate a uniform distribution between
+    min_rows and max_rows (inclusive) with at most count partition sizes"""
+    if min_rows == max_rows or count < 2:
+        return [max_rows]
+    step = (max_rows - min_rows) / float(count - 1)
+    return sorted(set(int(round(min_rows + i * step)) for i in range(count)))
+
+
+def classify_statement(statement, table):
+    """Returns a (read, shape) pair for a statement parsed from captured traffic against table, where read is true for
+    reads and shape is one of READ_SHAPES or WRITE_SHAPES.  Returns None for reads which can't be generated (such as
+    scans of the whole table).  Paged reads can't be distinguished from partition reads in a capture and are counted
+    as the latter."""
+    columns = get_column_index(table)
+    restricted = set(col for (col, _) in statement.conditions)
+    equal = set(col for (col, op) in statement.conditions if op in ("=", "in"))
+    clustering = [col.name for col in columns.clustering_key]
+    has_partition = all(col.name in equal for col in columns.partition_key)
+    has_row = has_partition and all(name in equal for name in clustering)
+    if statement.kind == SELECT:
+        if not has_partition:
+            if any(col.name in restricted for (_, col) in indexed_columns(table)):
+                return (True, INDEX_READ)
+            return None
+        if has_row:
+            return (True, POINT_READ)
+        if any(name in restricted and name not in equal for name in clustering):
+            return (True, RANGE_READ)
+        return (True, PARTITION_READ)
+    if statement.batch:
+        return (False, LOGGED_BATCH_WRITE if statement.batch == LOGGED else BATCH_WRITE)
+    if statement.kind == INSERT:
+        return (False, TTL_WRITE if statement.ttl else INSERT_WRITE)
+    if statement.kind == UPDATE:
+        return (False, UPDATE_WRITE)
+    return (False, DELETE_WRITE if has_row or not clustering else RANGE_DELETE_WRITE)
+
+
+def build_captured_mix(counts, total=CAPTURED_MIX_TOTAL):
+    """Scale a dict of shape counts to integer weights summing to total.  Every observed shape keeps a weight of at
+    least 1."""
+    shapes = sorted(shape for (shape, count) in counts.items() if count > 0)
+    return dict(zip(shapes, scale_weights([counts[shape] for shape in shapes], total)))
+
+
+def summarize_capture(capture, keyspace_name, tables):
+    """Build a CaptureSummary from the statements in capture (an instance of adelphi.capture.TrafficCapture) against
+    tables in the keyspace keyspace_name.  The key distribution of a table is a zipf distribution with the exponent
+    fitted to each of its statements, weighted by the number of times the statement was executed."""
+    tables_by_name = {table.name: table for table in tables}
+    traffic = {}
+    shape_counts = {}
+    exponents = {}
+    for (statement, count, keys) in capture.statements():
+        if statement.keyspace not in (None, keyspace_name) or statement.table not in tables_by_name:
+            continue
+        shape = classify_statement(statement, tables_by_name[statement.table])
+        if shape is None:
+            continue
+        (reads, writes) = traffic.get(statement.table, (0, 0))
+        traffic[statement.table] = (reads + count, writes) if shape[0] else (reads, writes + count)
+        counts = shape_counts.setdefault(statement.table, ({}, {}))[0 if shape[0] else 1]
+        counts[shape[1]] = counts.get(shape[1], 0) + count
+        exponent = estimate_zipf_exponent(keys)
+        if exponent is not None:
+            exponents.setdefault(statement.table, []).append((exponent, count))
+    key_distributions = {}
+    for (name, fits) in exponents.items():
+        exponent = sum(e * c for (e, c) in fits) / float(sum(c for (_, c) in fits))
+        if exponent >= MIN_CAPTURED_ZIPF_EXPONENT:
+            key_distributions[name] = KeyDistribution(ZIPF, (round(exponent, 2),))
+    return CaptureSummary(traffic,
+                          {name: build_captured_mix(reads) for (name, (reads, _)) in shape_counts.items() if reads},
+                          {name: build_captured_mix(writes) for (name, (_, writes)) in shape_counts.items() if writes},
+                          key_distributions)
 
 
 class UnsupportedPrimaryKeyTypeException(Exception):
@@ -89,6 +679,10 @@ class NbExporter(BaseExporter):
 
         self.rampup_cycles = props["rampup-cycles"]
         self.main_cycles = props["main-cycles"]
+        self.capacity_search = props.get("capacity-search")
+        self.capacity_steps = props.get("capacity-steps") or DEFAULT_CAPACITY_STEPS
+        self.churn_mix = props.get("schema-churn")
+        self.churn_cycles = props.get("churn-cycles") or DEFAULT_CHURN_CYCLES
         self.numeric_max = min((self.rampup_cycles + self.main_cycles) * 1000, MAX_NUMERIC_VAL)
 
         # Always disable anonymization when generating nosqlbench configs
@@ -104,12 +698,106 @@ class NbExporter(BaseExporter):
 
         if len(self.keyspace.tables) == 0:
             raise TableSelectionException("Keyspace {} contains no tables".format(self.keyspace.name))
-        self.table = next(iter(self.keyspace.tables.values()))
 
-        log.info("Creating nosqlbench config for {}.{}".format(self.keyspace.name, self.table.name))
+        # Bindings for the scalar types in CQL_TYPES along with any collection, tuple or UDT types used by the keyspace.
+        # Columns with composite types are skipped for clusters which don't support fromJson().
+        udts = {udt.name: udt for udt in self.keyspace.user_types.values()}
+        self.cql_types = dict(CQL_TYPES)
+        if supports_json(self.metadata["cassandra_versions"]):
+            self.cql_types.update(build_composite_types(self.keyspace.tables.values(), udts, props.get("collection-size") or DEFAULT_COLLECTION_SIZE))
+        else:
+            log.info("Cassandra versions {} don't support fromJson(), skipping collection, tuple and UDT columns".format(self.metadata["cassandra_versions"]))
+
+        self.tables = self.__get_supported_tables()
+
+        # Bindings and blocks are only namespaced by table when there's more than one of them so that single table
+        # configs are unchanged.  Bindings are prefixed with the position of the table rather than its name since
+        # prefixing names could make a table and column name pair collide with another (e.g. "a_b" and "c" with "a"
+        # and "b_c").
+        self.multi_table = len(self.tables) > 1
+        self.table_positions = {table.name: idx for (idx, table) in enumerate(self.tables)}
+
+        weights = props.get("table-weights") or {}
+        unknown_tables = [name for name in weights if name not in self.keyspace.tables]
+        if unknown_tables:
+            raise TableSelectionException("Weights specified for unknown tables {}".format(",".join(unknown_tables)))
+
+        # Key distributions keyed by table name, with a key of None for the distribution used by all other tables
+        self.key_distributions = props.get("key-distributions") or {}
+        unknown_tables = [name for name in self.key_distributions if name is not None and name not in self.keyspace.tables]
+        if unknown_tables:
+            raise TableSelectionException("Key distributions specified for unknown tables {}".format(",".join(unknown_tables)))
+
+        # Captured traffic takes precedence over traffic sampled from the cluster, while key distributions and read and
+        # write mixes specified explicitly take precedence over those derived from the capture
+        capture_path = props.get("traffic-capture")
+        capture = summarize_capture(read_capture(capture_path), self.keyspace.name, self.tables) if capture_path else None
+        if capture:
+            traffic = capture.traffic
+            if None not in self.key_distributions:
+                key_distributions = dict(capture.key_distributions)
+                key_distributions.update(self.key_distributions)
+                self.key_distributions = key_distributions
+        else:
+            traffic = self.__sample_traffic(cluster) if props.get("sample-traffic") else None
+        self.ratios = build_table_ratios([t.name for t in self.tables], weights, traffic)
+
+        sample_rows = props.get("sample-rows")
+        self.profiles = self.__sample_profiles(cluster, sample_rows) if sample_rows else {}
+
+        rows_per_partition = props.get("rows-per-partition")
+        self.partition_widths = build_partition_widths(*rows_per_partition) if rows_per_partition else []
+        (self.rampup_period, self.layouts, self.rampup_offsets) = self.__build_layouts()
+
+        self.churn_shapes = [(table.name, self.__get_churn_shapes(table)) for table in self.tables] if self.churn_mix else []
+        (self.churn_period, self.churn_starts) = build_churn_slots(self.churn_shapes)
+
+        # Weights of each read and write shape, which sum to SHAPE_WEIGHT_TOTAL for every table.  Ratios are scaled by
+        # that total so that the reads and writes of every table can be divided between the shapes applicable to it
+        # while keeping the share of each table and of reads and writes unchanged, then reduced by the largest factor
+        # common to every block and statement ratio.
+        self.read_mix = props.get("read-mix") or {}
+        self.read_mixes = capture.read_mixes if capture else {}
+        self.read_shapes = {table.name: self.__get_read_shapes(table) for table in self.tables}
+        self.write_mix = props.get("write-mix") or {}
+        self.write_mixes = capture.write_mixes if capture else {}
+        self.write_shapes = {table.name: self.__get_write_shapes(table) for table in self.tables}
+        weighted = [(name, idx, shapes) for (idx, shapes_by_table) in enumerate([self.read_shapes, self.write_shapes])
+                    for (name, shapes) in shapes_by_table.items() if shapes[0][1] is not None]
+        if weighted:
+            # Totals only differ from SHAPE_WEIGHT_TOTAL for tables with more shapes than that
+            scale = lcm(sum(weight for (_, weight, _) in shapes) for (_, _, shapes) in weighted)
+            ratios = {name: (reads * scale, writes * scale) for (name, (reads, writes)) in self.ratios.items()}
+            divisor = 0
+            for value in chain.from_iterable(ratios.values()):
+                divisor = gcd(divisor, value)
+            for (name, idx, shapes) in weighted:
+                total = sum(weight for (_, weight, _) in shapes)
+                for (_, weight, _) in shapes:
+                    divisor = gcd(divisor, ratios[name][idx] * weight // total)
+            divisor = divisor or 1
+            self.ratios = {name: (reads // divisor, writes // divisor) for (name, (reads, writes)) in ratios.items()}
+
+        log.info("Creating nosqlbench config for {}.{}".format(self.keyspace.name, ",".join(t.name for t in self.tables)))
         log.info("Number of cycles for rampup phase = {}".format(self.rampup_cycles))
         log.info("Number of cycles for main phase = {}".format(self.main_cycles))
         log.info("Max numeric value = {}".format(self.numeric_max))
+        if self.multi_table:
+            log.info("Main phase read/write ratios: {}".format(", ".join("{}={}/{}".format(t.name, *self.ratios[t.name]) for t in self.tables)))
+        if self.layouts:
+            log.info("Rows per partition = {}".format(",".join(str(w) for w in self.partition_widths)))
+        if self.churn_mix:
+            log.info("Schema churn of {} cycles with mix {}".format(self.churn_cycles, ",".join("{}={}".format(shape, self.churn_mix.get(shape, 0)) for shape in CHURN_SHAPES)))
+        if self.capacity_search:
+            log.info("Capacity search by {} in {} steps for {} hosts".format(self.capacity_search, self.capacity_steps, self.metadata["host_count"]))
+        if self.read_mix or self.read_mixes:
+            log.info("Read shapes: {}".format(", ".join("{}={}".format(t.name, ",".join(shape for (shape, _, _) in self.read_shapes[t.name])) for t in self.tables)))
+        if self.write_mix or self.write_mixes:
+            log.info("Write shapes: {}".format(", ".join("{}={}".format(t.name, ",".join(shape for (shape, _, _) in self.write_shapes[t.name])) for t in self.tables)))
+        for table in self.tables:
+            distribution = self.__get_key_distribution(table)
+            if distribution:
+                log.info("Key distribution for {} = {}{}".format(table.name, distribution.name, "".join(":{}".format(a) for a in distribution.args)))
 
 
     def export_schema(self, keyspace=None):
@@ -124,65 +812,443 @@ class NbExporter(BaseExporter):
         ks_fn(self.keyspace, self.keyspace.name)
 
 
+    def __get_supported_tables(self):
+        """Tables with a primary key column we can't generate values for are skipped if there are other tables to
+        work with"""
+        all_tables = list(self.keyspace.tables.values())
+        if len(all_tables) == 1:
+            return all_tables
+        rv = []
+        for table in all_tables:
+            unsupported = [col for col in get_column_index(table).primary_key if not is_supported_type(col, self.cql_types)]
+            if unsupported:
+                log.info("Skipping table {} since primary key column {} of type {} isn't supported".format(table.name, unsupported[0].name, unsupported[0].cql_type))
+            else:
+                rv.append(table)
+        # Let the usual bindings validation report the problem with the first table if none were usable
+        return rv or all_tables[:1]
+
+
+    def __sample_traffic(self, cluster):
+        session = get_session(cluster)
+        traffic = fetch_table_traffic(session, self.keyspace.name) if session else None
+        if traffic is None:
+            log.info("Unable to sample traffic for keyspace {}, using configured weights".format(self.keyspace.name))
+        return traffic
+
+
+    def __sample_profiles(self, cluster, sample_rows):
+        session = get_session(cluster)
+        if session is None:
+            log.info("Unable to sample data without a connection to a cluster, bindings will not be profiled")
+            return {}
+        # Primary key columns aren't profiled since their values have to match those written by the rampup sequences
+        rv = {}
+        for table in self.tables:
+            columns = [c for c in get_column_index(table).non_key if is_supported_type(c)]
+            if columns:
+                rv[table.name] = sample_table(session, self.keyspace, table, cluster.metadata.partitioner, sample_rows, columns=columns)
+        return rv
+
+
+    def __build_layouts(self):
+        """Returns the number of cycles in each period of the rampup phase along with a dict of table name to a list
+        of (width, offset) pairs for each table with wide partitions and a dict of table name to the offset within
+        the period of every other table.
+
+        Rampup statements are executed in sequence with each statement for a wide table receiving width consecutive
+        cycles (its ratio) in every period.  Every period therefore writes one partition of each width for every wide
+        table, with the partition identified by cycle / period and the clustering key by cycle % period less the
+        offset of the statement within the period.  All other tables receive a single cycle in each period."""
+        layouts = {}
+        offsets = {}
+        offset = 0
+        for table in self.tables:
+            if not self.partition_widths or not get_column_index(table).clustering_key:
+                if self.partition_widths:
+                    log.info("Table {} has no clustering columns, rows per partition will be ignored".format(table.name))
+                offsets[table.name] = offset
+                offset += 1
+                continue
+            layouts[table.name] = []
+            for width in self.partition_widths:
+                layouts[table.name].append((width, offset))
+                offset += width
+        return (offset, layouts, offsets)
+
+
+    def __get_read_shapes(self, table):
+        """Returns a list of (shape, weight, index) tuples describing the main phase reads of table, where index is an
+        (index, column) pair for index reads.  Weights are None if no read mix was specified or captured, except for
+        wide tables whose reads are split evenly between point and range reads.  Weights are scaled with scale_shapes."""
+        read_mix = self.read_mix or self.read_mixes.get(table.name)
+        if not read_mix:
+            if table.name in self.layouts:
+                return scale_shapes([(POINT_READ, 1, None), (RANGE_READ, 1, None)])
+            return [(POINT_READ, None, None)]
+        has_clustering = bool(get_column_index(table).clustering_key)
+        indexes = indexed_columns(table) if read_mix.get(INDEX_READ, 0) else []
+        rv = []
+        for shape in READ_SHAPES:
+            weight = read_mix.get(shape, 0)
+            if weight == 0 or (shape in CLUSTERED_READ_SHAPES and not has_clustering):
+                continue
+            if shape == INDEX_READ:
+                # The index read weight is divided between the indexes
+                rv.extend((shape, weight / float(len(indexes)), index) for index in indexes)
+            else:
+                rv.append((shape, weight, None))
+        if not rv:
+            log.info("None of the selected read shapes apply to table {}, using point reads".format(table.name))
+            rv.append((POINT_READ, 1, None))
+        return scale_shapes(rv)
+
+
+    def __get_write_shapes(self, table):
+        """Returns a list of (shape, weight, column) tuples describing the main phase writes of table, where column is
+        the regular column written by updates, deletes and appends.  Weights are None if no write mix was specified or
+        captured, and are otherwise scaled with scale_shapes."""
+        write_mix = self.write_mix or self.write_mixes.get(table.name)
+        if not write_mix:
+            return [(INSERT_WRITE, None, None)]
+        columns = get_column_index(table)
+        regular = [col for col in columns.regular if is_supported_type(col, self.cql_types)]
+        appendable = [col for col in regular if is_appendable_type(col)]
+        rv = []
+        for shape in WRITE_SHAPES:
+            weight = write_mix.get(shape, 0)
+            if weight == 0 or (shape in CLUSTERED_WRITE_SHAPES and not columns.clustering_key) or (shape in COLUMN_WRITE_SHAPES and not regular) or \
+               (shape == APPEND_WRITE and not appendable):
+                continue
+            col = appendable[0] if shape == APPEND_WRITE else regular[0] if shape in COLUMN_WRITE_SHAPES else None
+            rv.append((shape, weight, col))
+        if not rv:
+            log.info("None of the selected write shapes apply to table {}, using inserts".format(table.name))
+            rv.append((INSERT_WRITE, 1, None))
+        return scale_shapes(rv)
+
+
+    def __get_churn_shapes(self, table):
+        """Returns a list of (shape, weight) pairs for the schema churn statements modelled on table"""
+        rv = []
+        for shape in CHURN_SHAPES:
+            weight = self.churn_mix.get(shape, 0)
+            if weight == 0 or (shape == CREATE_INDEX_CHURN and churn_index_column(table) is None):
+                continue
+            rv.append((shape, weight))
+        return rv
+
+
+    def __get_prefix(self, table):
+        return "t{}_".format(self.table_positions[table.name]) if self.multi_table else ""
+
+
+    def __get_name(self, name, table):
+        return "{}-{}".format(name, table.name) if self.multi_table else name
+
+
+    def __get_tags(self, tags, table):
+        if self.multi_table:
+            tags["table"] = table.name
+        return tags
+
+
+    def __get_width_suffix(self, width):
+        return "_{}".format(width) if len(self.partition_widths) > 1 else ""
+
+
+    def __get_partition_count(self, table):
+        """Number of partitions written to a wide table during the rampup phase"""
+        return len(self.layouts[table.name]) * int(ceil(self.rampup_cycles / float(self.rampup_period)))
+
+
     def __get_rampup_scenario(self):
-        return RAMPUP_SCENARIO.format(self.rampup_cycles)
+        scenario = RAMPUP_SCENARIO.format(self.rampup_cycles)
+        return scenario + CONCAT_SEQUENCER if self.layouts else scenario
 
 
     def __get_main_scenario(self):
         return MAIN_SCENARIO.format(self.main_cycles)
 
 
-    def __get_dist(self, typename):
-        base = CQL_TYPES[typename].format(self.numeric_max)
-        return "Hash(); {}".format(base)
+    def __get_capacity_scenario(self):
+        steps = build_capacity_steps(self.capacity_search, self.metadata["host_count"], self.capacity_steps, self.main_cycles)
+        return [self.__get_rampup_scenario()] + steps
+
+
+    def __get_churn_scenario(self):
+        ddl = CHURN_DDL_SCENARIO.format(self.churn_cycles)
+        return [CHURN_SETUP_SCENARIO, ddl] if self.__has_churn_type() else [ddl]
+
+
+    def __has_churn_type(self):
+        return any(shape == ALTER_TYPE_CHURN for (_, shapes) in self.churn_shapes for (shape, _) in shapes)
+
+
+    def __get_dist(self, col, table):
+        return build_dist(col.cql_type, self.numeric_max, self.profiles.get(table.name, {}).get(col.name), self.cql_types)
+
+
+    def __get_key_distribution(self, table):
+        return self.key_distributions.get(table.name, self.key_distributions.get(None))
+
+
+    def __get_key_dist(self, col, table):
+        """Keys read and written by the main phase are drawn from those written to table during rampup, which are
+        the cycles at the table's offset within each rampup period"""
+        count = int(ceil(self.rampup_cycles / float(self.rampup_period)))
+        return build_key_dist(col.cql_type, count, self.__get_key_distribution(table), self.rampup_period, self.rampup_offsets[table.name], self.cql_types)
 
 
     def __get_seq(self, typename):
-        return CQL_TYPES[typename].format(self.numeric_max)
+        return self.cql_types[typename].format(self.numeric_max)
+
 
+    def __build_statement(self, name, table, stmt):
+        stmt_name = self.__get_name(name, table)
+        return {"tags":{"name":stmt_name}, stmt_name: stmt}
 
-    def __build_rampup_statement(self):
-        return {"tags":{"name":"rampup-insert"}, "rampup-insert": build_insert_statements(self.keyspace, self.table)}
 
+    def __build_rampup_statements(self, table):
+        prefix = self.__get_prefix(table)
+        if table.name not in self.layouts:
+            return [self.__build_statement("rampup-insert", table, build_insert_statements(self.keyspace, table, prefix, types=self.cql_types))]
+        rv = []
+        for (width, _) in self.layouts[table.name]:
+            suffix = self.__get_width_suffix(width)
+            stmt = self.__build_statement("rampup-insert" + suffix.replace("_", "-"), table,
+                                          build_insert_statements(self.keyspace, table, prefix, lambda col: seq_binding_name(col, prefix, suffix), types=self.cql_types))
+            stmt["params"] = {"ratio":width}
+            rv.append(stmt)
+        return rv
 
-    def __build_main_read_statement(self):
-        return {"tags":{"name":"main-select"}, "main-select": build_select_statements(self.keyspace, self.table)}
+
+    def __build_main_read_statements(self, table):
+        prefix = self.__get_prefix(table)
+        shapes = self.read_shapes[table.name]
+        total = sum(weight or 0 for (_, weight, _) in shapes)
+        rv = []
+        for (shape, weight, index) in shapes:
+            params = {}
+            if shape == POINT_READ:
+                stmt = self.__build_statement("main-select", table, build_select_statements(self.keyspace, table, prefix))
+            elif shape == PARTITION_READ:
+                stmt = self.__build_statement("main-select-partition", table, build_partition_select_statements(self.keyspace, table, prefix))
+            elif shape == RANGE_READ:
+                stmt = self.__build_statement("main-select-range", table, build_range_select_statements(self.keyspace, table, prefix))
+            elif shape == PAGED_READ:
+                stmt = self.__build_statement("main-select-paged", table, build_partition_select_statements(self.keyspace, table, prefix))
+                params["fetchsize"] = PAGE_SIZE
+            else:
+                stmt = self.__build_statement("main-select-" + index[0].name, table, build_index_select_statements(self.keyspace, table, index[1], prefix))
+            # Scaled ratios are always divisible by the total weight of the table's read shapes
+            if weight:
+                params["ratio"] = self.ratios[table.name][0] * weight // total
+            if params:
+                stmt["params"] = params
+            rv.append(stmt)
+        return rv
 
 
-    def __build_main_write_statement(self):
-        return {"tags":{"name":"main-insert"}, "main-insert": build_insert_statements(self.keyspace, self.table)}
+    def __build_main_write_statements(self, table):
+        prefix = self.__get_prefix(table)
+        # Writes to wide tables update existing rows so that partitions keep the sizes written during rampup, while
+        # writes to tables with a key distribution update rows selected by that distribution
+        key_binding = None
+        if table.name in self.layouts or self.__get_key_distribution(table):
+            key_binding = lambda col: dist_binding_name(col, prefix)
+        shapes = self.write_shapes[table.name]
+        total = sum(weight or 0 for (_, weight, _) in shapes)
+        rv = []
+        for (shape, weight, col) in shapes:
+            if shape == INSERT_WRITE:
+                stmt = self.__build_statement("main-insert", table, build_insert_statements(self.keyspace, table, prefix, key_binding, types=self.cql_types))
+            elif shape == TTL_WRITE:
+                stmt = self.__build_statement("main-insert-ttl", table, build_insert_statements(self.keyspace, table, prefix, key_binding, WRITE_TTL, self.cql_types))
+            elif shape == UPDATE_WRITE:
+                stmt = self.__build_statement("main-update", table, build_update_statements(self.keyspace, table, col, prefix))
+            elif shape == APPEND_WRITE:
+                stmt = self.__build_statement("main-append", table, build_append_statements(self.keyspace, table, col, prefix))
+            elif shape == DELETE_WRITE:
+                stmt = self.__build_statement("main-delete", table, build_delete_statements(self.keyspace, table, col, prefix))
+            elif shape == RANGE_DELETE_WRITE:
+                stmt = self.__build_statement("main-delete-range", table, build_range_delete_statements(self.keyspace, table, prefix))
+            else:
+                logged = shape == LOGGED_BATCH_WRITE
+                stmt = self.__build_statement("main-batch-logged" if logged else "main-batch", table, build_batch_statements(self.keyspace, table, prefix, logged, types=self.cql_types))
+            # Scaled ratios are always divisible by the total weight of the table's write shapes
+            if weight:
+                stmt["params"] = {"ratio":self.ratios[table.name][1] * weight // total}
+            rv.append(stmt)
+        return rv
 
 
     def __build_bindings(self, table):
+        prefix = self.__get_prefix(table)
         (pk_cols, plain_cols) = partition_cols(table)
-        rv = {dist_binding_name(plain_col): self.__get_dist(plain_col.cql_type) for plain_col in plain_cols if is_supported_type(plain_col)}
+        rv = {dist_binding_name(plain_col, prefix): self.__get_dist(plain_col, table) for plain_col in plain_cols if is_supported_type(plain_col, self.cql_types)}
 
         def pk_generator():
             for pk_col in pk_cols:
-                if not is_supported_type(pk_col):
+                if not is_supported_type(pk_col, self.cql_types):
                     raise UnsupportedPrimaryKeyTypeException("No sequence definition for primary key column {} of type {}".format(pk_col.name, pk_col.cql_type))
-                yield((seq_binding_name(pk_col), self.__get_seq(pk_col.cql_type)))
-                # Each pk col also gets a DIST def because we may want to execute selects against it
-                yield((dist_binding_name(pk_col), self.__get_dist(pk_col.cql_type)))
+                # Sequences for wide tables are built separately for each partition size
+                if table.name not in self.layouts:
+                    yield((seq_binding_name(pk_col, prefix), self.__get_seq(pk_col.cql_type)))
+                # Each pk col also gets a DIST def because we may want to execute selects against it.  Distributions
+                # for wide tables are built separately.
+                if table.name in self.layouts or not self.__get_key_distribution(table):
+                    yield((dist_binding_name(pk_col, prefix), build_dist(pk_col.cql_type, self.numeric_max, types=self.cql_types)))
+                else:
+                    yield((dist_binding_name(pk_col, prefix), self.__get_key_dist(pk_col, table)))
         rv.update(dict(pk_generator()))
+        if table.name in self.layouts:
+            rv.update(self.__build_wide_bindings(table))
+        if any(shape in (BATCH_WRITE, LOGGED_BATCH_WRITE) for (shape, _, _) in self.write_shapes[table.name]):
+            rv.update(self.__build_batch_bindings(table))
+        return rv
+
+
+    def __build_batch_bindings(self, table):
+        """Distinct values of the first clustering column for each insert in a batch"""
+        prefix = self.__get_prefix(table)
+        first = get_column_index(table).clustering_key[0]
+        cardinality = self.layouts[table.name][0][0] if table.name in self.layouts else self.numeric_max
+        return {batch_binding_name(first, idx, prefix): "Hash(); Add({}); {}".format(idx, self.cql_types[first.cql_type].format(cardinality))
+                for idx in range(BATCH_SIZE)}
+
+
+    def __build_wide_bindings(self, table):
+        """Sequences placing rampup rows into partitions of each width along with distributions selecting rows
+        which exist in every partition"""
+        prefix = self.__get_prefix(table)
+        columns = get_column_index(table)
+        layout = self.layouts[table.name]
+        rv = {}
+        for (idx, (width, offset)) in enumerate(layout):
+            suffix = self.__get_width_suffix(width)
+            partition = "Div({}); ".format(self.rampup_period)
+            if len(layout) > 1:
+                partition += "Mul({}); Add({}); ".format(len(layout), idx)
+            clustering = "Mod({}); ".format(self.rampup_period)
+            if offset:
+                clustering += "Add({}); ".format(-offset)
+            for col in columns.partition_key:
+                rv[seq_binding_name(col, prefix, suffix)] = partition + self.__get_seq(col.cql_type)
+            for col in columns.clustering_key:
+                rv[seq_binding_name(col, prefix, suffix)] = clustering + self.__get_seq(col.cql_type)
+        partition_count = self.__get_partition_count(table)
+        distribution = self.__get_key_distribution(table) or KeyDistribution(UNIFORM, ())
+        rv.update({dist_binding_name(col, prefix): build_key_dist(col.cql_type, partition_count, distribution, types=self.cql_types) for col in columns.partition_key})
+        rv.update({dist_binding_name(col, prefix): build_dist(col.cql_type, layout[0][0], types=self.cql_types) for col in columns.clustering_key})
         return rv
 
 
+    def __build_churn_statements(self, table, idx):
+        prefix = self.__get_prefix(table)
+        keyspace = quote_str(self.keyspace.name)
+        rv = []
+        for (shape, weight) in dict(self.churn_shapes)[table.name]:
+            name = churn_table_name(idx, shape, prefix)
+            if shape == CREATE_TABLE_CHURN:
+                stmt = build_create_table_statements(self.keyspace, table, name)
+            elif shape == ADD_COLUMN_CHURN:
+                stmt = "alter table {}.{} add \"churn_column_{{churn_cycle}}\" {}".format(keyspace, name, churn_column_type(table))
+            elif shape == CREATE_INDEX_CHURN:
+                stmt = "create index if not exists on {}.{} ({})".format(keyspace, name, quote_str(churn_index_column(table).name))
+            elif shape == ALTER_TYPE_CHURN:
+                stmt = "alter type {}.{} add \"churn_field_{{churn_cycle}}\" int".format(keyspace, quote_str(CHURN_TYPE))
+            else:
+                stmt = "drop table if exists {}.{}".format(keyspace, name)
+            stmt = self.__build_statement("churn-" + shape, table, stmt)
+            stmt["params"] = {"ratio": weight}
+            rv.append(stmt)
+        return rv
+
+
+    def __build_churn_bindings(self, table):
+        """Slot of the table targeted by each churn statement within the current round.  Create statements fill the
+        slots in order while other statements cycle through them."""
+        prefix = self.__get_prefix(table)
+        shapes = dict(self.churn_shapes)[table.name]
+        tables_per_round = dict(shapes).get(CREATE_TABLE_CHURN, 1)
+        rv = {}
+        for (shape, _) in shapes:
+            if shape == ALTER_TYPE_CHURN:
+                continue
+            start = self.churn_starts[(table.name, shape)]
+            binding = "Mod({}); ".format(self.churn_period)
+            if start:
+                binding += "Add(-{}); ".format(start)
+            if shape != CREATE_TABLE_CHURN:
+                binding += "Mod({}); ".format(tables_per_round)
+            rv[churn_slot_binding_name(shape, prefix)] = binding + "ToString() -> String"
+        return rv
+
+
+    def __build_churn_blocks(self):
+        # Statements are executed unprepared so that bindings can supply the names of tables and columns
+        params = {"prepared": False}
+        blocks = []
+        if self.__has_churn_type():
+            stmt = "create type if not exists {}.{} (churn_field int)".format(quote_str(self.keyspace.name), quote_str(CHURN_TYPE))
+            blocks.append({"name":"churn-setup", "tags":{"phase":"churn-setup"}, "params":params,
+                           "statements":[{"tags":{"name":"churn-create-type"}, "churn-create-type":stmt}]})
+        for (idx, table) in enumerate(self.tables):
+            blocks.append({"name":self.__get_name("churn", table), "tags":self.__get_tags({"phase":"churn-ddl"}, table), "params":params,
+                           "statements":self.__build_churn_statements(table, idx)})
+        return blocks
+
+
+    def __build_blocks(self, table, params_by_ratio):
+        cl_map = {"cl":"LOCAL_QUORUM"}
+        (read_ratio, write_ratio) = self.ratios[table.name]
+
+        # Blocks with the same ratio share params
+        def get_params(ratio):
+            if ratio not in params_by_ratio:
+                params_by_ratio[ratio] = {"ratio":ratio}
+                params_by_ratio[ratio].update(cl_map)
+            return params_by_ratio[ratio]
+
+        blocks = [{"name":self.__get_name("rampup", table), "tags":self.__get_tags({"phase":"rampup"}, table), "params":cl_map,
+                   "statements": self.__build_rampup_statements(table)}]
+        if read_ratio > 0:
+            blocks.append({"name":self.__get_name("main-read", table), "tags":self.__get_tags({"phase":"main", "type":"read"}, table),
+                           "params":get_params(read_ratio), "statements": self.__build_main_read_statements(table)})
+        if write_ratio > 0:
+            blocks.append({"name":self.__get_name("main-write", table), "tags":self.__get_tags({"phase":"main", "type":"write"}, table),
+                           "params":get_params(write_ratio), "statements": self.__build_main_write_statements(table)})
+        return blocks
+
+
     def __build_schema(self):
         """Really more of a config than a schema, but we'll allow it"""
         root = {}
 
         root["scenarios"] = {"TEMPLATE(scenarioname,default)":[self.__get_rampup_scenario(), self.__get_main_scenario()]}
-        
-        root["bindings"] = self.__build_bindings(self.table)
-
-        cl_map = {"cl":"LOCAL_QUORUM"}
-        cl_ratio_map = {"ratio":5}
-        cl_ratio_map.update(cl_map)
+        if self.capacity_search:
+            root["scenarios"][CAPACITY_SCENARIO] = self.__get_capacity_scenario()
+        if self.churn_mix:
+            root["scenarios"][CHURN_SCENARIO] = self.__get_churn_scenario()
 
-        rampup_block = {"name":"rampup", "tags":{"phase":"rampup"}, "params":cl_map, "statements": [self.__build_rampup_statement()]}
-        main_read_block = {"name":"main-read", "tags":{"phase":"main", "type":"read"}, "params":cl_ratio_map, "statements": [self.__build_main_read_statement()]}
-        main_write_block = {"name":"main-write", "tags":{"phase":"main", "type":"write"}, "params":cl_ratio_map, "statements": [self.__build_main_write_statement()]}
-        root["blocks"] = [rampup_block, main_read_block, main_write_block]
+        root["bindings"] = {}
+        rampup_blocks = []
+        main_blocks = []
+        params_by_ratio = {}
+        for table in self.tables:
+            root["bindings"].update(self.__build_bindings(table))
+            blocks = self.__build_blocks(table, params_by_ratio)
+            rampup_blocks.append(blocks[0])
+            main_blocks.extend(blocks[1:])
+        root["blocks"] = rampup_blocks + main_blocks
+        if self.churn_mix:
+            root["bindings"]["churn_round"] = "Div({}); ToString() -> String".format(self.churn_period)
+            root["bindings"]["churn_cycle"] = "ToString() -> String"
+            for table in self.tables:
+                root["bindings"].update(self.__build_churn_bindings(table))
+            root["blocks"].extend(self.__build_churn_blocks())
 
-        return yaml.dump(root, default_flow_style=False)
+        # Top-level sections are dumped one at a time (in the order yaml.dump sorts them) so that the representation
+        # of only one section is held in memory at once.  Shared params only occur within blocks so anchors still work.
+        return "".join(yaml.dump({k: root[k]}, Dumper=YAML_DUMPER, default_flow_style=False) for k in sorted(root))
@@ -0,0 +1,558 @@
+# Copyright DataStax, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Functions to build schema metadata from local sources rather than a running cluster.
+#
+# Two sources are supported:
+#
+# * A CQL file containing DDL statements, such as the output of "DESCRIBE SCHEMA" in cqlsh
+# * A directory containing a dump of the system_schema tables.  Each table is dumped to a file named after
+#   the table (keyspaces, tables, columns, types, indexes, views, triggers, functions, aggregates) with
+#   either a ".csv" extension (as written by "COPY ... TO ... WITH HEADER = true" in cqlsh) or a ".json"
+#   extension (one JSON object per line as returned by "SELECT JSON * FROM ..." or a single JSON array).
+#
+# In both cases the source is converted into rows matching the system_schema tables which are then handed to the
+# driver's schema parser, so the resulting cassandra.metadata.KeyspaceMetadata objects are identical to those
+# built from a live cluster.
+
+import ast
+import csv
+import itertools
+import json
+import logging
+import os
+import os.path
+import re
+
+from cassandra.metadata import Metadata, protect_name
+
+from adelphi.exceptions import SchemaParseException
+from adelphi.store import SCHEMA_TABLES, RowSchemaParser, group_table_names
+
+log = logging.getLogger('adelphi')
+
+# Columns in the system_schema tables with a type other than text.  Values for these columns must be converted
+# when reading a CSV dump.
+NON_TEXT_COLUMNS = set(["durable_writes", "replication", "flags", "bloom_filter_fp_chance", "caching", "cdc",
+                        "compaction", "compression", "crc_check_chance", "dclocal_read_repair_chance",
+                        "default_time_to_live", "gc_grace_seconds", "max_index_interval",
+                        "memtable_flush_period_in_ms", "min_index_interval", "read_repair_chance", "position",
+                        "options", "field_names", "field_types", "include_all_columns", "argument_names",
+                        "argument_types", "called_on_null_input", "deterministic", "monotonic", "monotonic_on"])
+
+# Blob-valued map which can't be reliably recovered from a CSV dump
+CSV_IGNORED_COLUMNS = set(["extensions"])
+
+
+class OfflineCluster:
+    """Stands in for a cassandra.cluster.Cluster when schema metadata is read from a local source.  Exporters only
+    require the metadata attribute; since there are no hosts all host-derived metadata is empty."""
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+
+def build_offline_cluster(path, keyspaces = None, tables = None):
+    """Build an OfflineCluster from either a CQL file or a directory containing a system_schema dump.  As with
+    adelphi.store.fetch_keyspace_metadata() only the specified keyspaces and tables (a list of "keyspace.table" names)
+    are retained if either is provided."""
+    rows = load_schema_dump(path) if os.path.isdir(path) else load_cql_file(path)
+    metadata = Metadata()
+    for keyspace in RowSchemaParser(rows).get_all_keyspaces():
+        metadata.keyspaces[keyspace.name] = keyspace
+
+    tables_by_ks = group_table_names(tables)
+    if keyspaces is not None or tables is not None:
+        selected = set(keyspaces or []) | set(tables_by_ks.keys())
+        metadata.keyspaces = {k: v for (k, v) in metadata.keyspaces.items() if k in selected}
+    for (ks_name, table_names) in tables_by_ks.items():
+        keyspace = metadata.keyspaces.get(ks_name)
+        if keyspace:
+            keyspace.tables = {k: v for (k, v) in keyspace.tables.items() if k in table_names}
+    return OfflineCluster(metadata)
+
+
+# ============================ system_schema dumps ============================
+def load_schema_dump(dump_dir):
+    """Return a dict of system_schema table name to a list of rows (as dicts) read from the dump directory"""
+    rv = {}
+    for table in SCHEMA_TABLES:
+        for (ext, read_fn) in [(".csv", _read_csv_rows), (".json", _read_json_rows)]:
+            path = os.path.join(dump_dir, table + ext)
+            if os.path.exists(path):
+                log.info("Reading system_schema.{} rows from {}".format(table, path))
+                rv[table] = list(read_fn(path))
+                break
+    if "keyspaces" not in rv:
+        raise SchemaParseException("No keyspaces.csv or keyspaces.json file found in {}".format(dump_dir))
+    return rv
+
+
+def _read_json_rows(path):
+    with open(path) as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            for row in json.load(f):
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _csv_value(val):
+    if val == "":
+        return None
+    lower = val.lower()
+    if lower in ("true", "false"):
+        return lower == "true"
+    try:
+        return ast.literal_eval(val)
+    except (ValueError, SyntaxError):
+        return val
+
+
+def _read_csv_rows(path):
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            yield {k: (_csv_value(v) if k in NON_TEXT_COLUMNS else v) for (k, v) in row.items() if k not in CSV_IGNORED_COLUMNS}
+
+
+# ============================ CQL files ============================
+STATEMENT_SPECIAL_RE = re.compile(r"'|\"|\$\$|/\*|--|//|;")
+STATEMENT_CLOSERS = {"'": "'", "\"": "\"", "$$": "$$", "/*": "*/"}
+
+TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<dollar>\$\$.*?\$\$)
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<punct>[(),;.={}<>:\[\]])
+""", re.VERBOSE | re.DOTALL)
+
+INDEX_TARGET_FUNCTIONS = set(["keys", "values", "entries", "full"])
+
+# Leading keywords of the supported statements.  Statements are only fully tokenized once their leading keywords
+# match one of these, so unsupported statements (views, functions etc.) are skipped even if they contain syntax
+# the tokenizer doesn't recognize.
+SUPPORTED_STATEMENTS = [("use",), ("create", "keyspace"), ("create", "type"), ("create", "table"),
+                        ("create", "columnfamily"), ("create", "index"), ("create", "custom", "index")]
+
+
+def split_statements(lines):
+    """Generator returning the text of each statement (minus the trailing semicolon) in a sequence of lines.
+    Semicolons within string literals, quoted identifiers and comments are ignored; line comments are removed."""
+    buff = []
+    closer = None
+    for line in lines:
+        pos = 0
+        while pos < len(line):
+            if closer:
+                idx = line.find(closer, pos)
+                if idx < 0:
+                    buff.append(line[pos:])
+                    break
+                end = idx + len(closer)
+                buff.append(line[pos:end])
+                pos = end
+                closer = None
+                continue
+
+            match = STATEMENT_SPECIAL_RE.search(line, pos)
+            if not match:
+                buff.append(line[pos:])
+                break
+            special = match.group(0)
+            if special in ("--", "//"):
+                buff.append(line[pos:match.start()] + "\n")
+                break
+            if special == ";":
+                buff.append(line[pos:match.start()])
+                stmt = "".join(buff).strip()
+                if stmt:
+                    yield stmt
+                buff = []
+            else:
+                buff.append(line[pos:match.end()])
+                closer = STATEMENT_CLOSERS[special]
+            pos = match.end()
+
+    stmt = "".join(buff).strip()
+    if stmt:
+        yield stmt
+
+
+def iter_tokens(stmt):
+    """Generator returning (kind, text) tuples for the tokens in a statement, ignoring whitespace and comments"""
+    pos = 0
+    while pos < len(stmt):
+        match = TOKEN_RE.match(stmt, pos)
+        if not match:
+            raise SchemaParseException("Unexpected input at '{}'".format(stmt[pos:pos + 20]))
+        kind = match.lastgroup
+        if kind not in ("ws", "comment"):
+            yield (kind, match.group(0))
+        pos = match.end()
+
+
+def tokenize(stmt):
+    """Return a list of (kind, text) tuples for the tokens in a statement, ignoring whitespace and comments"""
+    return list(iter_tokens(stmt))
+
+
+def is_supported_statement(stmt):
+    """Return True if the leading keywords of a statement match one of SUPPORTED_STATEMENTS.  Only as many tokens as
+    are needed to check the keywords are read."""
+    max_len = max(len(keywords) for keywords in SUPPORTED_STATEMENTS)
+    try:
+        leading = [text.lower() if kind == "ident" else None for (kind, text) in itertools.islice(iter_tokens(stmt), max_len)]
+    except SchemaParseException:
+        # Supported statements only start with keywords so unrecognized input means the statement isn't supported
+        return False
+    return any(tuple(leading[:len(keywords)]) == keywords for keywords in SUPPORTED_STATEMENTS)
+
+
+class _StatementParser:
+    """Recursive descent parser for a single tokenized DDL statement"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+
+    def peek(self, offset=0):
+        idx = self.pos + offset
+        return self.tokens[idx] if idx < len(self.tokens) else (None, None)
+
+
+    def next(self):
+        tok = self.peek()
+        if tok[0] is None:
+            raise SchemaParseException("Unexpected end of statement")
+        self.pos += 1
+        return tok
+
+
+    def at_end(self):
+        return self.pos >= len(self.tokens)
+
+
+    def is_keyword(self, word, offset=0):
+        (kind, text) = self.peek(offset)
+        return kind == "ident" and text.lower() == word
+
+
+    def accept_keywords(self, *words):
+        if all(self.is_keyword(word, idx) for (idx, word) in enumerate(words)):
+            self.pos += len(words)
+            return True
+        return False
+
+
+    def expect_keywords(self, *words):
+        if not self.accept_keywords(*words):
+            raise SchemaParseException("Expected {} but found '{}'".format(" ".join(words).upper(), self.peek()[1]))
+
+
+    def accept(self, punct):
+        if self.peek() == ("punct", punct):
+            self.pos += 1
+            return True
+        return False
+
+
+    def expect(self, punct):
+        if not self.accept(punct):
+            raise SchemaParseException("Expected '{}' but found '{}'".format(punct, self.peek()[1]))
+
+
+    def name(self):
+        """Parse an identifier, normalizing case for unquoted identifiers as Cassandra does"""
+        (kind, text) = self.next()
+        if kind == "ident":
+            return text.lower()
+        if kind == "quoted":
+            return text[1:-1].replace("\"\"", "\"")
+        raise SchemaParseException("Expected an identifier but found '{}'".format(text))
+
+
+    def qualified_name(self, default_keyspace):
+        first = self.name()
+        if self.accept("."):
+            return (first, self.name())
+        if default_keyspace is None:
+            raise SchemaParseException("No keyspace specified for {}".format(first))
+        return (default_keyspace, first)
+
+
+    def cql_type(self):
+        """Parse a type and return it in the form used by the system_schema tables"""
+        (kind, text) = self.next()
+        if kind == "ident":
+            type_name = text.lower()
+        elif kind == "quoted":
+            type_name = text
+        elif kind == "string":
+            # Custom types are specified as the class name in a string literal
+            return text
+        else:
+            raise SchemaParseException("Expected a type but found '{}'".format(text))
+
+        # UDT references are stored without a keyspace
+        if self.accept("."):
+            (kind, text) = self.next()
+            type_name = text.lower() if kind == "ident" else text
+
+        if self.accept("<"):
+            params = [self.cql_type()]
+            while self.accept(","):
+                params.append(self.cql_type())
+            self.expect(">")
+            return "{}<{}>".format(type_name, ", ".join(params))
+        return type_name
+
+
+    def value(self):
+        (kind, text) = self.peek()
+        if kind == "punct" and text == "{":
+            return self.map_value()
+        if kind == "punct" and text == "[":
+            self.next()
+            rv = []
+            while not self.accept("]"):
+                rv.append(self.value())
+                self.accept(",")
+            return rv
+        self.next()
+        if kind == "string":
+            return text[1:-1].replace("''", "'")
+        if kind == "dollar":
+            return text[2:-2]
+        if kind == "number":
+            return float(text) if re.search(r"[.eE]", text) else int(text)
+        if kind == "ident" and text.lower() in ("true", "false"):
+            return text.lower() == "true"
+        if kind in ("ident", "quoted"):
+            return text
+        raise SchemaParseException("Expected a value but found '{}'".format(text))
+
+
+    def map_value(self):
+        self.expect("{")
+        rv = {}
+        while not self.accept("}"):
+            key = self.value()
+            self.expect(":")
+            rv[key] = self.value()
+            self.accept(",")
+        return rv
+
+
+class CqlSchemaReader:
+    """Converts DDL statements into rows matching the system_schema tables.  Only statements which create
+    keyspaces, types, tables and indexes are supported; all other statements are skipped."""
+
+    def __init__(self):
+        self.rows = {table: [] for table in SCHEMA_TABLES}
+        self.keyspace = None
+
+
+    def read(self, lines):
+        for stmt in split_statements(lines):
+            try:
+                self.read_statement(stmt)
+            except SchemaParseException as exc:
+                raise SchemaParseException("{} in statement: {}".format(exc.args[0], stmt))
+        return self.rows
+
+
+    def read_statement(self, stmt):
+        if not is_supported_statement(stmt):
+            log.info("Skipping unsupported statement: {}".format(" ".join(stmt.split())[:80]))
+            return
+        parser = _StatementParser(tokenize(stmt))
+        if parser.accept_keywords("use"):
+            self.keyspace = parser.name()
+        elif parser.accept_keywords("create", "keyspace"):
+            self.__create_keyspace(parser)
+        elif parser.accept_keywords("create", "type"):
+            self.__create_type(parser)
+        elif parser.accept_keywords("create", "table") or parser.accept_keywords("create", "columnfamily"):
+            self.__create_table(parser)
+        elif parser.accept_keywords("create", "index"):
+            self.__create_index(parser, False)
+        elif parser.accept_keywords("create", "custom", "index"):
+            self.__create_index(parser, True)
+
+
+    def __if_not_exists(self, parser):
+        parser.accept_keywords("if", "not", "exists")
+
+
+    def __create_keyspace(self, parser):
+        self.__if_not_exists(parser)
+        name = parser.name()
+        options = self.__options(parser)
+        replication = {k: str(v) for (k, v) in options.get("replication", {}).items()}
+        self.rows["keyspaces"].append({"keyspace_name": name, "durable_writes": options.get("durable_writes", True),
+                                       "replication": replication})
+
+
+    def __create_type(self, parser):
+        self.__if_not_exists(parser)
+        (ks_name, type_name) = parser.qualified_name(self.keyspace)
+        field_names = []
+        field_types = []
+        parser.expect("(")
+        while not parser.accept(")"):
+            field_names.append(parser.name())
+            field_types.append(parser.cql_type())
+            parser.accept(",")
+        self.rows["types"].append({"keyspace_name": ks_name, "type_name": type_name, "field_names": field_names,
+                                   "field_types": field_types})
+
+
+    def __create_table(self, parser):
+        self.__if_not_exists(parser)
+        (ks_name, table_name) = parser.qualified_name(self.keyspace)
+
+        columns = []
+        static_columns = set()
+        partition_key = []
+        clustering_key = []
+        parser.expect("(")
+        while not parser.accept(")"):
+            if parser.accept_keywords("primary", "key"):
+                parser.expect("(")
+                if parser.accept("("):
+                    partition_key.append(parser.name())
+                    while parser.accept(","):
+                        partition_key.append(parser.name())
+                    parser.expect(")")
+                else:
+                    partition_key.append(parser.name())
+                while parser.accept(","):
+                    clustering_key.append(parser.name())
+                parser.expect(")")
+            else:
+                col_name = parser.name()
+                columns.append((col_name, parser.cql_type()))
+                if parser.accept_keywords("static"):
+                    static_columns.add(col_name)
+                if parser.accept_keywords("primary", "key"):
+                    partition_key.append(col_name)
+            parser.accept(",")
+
+        options = self.__options(parser)
+        clustering_order = options.pop("clustering order", {})
+        compact = options.pop("compact storage", False)
+
+        if compact:
+            flags = set(["dense"]) if clustering_key else set()
+        else:
+            flags = set(["compound"])
+        row = {"keyspace_name": ks_name, "table_name": table_name, "flags": flags}
+        row.update(options)
+        self.rows["tables"].append(row)
+
+        for (col_name, col_type) in columns:
+            if col_name in partition_key:
+                (kind, position, order) = ("partition_key", partition_key.index(col_name), "none")
+            elif col_name in clustering_key:
+                (kind, position, order) = ("clustering", clustering_key.index(col_name), clustering_order.get(col_name, "asc"))
+            elif col_name in static_columns or (compact and not clustering_key):
+                # Cassandra stores the regular columns of compact tables without clustering columns as static
+                (kind, position, order) = ("static", -1, "none")
+            else:
+                (kind, position, order) = ("regular", -1, "none")
+            self.rows["columns"].append({"keyspace_name": ks_name, "table_name": table_name, "column_name": col_name,
+                                         "kind": kind, "position": position, "clustering_order": order,
+                                         "type": col_type})
+
+
+    def __create_index(self, parser, custom):
+        self.__if_not_exists(parser)
+        index_name = None
+        if not parser.is_keyword("on"):
+            index_name = parser.name()
+        parser.expect_keywords("on")
+        (ks_name, table_name) = parser.qualified_name(self.keyspace)
+
+        parser.expect("(")
+        # Targets are stored as CQL, so case-sensitive column names retain their quotes
+        column = parser.name()
+        target = protect_name(column)
+        if column in INDEX_TARGET_FUNCTIONS and parser.accept("("):
+            column = parser.name()
+            target = "{}({})".format(target, protect_name(column))
+            parser.expect(")")
+        parser.expect(")")
+
+        options = {}
+        if parser.accept_keywords("using"):
+            custom = True
+            options["class_name"] = parser.value()
+            if parser.accept_keywords("with", "options"):
+                parser.expect("=")
+                options.update(parser.map_value())
+        options["target"] = target
+
+        if index_name is None:
+            # Cassandra's default name for an unnamed index
+            index_name = "{}_{}_idx".format(table_name, column)
+        self.rows["indexes"].append({"keyspace_name": ks_name, "table_name": table_name, "index_name": index_name,
+                                     "kind": "CUSTOM" if custom else "COMPOSITES", "options": options})
+
+
+    def __options(self, parser):
+        """Parse a WITH clause.  Clustering order and compact storage are returned using the keys "clustering order"
+        and "compact storage" respectively."""
+        rv = {}
+        if not parser.accept_keywords("with"):
+            return rv
+        while True:
+            if parser.accept_keywords("clustering", "order", "by"):
+                order = {}
+                parser.expect("(")
+                while not parser.accept(")"):
+                    col_name = parser.name()
+                    order[col_name] = "desc" if parser.accept_keywords("desc") else "asc"
+                    parser.accept_keywords("asc")
+                    parser.accept(",")
+                rv["clustering order"] = order
+            elif parser.accept_keywords("compact", "storage"):
+                rv["compact storage"] = True
+            else:
+                key = parser.name()
+                parser.expect("=")
+                rv[key] = parser.value()
+            if not parser.accept_keywords("and"):
+                break
+        if not parser.at_end():
+            raise SchemaParseException("Unexpected input '{}'".format(parser.peek()[1]))
+        return rv
+
+
+def load_cql_file(path):
+    """Return a dict of system_schema table name to a list of rows (as dicts) built from the DDL in a CQL file"""
+    log.info("Reading schema from CQL file {}".format(path))
+    with open(path) as f:
+        return CqlSchemaReader().read(f)
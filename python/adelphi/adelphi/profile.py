@@ -0,0 +1,131 @@
+# Copyright DataStax, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Sampling of table data to profile the size and cardinality of column values
+
+import logging
+from collections import Counter
+
+from adelphi.anonymize import quote_str
+from adelphi.store import get_column_index
+
+log = logging.getLogger('adelphi')
+
+DEFAULT_SAMPLE_ROWS = 1000
+DEFAULT_TOKEN_RANGES = 16
+
+# Maximum number of distinct lengths used to approximate the length histogram of a column
+MAX_PROFILE_LENGTHS = 10
+
+# Token ranges of the partitioners we know how to page through
+MURMUR3_PARTITIONER = "org.apache.cassandra.dht.Murmur3Partitioner"
+RANDOM_PARTITIONER = "org.apache.cassandra.dht.RandomPartitioner"
+TOKEN_BOUNDS = {
+    MURMUR3_PARTITIONER: (-2 ** 63, 2 ** 63 - 1),
+    RANDOM_PARTITIONER: (-1, 2 ** 127)
+}
+
+
+class ColumnProfile(object):
+    """Value lengths and the number of distinct values seen for a column"""
+
+    def __init__(self):
+        self.count = 0
+        self.lengths = Counter()
+        self.values = set()
+
+
+    def add(self, value):
+        if value is None:
+            return
+        self.count += 1
+        if hasattr(value, "__len__"):
+            self.lengths[len(value)] += 1
+        self.values.add(value)
+
+
+    @property
+    def cardinality(self):
+        return len(self.values)
+
+
+    def is_unique(self):
+        """True if every value seen was distinct, in which case the sample says nothing about the real cardinality"""
+        return self.cardinality == self.count
+
+
+    def length_weights(self, max_lengths=MAX_PROFILE_LENGTHS):
+        """Sorted list of (length, count) pairs approximating the length histogram with at most max_lengths
+        lengths.  Histograms with more distinct lengths are split into max_lengths bins of (nearly) equal counts, each
+        represented by the length at its midpoint."""
+        if len(self.lengths) <= max_lengths:
+            return sorted(self.lengths.items())
+        total = sum(self.lengths.values())
+        # Last (zero-based) position of each length when all lengths seen are sorted
+        ends = []
+        seen = 0
+        for length in sorted(self.lengths):
+            seen += self.lengths[length]
+            ends.append((seen - 1, length))
+        rv = Counter()
+        for idx in range(max_lengths):
+            (start, end) = (idx * total // max_lengths, (idx + 1) * total // max_lengths)
+            if start == end:
+                continue
+            midpoint = (start + end - 1) // 2
+            rv[next(length for (last, length) in ends if last >= midpoint)] += end - start
+        return sorted(rv.items())
+
+
+def token_ranges(partitioner, count):
+    """Split the token ring of partitioner into count contiguous (start, end] ranges.  Returns None if the partitioner
+    doesn't have a numeric token range."""
+    if partitioner not in TOKEN_BOUNDS:
+        return None
+    (lower, upper) = TOKEN_BOUNDS[partitioner]
+    step = (upper - lower) // count
+    starts = [lower + i * step for i in range(count)]
+    return list(zip(starts, starts[1:] + [upper]))
+
+
+def sample_table(session, keyspace, table, partitioner, max_rows=DEFAULT_SAMPLE_ROWS, range_count=DEFAULT_TOKEN_RANGES, columns=None):
+    """Read at most max_rows rows from table and return a dict of column name to ColumnProfile.
+
+    Rows are read from range_count token ranges spread evenly around the ring (rather than from the start of the
+    ring only) with each range limited to its share of max_rows.  Only the named columns are read if columns is
+    specified."""
+    columns = columns or list(table.columns.values())
+    profiles = {col.name: ColumnProfile() for col in columns}
+    select = "SELECT {} FROM {}.{}".format(",".join(quote_str(col.name) for col in columns), quote_str(keyspace.name), quote_str(table.name))
+
+    ranges = token_ranges(partitioner, range_count)
+    if ranges is None:
+        queries = [(select + " LIMIT %s", (max_rows,))]
+    else:
+        pk = ",".join(quote_str(col.name) for col in get_column_index(table).partition_key)
+        range_query = select + " WHERE token({0}) > %s AND token({0}) <= %s LIMIT %s".format(pk)
+        per_range = max(max_rows // len(ranges), 1)
+        queries = ((range_query, (start, end, per_range)) for (start, end) in ranges)
+
+    rows = 0
+    for (query, params) in queries:
+        for row in session.execute(query, params):
+            for (col, value) in zip(columns, row):
+                profiles[col.name].add(value)
+            rows += 1
+        if rows >= max_rows:
+            break
+    log.info("Sampled {} rows from {}.{}".format(rows, keyspace.name, table.name))
+    return profiles
@@ -16,6 +16,8 @@
 # Functions to facilitate interactions with the underlying data store
 
 import logging
+import time
+import weakref
 from itertools import tee
 
 # Account for name change in itertools as of py3k
@@ -24,8 +26,14 @@ try:
 except ImportError:
     from itertools import filterfalse
 
+from cassandra import InvalidRequest, UserAggregateDescriptor, UserFunctionDescriptor
 from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT, default_lbp_factory
 from cassandra.auth import PlainTextAuthProvider
+from cassandra.metadata import SchemaParserV3, SchemaParserV4
+from cassandra.policies import WhiteListRoundRobinPolicy
+
+from adelphi.cache import build_cache_key, get_schema_version
+from adelphi.exceptions import TableSelectionException
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger('adelphi')
@@ -38,6 +46,48 @@ system_keyspaces = set(["system",
                     "system_virtual_schema",
                     "system_views"])
 
+SCHEMA_TABLES = ["keyspaces", "tables", "columns", "types", "indexes", "views", "triggers", "functions", "aggregates"]
+
+# Query used to read every row of a system_schema table for a single keyspace (Cassandra 3.0+)
+KEYSPACE_SCHEMA_QUERY = "SELECT * FROM system_schema.{} WHERE keyspace_name = %s"
+
+# Queries used to discover the names of schema elements within a single keyspace.  Each entry contains the
+# system_schema query used by Cassandra 3.0+ followed by the legacy query for earlier versions.
+TYPE_NAME_QUERIES = ["SELECT type_name FROM system_schema.types WHERE keyspace_name = %s",
+                     "SELECT type_name FROM system.schema_usertypes WHERE keyspace_name = %s"]
+TABLE_NAME_QUERIES = ["SELECT table_name FROM system_schema.tables WHERE keyspace_name = %s",
+                      "SELECT columnfamily_name FROM system.schema_columnfamilies WHERE keyspace_name = %s"]
+VIEW_NAME_QUERIES = ["SELECT view_name, base_table_name FROM system_schema.views WHERE keyspace_name = %s"]
+FUNCTION_NAME_QUERIES = ["SELECT function_name, argument_types FROM system_schema.functions WHERE keyspace_name = %s",
+                         "SELECT function_name, signature FROM system.schema_functions WHERE keyspace_name = %s"]
+AGGREGATE_NAME_QUERIES = ["SELECT aggregate_name, argument_types FROM system_schema.aggregates WHERE keyspace_name = %s",
+                          "SELECT aggregate_name, signature FROM system.schema_aggregates WHERE keyspace_name = %s"]
+
+# Per-table request counts seen by the coordinator (Cassandra 4.0+ only)
+TABLE_READ_COUNT_QUERIES = ["SELECT table_name, count FROM system_views.coordinator_read_latency WHERE keyspace_name = %s"]
+TABLE_WRITE_COUNT_QUERIES = ["SELECT table_name, count FROM system_views.coordinator_write_latency WHERE keyspace_name = %s"]
+
+class RowSchemaParser(SchemaParserV4):
+    """Driver schema parser which builds metadata from pre-loaded system_schema rows (a dict of system_schema table
+    name to a list of rows as dicts) rather than querying a connection.  Table options recognized by either the
+    Cassandra 3.x or 4.x parser are retained."""
+
+    recognized_table_options = tuple(sorted(set(SchemaParserV3.recognized_table_options) | set(SchemaParserV4.recognized_table_options)))
+
+    def __init__(self, rows):
+        super(RowSchemaParser, self).__init__(None, None)
+        self.rows = rows
+
+
+    def _query_all(self):
+        for table in SCHEMA_TABLES:
+            setattr(self, table + "_result", self.rows.get(table, []))
+        self.virtual_keyspaces_result = []
+        self.virtual_tables_result = []
+        self.virtual_columns_result = []
+        self._aggregate_results()
+
+
 def build_auth_provider(username = None,password = None):
     # instantiate auth provider if credentials have been provided
     auth_provider = None
@@ -46,15 +96,178 @@ def build_auth_provider(username = None,password = None):
     return auth_provider
 
 
-def with_cluster(cluster_fn, hosts, port, username = None, password = None):
-    ep = ExecutionProfile(load_balancing_policy=default_lbp_factory())
-    cluster = Cluster(hosts, port=port, auth_provider=build_auth_provider(username,password), execution_profiles={EXEC_PROFILE_DEFAULT: ep})
-    cluster.connect()
-    rv = cluster_fn(cluster)
-    cluster.shutdown()
+def with_cluster(cluster_fn, hosts, port, username = None, password = None, metadata_only = False, keyspaces = None, tables = None, cache = None):
+    """Connect to the cluster, call cluster_fn with the connected cassandra.cluster.Cluster and return its result.
+
+    If metadata_only is set the driver only connects to the contact points (rather than opening connection pools to
+    every node in the cluster) and token metadata is never computed.  Schema metadata is then fetched explicitly so
+    that the time spent connecting can be reported separately from the time spent reading the schema.
+
+    If keyspaces (a list of keyspace names) and/or tables (a list of "keyspace.table" names) are provided only the
+    schema for the selected keyspaces and tables is read from the cluster.  See fetch_keyspace_metadata() for details.
+
+    If cache (an adelphi.cache.SchemaCache) is provided keyspace metadata is read from the cache whenever an entry
+    exists for the current schema version of the cluster.  Schema metadata fetched from the cluster is added to the
+    cache."""
+    scoped = keyspaces is not None or tables is not None
+    if metadata_only:
+        lbp = WhiteListRoundRobinPolicy(hosts)
+    else:
+        lbp = default_lbp_factory()
+    ep = ExecutionProfile(load_balancing_policy=lbp)
+    cluster = Cluster(hosts, port=port, auth_provider=build_auth_provider(username,password), execution_profiles={EXEC_PROFILE_DEFAULT: ep},
+        schema_metadata_enabled=not (metadata_only or scoped or cache), token_metadata_enabled=not metadata_only)
+    try:
+        start = time.time()
+        session = cluster.connect()
+        connected = time.time()
+
+        cache_key = None
+        if cache:
+            schema_version = get_schema_version(session)
+            cache_key = build_cache_key(schema_version, keyspaces, tables) if schema_version else None
+        cached_keyspaces = cache.get(cache_key) if cache_key else None
+
+        if cached_keyspaces is not None:
+            cluster.metadata.keyspaces.update(cached_keyspaces)
+            log.info("Connected to cluster in {:.3f}s, loaded schema metadata from cache in {:.3f}s".format(connected - start, time.time() - connected))
+        elif scoped or metadata_only or cache:
+            if scoped:
+                fetch_keyspace_metadata(cluster, session, keyspaces, tables)
+            else:
+                cluster.refresh_schema_metadata()
+            log.info("Connected to cluster in {:.3f}s, fetched schema metadata in {:.3f}s".format(connected - start, time.time() - connected))
+            if cache_key:
+                cache.put(cache_key, cluster.metadata.keyspaces)
+        else:
+            log.info("Connected to cluster and fetched metadata in {:.3f}s".format(connected - start))
+        return cluster_fn(cluster)
+    finally:
+        cluster.shutdown()
+
+
+def group_table_names(tables):
+    """Convert a list of "keyspace.table" strings into a dict of keyspace name to a list of table names"""
+    rv = {}
+    for table in tables or []:
+        (ks_name, sep, table_name) = table.partition(".")
+        if not sep or not ks_name or not table_name:
+            raise TableSelectionException("Table {} must be specified as keyspace.table".format(table))
+        rv.setdefault(ks_name, []).append(table_name)
+    return rv
+
+
+def _query_rows(session, queries, keyspace):
+    """Execute the first query in the list supported by the cluster and return the resulting rows.  Queries against
+    system tables which don't exist for the current Cassandra version fail with InvalidRequest."""
+    for query in queries:
+        try:
+            return list(session.execute(query, (keyspace,)))
+        except InvalidRequest:
+            log.debug("Query {} not supported by this cluster".format(query))
+    return []
+
+
+def _query_schema_rows(session, keyspace):
+    """Returns a dict of system_schema table name to the rows (as dicts) for keyspace in that table, or None if the
+    cluster doesn't have the system_schema keyspace (Cassandra versions before 3.0)"""
+    rv = {}
+    for table in SCHEMA_TABLES:
+        try:
+            rv[table] = [row._asdict() for row in session.execute(KEYSPACE_SCHEMA_QUERY.format(table), (keyspace,))]
+        except InvalidRequest:
+            log.debug("system_schema.{} not supported by this cluster".format(table))
+            return None
+    return rv
+
+
+def _select_table_rows(rows, table_names):
+    """Restrict system_schema rows for a keyspace to the specified tables and the views (and view columns) on them"""
+    views = [row for row in rows["views"] if row["base_table_name"] in table_names]
+    selected = set(table_names) | set(row["view_name"] for row in views)
+    rv = dict(rows)
+    rv["views"] = views
+    for table in ("tables", "columns", "indexes", "triggers"):
+        rv[table] = [row for row in rows[table] if row["table_name"] in selected]
     return rv
 
 
+def _refresh_keyspace_elements(cluster, session, ks_name, table_names):
+    """Refresh the types, tables, views, functions and aggregates of a keyspace one at a time.  Only used for clusters
+    without system_schema, since each refresh costs several queries."""
+    for row in _query_rows(session, TYPE_NAME_QUERIES, ks_name):
+        cluster.refresh_user_type_metadata(ks_name, row[0], max_schema_agreement_wait=0)
+
+    table_names = table_names or [row[0] for row in _query_rows(session, TABLE_NAME_QUERIES, ks_name)]
+    for table_name in table_names:
+        cluster.refresh_table_metadata(ks_name, table_name, max_schema_agreement_wait=0)
+
+    for row in _query_rows(session, VIEW_NAME_QUERIES, ks_name):
+        if row[1] in table_names:
+            cluster.refresh_materialized_view_metadata(ks_name, row[0], max_schema_agreement_wait=0)
+
+    for row in _query_rows(session, FUNCTION_NAME_QUERIES, ks_name):
+        cluster.refresh_user_function_metadata(ks_name, UserFunctionDescriptor(row[0], row[1]), max_schema_agreement_wait=0)
+
+    for row in _query_rows(session, AGGREGATE_NAME_QUERIES, ks_name):
+        cluster.refresh_user_aggregate_metadata(ks_name, UserAggregateDescriptor(row[0], row[1]), max_schema_agreement_wait=0)
+
+
+def fetch_keyspace_metadata(cluster, session, keyspaces, tables = None):
+    """Populate cluster.metadata with the schema for the specified keyspaces only.
+
+    The driver's refresh of the full schema reads every row of the system schema tables for every keyspace in the
+    cluster.  Here we instead read the rows of each system_schema table restricted to a single keyspace and build the
+    keyspace metadata from them, so each keyspace costs a fixed number of queries regardless of how many tables it
+    contains.  If tables is provided only the listed tables (and views on those tables) are kept for the corresponding
+    keyspaces.  Clusters without system_schema fall back to refreshing each element of a keyspace individually."""
+    tables_by_ks = group_table_names(tables)
+    ks_names = list(keyspaces or [])
+    ks_names.extend(ks for ks in tables_by_ks if ks not in ks_names)
+
+    # Wait for schema agreement once before the first refresh.  Every subsequent refresh bypasses the agreement
+    # check which would otherwise cost two additional queries for every keyspace we read.
+    wait = None
+    for ks_name in ks_names:
+        start = time.time()
+        cluster.refresh_keyspace_metadata(ks_name, max_schema_agreement_wait=wait)
+        wait = 0
+        if ks_name not in cluster.metadata.keyspaces:
+            log.info("Keyspace {} not found".format(ks_name))
+            continue
+
+        rows = _query_schema_rows(session, ks_name)
+        if rows is None:
+            _refresh_keyspace_elements(cluster, session, ks_name, tables_by_ks.get(ks_name))
+        else:
+            if ks_name in tables_by_ks:
+                rows = _select_table_rows(rows, tables_by_ks[ks_name])
+            for keyspace in RowSchemaParser(rows).get_all_keyspaces():
+                cluster.metadata.keyspaces[keyspace.name] = keyspace
+        log.debug("Fetched schema metadata for keyspace {} in {:.3f}s".format(ks_name, time.time() - start))
+
+
+def get_session(cluster):
+    """Returns a session for cluster, re-using the session opened by with_cluster() if it's still available.  Returns
+    None if cluster isn't backed by a database (such as an adelphi.offline.OfflineCluster)."""
+    if not hasattr(cluster, "connect"):
+        return None
+    for session in list(cluster.sessions):
+        if not session.is_shutdown:
+            return session
+    return cluster.connect()
+
+
+def fetch_table_traffic(session, keyspace):
+    """Returns a dict of table name to a (reads, writes) tuple of the requests for each table in keyspace seen by the
+    coordinator, or None if the cluster doesn't expose table metrics"""
+    reads = dict((row[0], row[1]) for row in _query_rows(session, TABLE_READ_COUNT_QUERIES, keyspace))
+    writes = dict((row[0], row[1]) for row in _query_rows(session, TABLE_WRITE_COUNT_QUERIES, keyspace))
+    if not reads and not writes:
+        return None
+    return {name: (reads.get(name, 0), writes.get(name, 0)) for name in set(reads) | set(writes)}
+
+
 def build_keyspace_objects(keyspaces, metadata):
     """Build a list of cassandra.metadata.KeyspaceMetadata objects from a list of strings and a c.m.Metadata instance.  System keyspaces will be excluded."""
     all_keyspace_objs = [metadata.keyspaces[ks] for ks in keyspaces] if keyspaces is not None else metadata.keyspaces.values()
@@ -70,19 +283,87 @@ def build_keyspace_objects(keyspaces, metadata):
     return passed
 
 
+# Column kinds, using the same values as the "kind" column in system_schema.columns
+PARTITION_KEY = "partition_key"
+CLUSTERING = "clustering"
+STATIC = "static"
+REGULAR = "regular"
+
+
+class ColumnRole(object):
+    """The kind of a column within its table and its position within the partition or clustering key (or -1)"""
+    __slots__ = ("column", "kind", "position")
+
+    def __init__(self, column, kind, position=-1):
+        self.column = column
+        self.kind = kind
+        self.position = position
+
+
+class TableColumnIndex(object):
+    """
+    Partition key, clustering key, static and regular columns of a table along with a
+    lookup of column roles by (current) column name.  Lists of columns preserve the
+    order of the underlying table metadata.
+    """
+    __slots__ = ("partition_key", "clustering_key", "primary_key", "static", "regular", "non_key", "roles", "__weakref__")
+
+    def __init__(self, table_metadata):
+        self.partition_key = list(table_metadata.partition_key)
+        self.clustering_key = list(table_metadata.clustering_key)
+        self.primary_key = self.partition_key + self.clustering_key
+
+        self.roles = {}
+        for (idx, c) in enumerate(self.partition_key):
+            self.roles[c.name] = ColumnRole(c, PARTITION_KEY, idx)
+        for (idx, c) in enumerate(self.clustering_key):
+            self.roles[c.name] = ColumnRole(c, CLUSTERING, idx)
+
+        self.static = []
+        self.regular = []
+        self.non_key = []
+        for c in table_metadata.columns.values():
+            if c.name in self.roles:
+                continue
+            if c.is_static:
+                self.roles[c.name] = ColumnRole(c, STATIC)
+                self.static.append(c)
+            else:
+                self.roles[c.name] = ColumnRole(c, REGULAR)
+                self.regular.append(c)
+            self.non_key.append(c)
+
+
+    def role(self, name):
+        return self.roles.get(name)
+
+
+    def is_primary_key(self, name):
+        role = self.roles.get(name)
+        return role is not None and role.kind in (PARTITION_KEY, CLUSTERING)
+
+
+# Indexes are built on first use and shared by everything operating on the same table metadata
+_column_indexes = weakref.WeakKeyDictionary()
+
+def get_column_index(table_metadata):
+    rv = _column_indexes.get(table_metadata)
+    if rv is None:
+        rv = TableColumnIndex(table_metadata)
+        _column_indexes[table_metadata] = rv
+    return rv
+
+
+def invalidate_column_index(table_metadata):
+    """Must be called after columns are renamed, added or removed"""
+    _column_indexes.pop(table_metadata, None)
+
+
 def get_standard_columns_from_table_metadata(table_metadata):
     """
     Return the standard columns and ensure to exclude pk and ck ones.
     """
-    partition_column_names = [c.name for c in table_metadata.partition_key]
-    clustering_column_names = [c.name for c in table_metadata.clustering_key]
-    standard_columns = []
-    for c in list(table_metadata.columns.values()):
-        if (c.name not in clustering_column_names
-                and c.name not in partition_column_names):
-            standard_columns.append(c)
-
-    return standard_columns
+    return get_column_index(table_metadata).non_key
 
 
 def set_replication_factor(selected_keyspaces, factor):
@@ -0,0 +1,116 @@
+# Copyright DataStax, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Functions to build large synthetic schemas from an exported one.  Each synthetic keyspace is modelled on one of the
+# source keyspaces and filled with copies of its tables, after which every name is replaced using the anonymization
+# naming scheme.
+import copy
+import logging
+import pickle
+
+from adelphi.anonymize import Anonymizer
+from adelphi.exceptions import KeyspaceSelectionException
+from adelphi.offline import OfflineCluster
+from adelphi.store import build_keyspace_objects
+
+log = logging.getLogger('adelphi')
+
+# Copies of keyspaces, tables and indexes are named by prefixing the original name with the (zero-padded) number of
+# the copy before anonymization replaces the names.  Anonymized names are assigned in sorted order so copies are
+# numbered in the order they were made.
+COPY_NAME = "{:010d}#{}"
+
+
+def copy_name(name, idx):
+    return COPY_NAME.format(idx, name)
+
+
+def copy_keyspace(keyspace, name):
+    """Copy keyspace (without any tables, views, functions or aggregates) under a new name"""
+    rv = copy.copy(keyspace)
+    rv.name = name
+    rv.replication_strategy = copy.deepcopy(keyspace.replication_strategy)
+    rv.tables = {}
+    rv.indexes = {}
+    rv.views = {}
+    rv.functions = {}
+    rv.aggregates = {}
+    rv.user_types = {}
+    for (udt_name, udt) in keyspace.user_types.items():
+        udt_copy = copy.deepcopy(udt)
+        udt_copy.keyspace = name
+        rv.user_types[udt_name] = udt_copy
+    return rv
+
+
+def build_table_template(table):
+    # Unpickling a table is considerably faster than deep copying it, which matters when building thousands of copies
+    return pickle.dumps(table, pickle.HIGHEST_PROTOCOL)
+
+
+def copy_table(template, keyspace_name, idx):
+    """Copy the table serialized in template (see build_table_template()) into the keyspace keyspace_name.  The names
+    of the table and its indexes are made unique to the copy so that they're given distinct names when anonymized."""
+    rv = pickle.loads(template)
+    rv.keyspace_name = keyspace_name
+    rv.name = copy_name(rv.name, idx)
+    rv.views = {}
+    indexes = list(rv.indexes.values())
+    rv.indexes = {}
+    for index in indexes:
+        index.keyspace_name = keyspace_name
+        index.table_name = rv.name
+        index.name = copy_name(index.name, idx)
+        rv.indexes[index.name] = index
+    return rv
+
+
+def synthesize_keyspaces(keyspaces, keyspace_count, table_count, anonymizer=None):
+    """Returns a list of keyspace_count KeyspaceMetadata objects with table_count tables each.  Synthetic keyspace n
+    is modelled on keyspaces[n % len(keyspaces)] and its tables are copies of the tables of that keyspace taken in
+    turn, so the column types and primary key structures of each source keyspace are reproduced in proportion.
+    Raises KeyspaceSelectionException if none of the keyspaces contain any tables."""
+    keyspaces = [ks for ks in sorted(keyspaces, key=lambda ks: ks.name) if ks.tables]
+    if not keyspaces:
+        raise KeyspaceSelectionException("Unable to synthesize a schema from keyspaces without tables")
+    anonymizer = anonymizer or Anonymizer()
+    templates_by_keyspace = {}
+    rv = []
+    for ks_idx in range(keyspace_count):
+        source = keyspaces[ks_idx % len(keyspaces)]
+        keyspace = copy_keyspace(source, copy_name(source.name, ks_idx))
+        templates = templates_by_keyspace.get(source.name)
+        if templates is None:
+            templates = [build_table_template(t) for t in sorted(source.tables.values(), key=lambda t: t.name)]
+            templates_by_keyspace[source.name] = templates
+        for table_idx in range(table_count):
+            table = copy_table(templates[table_idx % len(templates)], keyspace.name, table_idx)
+            keyspace.tables[table.name] = table
+        anonymizer.anonymize_keyspace(keyspace)
+        # Anonymization renames objects without updating the dicts containing them
+        keyspace.tables = {table.name: table for table in keyspace.tables.values()}
+        keyspace.user_types = {udt.name: udt for udt in keyspace.user_types.values()}
+        rv.append(keyspace)
+    log.info("Synthesized {} keyspaces of {} tables from {}".format(keyspace_count, table_count, ",".join(ks.name for ks in keyspaces)))
+    return rv
+
+
+def synthesize_cluster(cluster, keyspace_names, keyspace_count, table_count):
+    """Returns an OfflineCluster whose only keyspaces are synthesized from the selected keyspaces (all non-system
+    keyspaces if keyspace_names is None) of cluster.  Host metadata of cluster is retained."""
+    keyspaces = synthesize_keyspaces(build_keyspace_objects(keyspace_names, cluster.metadata), keyspace_count, table_count)
+    metadata = copy.copy(cluster.metadata)
+    metadata.keyspaces = {ks.name: ks for ks in keyspaces}
+    return OfflineCluster(metadata)
@@ -0,0 +1,39 @@
+# Compares the single-pass anonymize_type() against the previous implementation (one str.replace()
+# per known UDT) for an increasing number of UDTs.  Run from the package root:
+#
+#     python -m tests.benchmark.bench_anonymize
+
+import timeit
+
+from adelphi import anonymize
+from adelphi.anonymize import TYPE_PREFIX, get_name
+
+UDT_COUNTS = [10, 100, 500, 1000]
+COLUMN_COUNT = 1000
+
+def replace_all_anonymize_type(original_type):
+    name = original_type
+    for udt in anonymize.name_map[TYPE_PREFIX]:
+        name = name.replace(udt, anonymize.name_map[TYPE_PREFIX][udt])
+    return name
+
+
+def build_types(udt_count):
+    anonymize.name_map[TYPE_PREFIX] = {}
+    udt_names = ["user_type_{}".format(i) for i in range(udt_count)]
+    for udt_name in udt_names:
+        get_name(udt_name, TYPE_PREFIX)
+    return ["map<text, frozen<{}>>".format(udt_names[i % udt_count]) for i in range(COLUMN_COUNT)]
+
+
+def time_fn(fn, types):
+    return min(timeit.repeat(lambda: [fn(t) for t in types], number=1, repeat=3))
+
+
+if __name__ == "__main__":
+    print("{:>6} {:>14} {:>14} {:>8}".format("UDTs", "replace (ms)", "single (ms)", "speedup"))
+    for udt_count in UDT_COUNTS:
+        types = build_types(udt_count)
+        old = time_fn(replace_all_anonymize_type, types)
+        new = time_fn(anonymize.anonymize_type, types)
+        print("{:>6} {:>14.2f} {:>14.2f} {:>7.1f}x".format(udt_count, old * 1000, new * 1000, old / new))
@@ -0,0 +1,248 @@
+# Times and memory-profiles anonymization, scoped schema fetches and each exporter against synthetic keyspaces of an increasing number of
+# tables, built from the unit test schema using adelphi.synth.  No cluster is required.  Results are compared against
+# the baselines stored in baselines.json and any operation slower (or using more memory) than its baseline by more
+# than the tolerance is reported as a regression, in which case the exit status is non-zero.  Run from the package
+# root:
+#
+#     python -m tests.benchmark.bench_export
+#     python -m tests.benchmark.bench_export --table-counts=10,100 --update-baselines
+#
+# Memory profiling with tracemalloc slows operations down by an order of magnitude and adds its own bookkeeping to the
+# memory used, so the largest fixtures can be timed on their own with --skip-memory.  Baselines updated from such a
+# run keep any peak memory already stored for them.
+#
+# Baselines depend on the machine they were recorded on, so they should be updated (with --update-baselines) when
+# comparing runs on a different machine.
+
+import argparse
+import gc
+import json
+import logging
+import os.path
+import sys
+import time
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from cassandra.metadata import KeyspaceMetadata, Metadata
+
+from adelphi.anonymize import Anonymizer
+from adelphi.cql import CqlExporter
+from adelphi.gemini import GeminiExporter
+from adelphi.nb import NbExporter
+from adelphi.offline import CqlSchemaReader, OfflineCluster
+from adelphi.store import fetch_keyspace_metadata
+from adelphi.synth import synthesize_keyspaces
+from tests.util.schema_util import get_schema
+
+TABLE_COUNTS = [10, 100, 1000, 10000, 50000]
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# Fractional increase over the baseline tolerated before a result is flagged as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# Increases smaller than these are never flagged since the timings of small fixtures vary by more than the tolerance
+NOISE_FLOOR = {"seconds": 0.05, "peak_mb": 1.0}
+
+# Results are the best of this many runs for fixtures of up to REPEAT_MAX_TABLES tables and of a single run otherwise
+REPEAT = 3
+REPEAT_MAX_TABLES = 1000
+
+# Simulated network latency for each query issued while fetching schema metadata
+ROUND_TRIP_SECONDS = 0.002
+
+
+def build_keyspace(table_count):
+    return synthesize_keyspaces([get_schema().keyspaces[0]], 1, table_count)[0]
+
+
+def build_cluster(keyspace):
+    metadata = Metadata()
+    metadata.keyspaces = {keyspace.name: keyspace}
+    return OfflineCluster(metadata)
+
+
+def build_props():
+    return {"keyspace-names": None, "rf": None, "anonymize": False, "purpose": None, "maturity": None,
+            "rampup-cycles": 1000, "main-cycles": 1000}
+
+
+class SchemaRow(dict):
+
+    def _asdict(self):
+        return self
+
+
+class SchemaSession(object):
+    """Serves system_schema rows for a single keyspace, taking ROUND_TRIP_SECONDS to answer each query"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params):
+        time.sleep(ROUND_TRIP_SECONDS)
+        table = query.split("FROM system_schema.")[1].split()[0]
+        return [SchemaRow(row) for row in self.rows.get(table, [])]
+
+
+class SchemaCluster(object):
+
+    def __init__(self):
+        self.metadata = Metadata()
+
+    def refresh_keyspace_metadata(self, keyspace, max_schema_agreement_wait=None):
+        time.sleep(ROUND_TRIP_SECONDS)
+        self.metadata.keyspaces[keyspace] = KeyspaceMetadata(keyspace, True, "SimpleStrategy", {"replication_factor": 1})
+
+
+def build_schema_rows(keyspace):
+    """Returns the system_schema rows for keyspace along with its name"""
+    return (keyspace.name, CqlSchemaReader().read(keyspace.export_as_string().splitlines(True)))
+
+
+def run_anonymize(keyspace):
+    Anonymizer().anonymize_keyspace(keyspace)
+
+
+def run_fetch(schema_rows):
+    (name, rows) = schema_rows
+    fetch_keyspace_metadata(SchemaCluster(), SchemaSession(rows), [name])
+
+
+def run_cql(keyspace):
+    CqlExporter(build_cluster(keyspace), build_props()).export_schema()
+
+
+def run_gemini(keyspace):
+    GeminiExporter(build_cluster(keyspace), build_props()).export_schema()
+
+
+def run_nb(keyspace):
+    NbExporter(build_cluster(keyspace), build_props()).export_schema()
+
+
+# Operations along with whether they modify the keyspace (and so require a fresh fixture for every run)
+OPERATIONS = [("anonymize", run_anonymize, True), ("fetch", run_fetch, False), ("cql", run_cql, False),
+              ("gemini", run_gemini, False), ("nb", run_nb, False)]
+
+# Conversions of the keyspace into the fixture expected by an operation, applied before the operation is timed
+FIXTURES = {"fetch": build_schema_rows}
+
+
+def time_operation(fn, fixture_fn, repeat):
+    rv = []
+    for _ in range(repeat):
+        keyspace = fixture_fn()
+        gc.collect()
+        start = timeit.default_timer()
+        fn(keyspace)
+        rv.append(timeit.default_timer() - start)
+    return min(rv)
+
+
+def measure_peak_mb(fn, fixture_fn):
+    """Peak memory allocated by fn (excluding the fixture) in megabytes, or None if tracemalloc isn't available"""
+    if tracemalloc is None:
+        return None
+    keyspace = fixture_fn()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(keyspace)
+        return tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(table_counts, operations, skip_memory=False):
+    """Returns a dict of operation name to a dict of table count (as a string, matching the stored baselines) to a
+    dict containing the time taken in seconds and the peak memory in megabytes (None if skip_memory is set)"""
+    results = {name: {} for (name, _, _) in operations}
+    for table_count in table_counts:
+        shared = build_keyspace(table_count)
+        for (name, fn, mutates) in operations:
+            convert = FIXTURES.get(name, lambda keyspace: keyspace)
+            if mutates:
+                fixture_fn = lambda: convert(build_keyspace(table_count))
+            else:
+                fixture = convert(shared)
+                fixture_fn = lambda: fixture
+            repeat = REPEAT if table_count <= REPEAT_MAX_TABLES else 1
+            seconds = time_operation(fn, fixture_fn, repeat)
+            peak_mb = None if skip_memory else measure_peak_mb(fn, fixture_fn)
+            results[name][str(table_count)] = {"seconds": round(seconds, 4), "peak_mb": round(peak_mb, 2) if peak_mb is not None else None}
+            print("{:>10} {:>7} {:>12.3f} {:>12}".format(name, table_count, seconds, "{:.1f}".format(peak_mb) if peak_mb is not None else "-"))
+            sys.stdout.flush()
+    return results
+
+
+def find_regressions(results, baselines, tolerance):
+    """Returns a list of (operation, table count, metric, baseline, result) tuples for each result exceeding its
+    baseline by more than tolerance (and by more than the noise floor for the metric).  Results without a baseline are
+    ignored."""
+    rv = []
+    for (name, by_count) in sorted(results.items()):
+        for (table_count, result) in sorted(by_count.items(), key=lambda item: int(item[0])):
+            baseline = baselines.get(name, {}).get(table_count, {})
+            for (metric, floor) in sorted(NOISE_FLOOR.items()):
+                (value, expected) = (result.get(metric), baseline.get(metric))
+                if value is None or not expected:
+                    continue
+                if value > expected * (1 + tolerance) and value - expected > floor:
+                    rv.append((name, table_count, metric, expected, value))
+    return rv
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(path, baselines, results):
+    for (name, by_count) in results.items():
+        for (table_count, result) in by_count.items():
+            baselines.setdefault(name, {}).setdefault(table_count, {}).update((k, v) for (k, v) in result.items() if v is not None)
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=4, sort_keys=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark anonymization and export of synthetic schemas")
+    parser.add_argument("--table-counts", default=",".join(str(c) for c in TABLE_COUNTS),
+                        help="Comma-separated list of the number of tables in each fixture")
+    parser.add_argument("--operations", default=",".join(name for (name, _, _) in OPERATIONS),
+                        help="Comma-separated list of operations to benchmark")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Fractional increase over a baseline reported as a regression")
+    parser.add_argument("--baselines", default=BASELINES_PATH, help="File containing baseline results")
+    parser.add_argument("--skip-memory", action="store_true", help="Only time operations, without profiling their memory use")
+    parser.add_argument("--update-baselines", action="store_true", help="Store the results as the new baselines")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Exporters log progress for every keyspace, which would drown out the results
+    logging.getLogger("adelphi").setLevel(logging.WARNING)
+
+    operations = [op for op in OPERATIONS if op[0] in args.operations.split(",")]
+    print("{:>10} {:>7} {:>12} {:>12}".format("operation", "tables", "time (s)", "peak (MB)"))
+    results = run_benchmarks([int(c) for c in args.table_counts.split(",")], operations, args.skip_memory)
+
+    baselines = load_baselines(args.baselines)
+    if args.update_baselines:
+        save_baselines(args.baselines, baselines, results)
+        print("Baselines written to {}".format(args.baselines))
+        sys.exit(0)
+
+    regressions = find_regressions(results, baselines, args.tolerance)
+    for (name, table_count, metric, baseline, result) in regressions:
+        print("REGRESSION: {} with {} tables: {} {} exceeds baseline {} by more than {:.0%}".format(
+            name, table_count, metric, result, baseline, args.tolerance))
+    sys.exit(1 if regressions else 0)
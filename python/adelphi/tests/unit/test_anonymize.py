@@ -6,8 +6,13 @@ from adelphi.anonymize import KEYSPACE_PREFIX,\
 	FIELD_PREFIX,\
 	INDEX_PREFIX,\
 	get_name
+from adelphi.anonymize import Anonymizer
 from tests.util.schema_util import get_schema
 
+import os
+import shutil
+import tempfile
+
 try:
     import unittest2 as unittest
 except ImportError:
@@ -149,6 +154,19 @@ class TestCqlAnonymize(unittest.TestCase):
 		anonymize.anonymize_table(table)
 		self.assertTrue(table.options["comment"] == "")
 
+	def test_anonymize_type_matches_whole_identifiers(self):
+		address = get_name("address", TYPE_PREFIX)
+		address_v2 = get_name("address_v2", TYPE_PREFIX)
+		self.assertEqual(anonymize.anonymize_type("frozen<address_v2>"), "frozen<%s>" % address_v2)
+		self.assertEqual(anonymize.anonymize_type("map<frozen<address>, frozen<address_v2>>"),\
+			"map<frozen<%s>, frozen<%s>>" % (address, address_v2))
+		self.assertEqual(anonymize.anonymize_type("frozen<address_v3>"), "frozen<address_v3>")
+
+	def test_anonymize_type_quoted_identifiers(self):
+		udt = get_name("Address", TYPE_PREFIX)
+		self.assertEqual(anonymize.anonymize_type('list<frozen<"Address">>'), "list<frozen<%s>>" % udt)
+		self.assertEqual(anonymize.anonymize_type('list<frozen<"address">>'), 'list<frozen<"address">>')
+
 	def test_anonymous_name_is_consistent(self):
 		name1 = get_name("test_column", COLUMN_PREFIX)
 		name2 = get_name("test_column", COLUMN_PREFIX)
@@ -156,5 +174,37 @@ class TestCqlAnonymize(unittest.TestCase):
 		self.assertEqual(name1, name2)
 		self.assertNotEqual(name1, name3)
 
+class TestAnonymizer(unittest.TestCase):
+
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpdir)
+
+	def test_instances_are_independent(self):
+		a1 = Anonymizer()
+		a2 = Anonymizer()
+		a1.get_name("foo", COLUMN_PREFIX)
+		self.assertEqual(a2.get_name("bar", COLUMN_PREFIX), "col_0")
+		self.assertNotIn("bar", a1.name_map[COLUMN_PREFIX])
+		self.assertNotIn("foo", anonymize.name_map[COLUMN_PREFIX])
+
+	def test_saved_names_are_stable(self):
+		path = os.path.join(self.tmpdir, "names.json")
+		anonymizer = Anonymizer()
+		keyspace = anonymizer.anonymize_keyspace(get_schema().keyspaces[0])
+		anonymizer.save(path)
+
+		loaded = Anonymizer.load(path)
+		self.assertEqual(loaded.name_map, anonymizer.name_map)
+		reloaded_keyspace = loaded.anonymize_keyspace(get_schema().keyspaces[0])
+		self.assertEqual(reloaded_keyspace.export_as_string(), keyspace.export_as_string())
+
+		# Only new identifiers are assigned new names
+		table_count = len(loaded.name_map[TABLE_PREFIX])
+		self.assertEqual(loaded.get_name("my_table_0", TABLE_PREFIX), anonymizer.name_map[TABLE_PREFIX]["my_table_0"])
+		self.assertEqual(loaded.get_name("new_table", TABLE_PREFIX), "tbl_%s" % table_count)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import time
+
+import adelphi.cache
+from adelphi.cache import SchemaCache, build_cache_key
+from tests.util.schema_util import get_schema
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+class TestSchemaCache(unittest.TestCase):
+
+	def setUp(self):
+		self.cache_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.cache_dir)
+
+	def keyspaces(self):
+		return {ks.name: ks for ks in get_schema().keyspaces}
+
+	def age_entry(self, key, seconds):
+		path = os.path.join(self.cache_dir, key + ".pickle")
+		then = time.time() - seconds
+		os.utime(path, (then, then))
+
+	def test_round_trip(self):
+		cache = SchemaCache(self.cache_dir)
+		keyspaces = self.keyspaces()
+		cache.put("foo", keyspaces)
+		cached = cache.get("foo")
+		self.assertEqual(sorted(cached.keys()), sorted(keyspaces.keys()))
+		for name in keyspaces:
+			self.assertEqual(cached[name].export_as_string(), keyspaces[name].export_as_string())
+
+	def test_missing_entry(self):
+		self.assertIsNone(SchemaCache(self.cache_dir).get("foo"))
+
+	def test_expired_entry(self):
+		cache = SchemaCache(self.cache_dir, max_age=60)
+		cache.put("foo", self.keyspaces())
+		self.age_entry("foo", 120)
+		self.assertIsNone(cache.get("foo"))
+		self.assertEqual(os.listdir(self.cache_dir), [])
+
+	def test_used_entry_expires(self):
+		class Clock(object):
+			def __init__(self):
+				self.now = time.time()
+			def time(self):
+				return self.now
+		clock = Clock()
+		adelphi.cache.time = clock
+		try:
+			# An entry created 40 seconds ago is used now
+			cache = SchemaCache(self.cache_dir, max_age=60)
+			clock.now -= 40
+			cache.put("foo", self.keyspaces())
+			self.age_entry("foo", 40)
+			clock.now += 40
+			self.assertIsNotNone(cache.get("foo"))
+			# Using the entry doesn't extend its lifetime
+			clock.now += 30
+			self.assertIsNone(cache.get("foo"))
+			self.assertEqual(os.listdir(self.cache_dir), [])
+		finally:
+			adelphi.cache.time = time
+
+	def test_size_eviction(self):
+		cache = SchemaCache(self.cache_dir)
+		cache.put("foo", self.keyspaces())
+		entry_size = os.path.getsize(os.path.join(self.cache_dir, "foo.pickle"))
+		self.age_entry("foo", 20)
+		cache.put("bar", self.keyspaces())
+		self.age_entry("bar", 10)
+
+		# Reading "foo" makes it the most recently used entry so "bar" is evicted first
+		cache.get("foo")
+		cache.max_bytes = entry_size * 2
+		cache.put("baz", self.keyspaces())
+		self.assertEqual(sorted(os.listdir(self.cache_dir)), ["baz.pickle", "foo.pickle"])
+
+	def test_cache_key(self):
+		self.assertEqual(build_cache_key("v1", ["a", "b"]), build_cache_key("v1", ["b", "a"]))
+		self.assertNotEqual(build_cache_key("v1", ["a"]), build_cache_key("v2", ["a"]))
+		self.assertNotEqual(build_cache_key("v1", ["a"]), build_cache_key("v1", ["a"], ["a.t"]))
+
+if __name__ == "__main__":
+    unittest.main()
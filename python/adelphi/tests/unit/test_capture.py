@@ -0,0 +1,105 @@
+import random
+
+from adelphi.capture import Statement, FrequentItems, TrafficCapture, estimate_zipf_exponent, iter_capture_queries, normalize_query, parse_statement
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+FQL_DUMP = """Type: single-query
+Query start time: 1600000000000
+Protocol version: 5
+Generated timestamp:-9223372036854775808
+Generated nowInSeconds:1600000000
+Keyspace: other
+Query: SELECT * FROM ks.t WHERE id = ?
+Values:
+-----
+00 00 00 01
+-----
+Type: batch
+Query start time: 1600000000001
+Protocol version: 5
+Batch type: UNLOGGED
+Query: INSERT INTO ks.t (id) VALUES (?)
+Values:
+-----
+00 00 00 02
+Query: INSERT INTO ks.t (id) VALUES (?)
+Values:
+-----
+00 00 00 03
+"""
+
+TRACE_CSV = """session_id,client,command,coordinator,duration,parameters,request,started_at
+1,127.0.0.1,QUERY,127.0.0.1,100,"{'consistency_level': 'ONE', 'query': 'SELECT * FROM ks.t WHERE id = 1 AND v = ''x'''}",Execute CQL3 query,2020-01-01
+2,127.0.0.1,EXECUTE,127.0.0.1,100,"{'bound_var_0_id': '7', 'query': 'SELECT * FROM ks.t WHERE id = ?'}",Execute CQL3 prepared query,2020-01-01
+"""
+
+class TestCapture(unittest.TestCase):
+
+	def test_normalize_query(self):
+		(signature, keys) = normalize_query("SELECT  * FROM \"Ks1\".t2 WHERE id = 5 AND ts >= '2020-01-01' AND u = 0x0a")
+		self.assertEqual(signature, "SELECT * FROM \"Ks1\".t2 WHERE id = ? AND ts >= ? AND u = ?")
+		self.assertEqual(keys, ["5", "'2020-01-01'", "0x0a"])
+		# Only literals in the where clause identify the keys accessed
+		self.assertEqual(normalize_query("UPDATE t SET v = 'a' WHERE id = 3")[1], ["3"])
+
+	def test_parse_statement(self):
+		self.assertEqual(parse_statement("SELECT * FROM ks.t WHERE id = ? AND (c1, c2) > (?, ?) LIMIT ?"),
+			Statement("select", "ks", "t", (("id", "="), ("c1", ">"), ("c2", ">")), False, None))
+		self.assertEqual(parse_statement('insert into "Ks"."T" (a, b) values (?, ?) using ttl ?'),
+			Statement("insert", "Ks", "T", (), True, None))
+		self.assertEqual(parse_statement("UPDATE t SET v = ? WHERE id IN ?"), Statement("update", None, "t", (("id", "in"),), False, None))
+		self.assertEqual(parse_statement("DELETE FROM t WHERE id = ?"), Statement("delete", None, "t", (("id", "="),), False, None))
+		self.assertEqual(parse_statement("BEGIN BATCH INSERT INTO t (a) VALUES (?); INSERT INTO t (a) VALUES (?); APPLY BATCH").batch, "logged")
+		self.assertEqual(parse_statement("BEGIN UNLOGGED BATCH DELETE FROM t WHERE id = ?; APPLY BATCH;").batch, "unlogged")
+		self.assertIsNone(parse_statement("CREATE TABLE t (a int PRIMARY KEY)"))
+
+	def test_fql_dump(self):
+		self.assertEqual(list(iter_capture_queries(FQL_DUMP.splitlines(True))),
+			[("SELECT * FROM ks.t WHERE id = ?", ["00 00 00 01"], "other"),
+			("BEGIN UNLOGGED BATCH INSERT INTO ks.t (id) VALUES (?); INSERT INTO ks.t (id) VALUES (?); APPLY BATCH", None, None)])
+
+	def test_trace_csv(self):
+		self.assertEqual(list(iter_capture_queries(TRACE_CSV.splitlines(True))),
+			[("SELECT * FROM ks.t WHERE id = 1 AND v = 'x'", None, None), ("SELECT * FROM ks.t WHERE id = ?", ["7"], None)])
+
+	def test_frequent_items(self):
+		items = FrequentItems(10)
+		for i in range(1000):
+			items.add("hot" if i % 2 == 0 else str(i))
+		# The heavy hitter survives while the tail is bounded by the capacity
+		self.assertLessEqual(len(items.counts), 10)
+		self.assertGreater(items.counts["hot"], 400)
+
+	def test_signatures_are_bounded(self):
+		capture = TrafficCapture(key_capacity=10, max_signatures=2)
+		for i in range(100):
+			capture.add("SELECT * FROM ks.t{} WHERE id = {}".format(i % 4, i))
+		self.assertEqual(capture.queries, 100)
+		self.assertEqual(len(capture.signatures), 2)
+		self.assertEqual(capture.untracked, 50)
+
+	def test_session_keyspace(self):
+		capture = TrafficCapture()
+		capture.add("SELECT * FROM t WHERE id = 1", keyspace="ks1")
+		capture.add("SELECT * FROM t WHERE id = 2", keyspace="ks2")
+		capture.add("SELECT * FROM ks3.t WHERE id = 3", keyspace="ks1")
+		capture.add("SELECT * FROM t WHERE id = 4")
+		# Only unqualified tables take the keyspace of the session
+		self.assertEqual(sorted((statement.keyspace or "", count) for (statement, count, _) in capture.statements()),
+			[("", 1), ("ks1", 1), ("ks2", 1), ("ks3", 1)])
+
+	def test_zipf_exponent(self):
+		# Accesses to 5000 keys with counts following a zipf distribution, in random order
+		keys = [rank for rank in range(1, 5001) for _ in range(int(round(20000 / rank ** 1.2)))]
+		random.Random(42).shuffle(keys)
+		capture = TrafficCapture()
+		for key in keys:
+			capture.add("SELECT * FROM ks.t WHERE id = {}".format(key))
+		(_, _, counts) = next(capture.statements())
+		self.assertAlmostEqual(estimate_zipf_exponent(counts), 1.2, delta=0.2)
+		self.assertAlmostEqual(estimate_zipf_exponent([1000.0 / r for r in range(1, 50)]), 1.0)
+		self.assertIsNone(estimate_zipf_exponent([10, 5, 2]))
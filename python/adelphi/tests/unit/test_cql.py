@@ -0,0 +1,55 @@
+from cassandra.metadata import Metadata
+
+from adelphi.cql import CqlExporter, add_if_not_exists
+from adelphi.offline import OfflineCluster
+from tests.util.schema_util import get_schema
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+def build_cluster():
+	metadata = Metadata()
+	metadata.keyspaces = {ks.name: ks for ks in get_schema().keyspaces}
+	return OfflineCluster(metadata)
+
+def build_props(**kwargs):
+	props = {"keyspace-names": None, "rf": None, "anonymize": False, "purpose": None, "maturity": None}
+	props.update(kwargs)
+	return props
+
+class TestCqlExporter(unittest.TestCase):
+
+	def setUp(self):
+		self.cluster = build_cluster()
+
+	def expected_schema(self, ks_names):
+		cql_str = "\n\n".join(self.cluster.metadata.keyspaces[name].export_as_string() for name in ks_names)
+		return cql_str.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS") \
+			.replace("CREATE KEYSPACE", "CREATE KEYSPACE IF NOT EXISTS") \
+			.replace("CREATE TYPE", "CREATE TYPE IF NOT EXISTS") \
+			.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS")
+
+	def test_export_schema(self):
+		exporter = CqlExporter(self.cluster, build_props())
+		self.assertEqual(exporter.export_schema(), self.expected_schema(list(exporter.keyspaces.keys())))
+
+	def test_export_keyspace(self):
+		exporter = CqlExporter(self.cluster, build_props())
+		self.assertEqual(exporter.export_schema(keyspace="my_ks_1"), self.expected_schema(["my_ks_1"]))
+
+	def test_export_all(self):
+		exporter = CqlExporter(self.cluster, build_props(purpose="testing"))
+		lines = exporter.export_all().splitlines()
+		self.assertEqual(lines[0], "//{")
+		self.assertIn('//    "purpose": "testing",', lines)
+		self.assertEqual(lines[lines.index("//}") + 2], "CREATE KEYSPACE IF NOT EXISTS my_ks_0 WITH replication = {'class': 'SimpleStrategy', 'replication_factor': '1'}  AND durable_writes = true;")
+
+	def test_add_if_not_exists(self):
+		self.assertEqual(add_if_not_exists("CREATE TABLE ks.tbl (a int PRIMARY KEY);\nCREATE INDEX idx ON ks.tbl (a);"),
+			"CREATE TABLE IF NOT EXISTS ks.tbl (a int PRIMARY KEY);\nCREATE INDEX IF NOT EXISTS idx ON ks.tbl (a);")
+		self.assertEqual(add_if_not_exists("CREATE CUSTOM INDEX idx ON ks.tbl (a);"), "CREATE CUSTOM INDEX idx ON ks.tbl (a);")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+
+from cassandra.metadata import Metadata
+
+from adelphi.cql import CqlExporter
+from adelphi.export import _get_fork_context, compare_manifests, merge_manifests, write_keyspaces
+from adelphi.offline import OfflineCluster
+from tests.util.schema_util import get_schema
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+def build_exporter(keyspace_names=None):
+	metadata = Metadata()
+	metadata.keyspaces = {ks.name: ks for ks in get_schema().keyspaces}
+	props = {"keyspace-names": keyspace_names, "rf": None, "anonymize": True, "purpose": None, "maturity": None}
+	return CqlExporter(OfflineCluster(metadata), props)
+
+class TestWriteKeyspaces(unittest.TestCase):
+
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpdir)
+
+	def build_tasks(self, exporter, name, digests={}):
+		tasks = []
+		def ks_fn(ks_obj, ks_id):
+			ks_dir = os.path.join(self.tmpdir, name, ks_obj.name)
+			if not os.path.exists(ks_dir):
+				os.makedirs(ks_dir)
+			tasks.append((ks_obj.name, ks_id, ks_dir, digests.get(ks_obj.name)))
+		exporter.each_keyspace(ks_fn)
+		return tasks
+
+	def read_files(self, results):
+		contents = []
+		for result in results:
+			for path in (result.schema_path, result.metadata_path):
+				with open(path) as f:
+					contents.append(f.read())
+		return contents
+
+	def test_parallel_matches_serial(self):
+		exporter = build_exporter()
+		serial_tasks = self.build_tasks(exporter, "serial")
+		parallel_tasks = self.build_tasks(exporter, "parallel")
+		serial = write_keyspaces(exporter, serial_tasks)
+		parallel = write_keyspaces(exporter, parallel_tasks, jobs=2)
+
+		# Results are returned in task order
+		self.assertEqual([os.path.dirname(r.schema_path) for r in parallel], [task[2] for task in parallel_tasks])
+		self.assertEqual(self.read_files(serial), self.read_files(parallel))
+		self.assertEqual([r.digest for r in serial], [r.digest for r in parallel])
+
+	def test_workers_forked(self):
+		context = _get_fork_context()
+		if context is None:
+			self.skipTest("Forking isn't supported on this platform")
+		start_method = context.get_start_method() if hasattr(context, "get_start_method") else "fork"
+		self.assertEqual(start_method, "fork")
+
+	def test_unchanged_keyspaces_skipped(self):
+		exporter = build_exporter()
+		first = write_keyspaces(exporter, self.build_tasks(exporter, "out"))
+		self.assertTrue(all(r.written for r in first))
+		schema_mtime = os.path.getmtime(first[0].schema_path)
+
+		digests = {os.path.basename(os.path.dirname(r.schema_path)): r.digest for r in first}
+		second = write_keyspaces(exporter, self.build_tasks(exporter, "out", digests))
+		self.assertFalse(any(r.written for r in second))
+		self.assertEqual([r.digest for r in first], [r.digest for r in second])
+		self.assertEqual(os.path.getmtime(second[0].schema_path), schema_mtime)
+
+		# Changing the metadata (but not the creation timestamp) changes the digest
+		exporter.add_metadata("purpose", "testing")
+		third = write_keyspaces(exporter, self.build_tasks(exporter, "out", digests))
+		self.assertTrue(all(r.written for r in third))
+
+	def test_compare_manifests(self):
+		old = {"a": {"digest": "1"}, "b": {"digest": "2"}, "c": {"digest": "3"}}
+		new = {"b": {"digest": "2"}, "c": {"digest": "4"}, "d": {"digest": "5"}}
+		self.assertEqual(compare_manifests(old, new), (["d"], ["c"], ["a"]))
+
+	def test_selected_keyspaces_keep_manifest(self):
+		def manifest(results):
+			return {os.path.basename(os.path.dirname(r.schema_path)): {"digest": r.digest} for r in results}
+		exporter = build_exporter()
+		full = manifest(write_keyspaces(exporter, self.build_tasks(exporter, "out")))
+		self.assertGreater(len(full), 1)
+
+		# Exporting a single keyspace doesn't drop the others from the manifest or report them as removed
+		subset_exporter = build_exporter([get_schema().keyspaces[0].name])
+		subset = manifest(write_keyspaces(subset_exporter, self.build_tasks(subset_exporter, "out", {k: v["digest"] for (k, v) in full.items()})))
+		self.assertEqual(len(subset), 1)
+		merged = merge_manifests(full, subset, complete=False)
+		self.assertEqual(merged, full)
+		self.assertEqual(compare_manifests(full, merged), ([], [], []))
+
+		# So the following full export rewrites nothing
+		results = write_keyspaces(exporter, self.build_tasks(exporter, "out", {k: v["digest"] for (k, v) in merged.items()}))
+		self.assertFalse(any(r.written for r in results))
+		self.assertEqual(merge_manifests(merged, {}, complete=True), {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+from cassandra.metadata import ColumnMetadata, IndexMetadata
+
+from adelphi.anonymize import Anonymizer, ALL_PREFIXES
+from adelphi.fingerprint import build_keyspace_fingerprint
+from tests.util.schema_util import get_schema
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+class TestFingerprint(unittest.TestCase):
+
+	def setUp(self):
+		self.keyspace = get_schema().keyspaces[0]
+		self.fingerprint = build_keyspace_fingerprint(self.keyspace)
+
+	def test_names_ignored(self):
+		# Keyspaces in the test schema differ only by name
+		self.assertEqual(build_keyspace_fingerprint(get_schema().keyspaces[1]), self.fingerprint)
+
+		# Two different anonymizations of the same schema
+		anonymizer = Anonymizer()
+		for prefix in ALL_PREFIXES:
+			anonymizer.get_name("unrelated", prefix)
+		(ks_a, ks_b) = (get_schema().keyspaces[0], get_schema().keyspaces[0])
+		anonymizer.anonymize_keyspace(ks_a)
+		Anonymizer().anonymize_keyspace(ks_b)
+		self.assertNotEqual(ks_a.name, ks_b.name)
+		self.assertNotEqual(sorted(t.name for t in ks_a.user_types.values()), sorted(t.name for t in ks_b.user_types.values()))
+		self.assertEqual(build_keyspace_fingerprint(ks_a), build_keyspace_fingerprint(ks_b))
+
+	def test_index_targets(self):
+		def add_indexes(ks):
+			table = ks.tables["my_table_0"]
+			table.columns["Quoted"] = ColumnMetadata(table, "Quoted", "map<int,text>")
+			for (name, target) in [("keys_idx", "keys(my_column_10)"), ("entries_idx", "entries(\"Quoted\")"), ("quoted_idx", "\"Quoted\"")]:
+				table.indexes[name] = IndexMetadata(ks.name, table.name, name, "COMPOSITES", {"target": target})
+			return ks
+
+		original = add_indexes(get_schema().keyspaces[0])
+		# Anonymization removes custom indexes
+		for table in original.tables.values():
+			table.indexes = {k: v for (k, v) in table.indexes.items() if v.kind != "CUSTOM"}
+		anonymized = Anonymizer().anonymize_keyspace(add_indexes(get_schema().keyspaces[0]))
+		table = anonymized.tables["my_table_0"]
+		# Targets refer to the anonymized columns
+		(map_column, quoted_column) = (table.columns["my_column_10"].name, table.columns["Quoted"].name)
+		targets = sorted(index.index_options["target"] for index in table.indexes.values())
+		self.assertEqual(targets, sorted(["col_0", quoted_column, "entries({})".format(quoted_column), "keys({})".format(map_column)]))
+		self.assertEqual(build_keyspace_fingerprint(anonymized), build_keyspace_fingerprint(original))
+
+	def test_column_type_change(self):
+		self.keyspace.tables["my_table_0"].columns["my_column_4"].cql_type = "text"
+		self.assertNotEqual(build_keyspace_fingerprint(self.keyspace), self.fingerprint)
+
+	def test_clustering_order_change(self):
+		self.keyspace.tables["my_table_0"].columns["my_column_2"].is_reversed = True
+		self.assertNotEqual(build_keyspace_fingerprint(self.keyspace), self.fingerprint)
+
+	def test_udt_change(self):
+		self.keyspace.user_types["address"].field_types[1] = "bigint"
+		self.assertNotEqual(build_keyspace_fingerprint(self.keyspace), self.fingerprint)
+
+	def test_index_change(self):
+		del self.keyspace.tables["my_table_0"].indexes["regular_index_my_table_0"]
+		self.assertNotEqual(build_keyspace_fingerprint(self.keyspace), self.fingerprint)
+
+	def test_option_change(self):
+		self.keyspace.tables["my_table_0"].options["comment"] = "ignored"
+		self.assertEqual(build_keyspace_fingerprint(self.keyspace), self.fingerprint)
+		self.keyspace.tables["my_table_0"].options["gc_grace_seconds"] = 0
+		self.assertNotEqual(build_keyspace_fingerprint(self.keyspace), self.fingerprint)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+
+from github import Github, GithubException
+
+import adelphi.gh
+from adelphi.gh import build_branch, commit_schemas, get_changed_keyspaces, git_blob_sha
+from tests.util.github_server import start_github_server, USER, REPO, ORIGIN_REPO
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+KEYSPACE_COUNT = 20
+
+def build_github(base_url):
+	try:
+		# Disable client-side retries and throttling so that only adelphi.gh handles rate limits
+		return Github("token", base_url=base_url, retry=None, seconds_between_requests=None, seconds_between_writes=None)
+	except TypeError:
+		# Older PyGithub releases don't throttle requests
+		return Github("token", base_url=base_url, retry=None)
+
+class TestCommitSchemas(unittest.TestCase):
+
+	def setUp(self):
+		self.server = start_github_server()
+		self.state = self.server.state
+		self.gh = build_github(self.state.base_url)
+		self.repo = self.gh.get_repo("{}/{}".format(USER, REPO))
+		self.origin_repo = self.gh.get_repo(ORIGIN_REPO)
+		self.branch_name = build_branch(self.gh, self.repo)
+
+		self.tmpdir = tempfile.mkdtemp()
+		for i in range(KEYSPACE_COUNT):
+			ks_dir = os.path.join(self.tmpdir, "ks_{}".format(i))
+			os.mkdir(ks_dir)
+			for name in ["schema", "metadata.json"]:
+				with open(os.path.join(ks_dir, name), "w") as f:
+					f.write("{} for ks_{}".format(name, i))
+		with open(os.path.join(self.tmpdir, "manifest.json"), "w") as f:
+			f.write("{}")
+		self.state.requests = []
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		shutil.rmtree(self.tmpdir)
+
+	def expected_files(self):
+		return {"{}/ks_{}/{}".format(USER, i, name): "{} for ks_{}".format(name, i)
+			for i in range(KEYSPACE_COUNT) for name in ["schema", "metadata.json"]}
+
+	def writes(self):
+		return [r for r in self.state.requests if r[0] != "GET"]
+
+	def test_single_commit(self):
+		commit_schemas(self.gh, self.repo, self.tmpdir, self.branch_name)
+		self.assertEqual(self.state.files("heads/" + self.branch_name), self.expected_files())
+
+		# One tree, one commit and one ref update regardless of the number of keyspaces
+		self.assertEqual([method for (method, _) in self.writes()], ["POST", "POST", "PATCH"])
+		head = self.state.commits[self.state.refs["heads/" + self.branch_name]]
+		self.assertEqual(head["parents"], [self.state.refs["heads/main"]])
+
+	def test_batched_trees(self):
+		original = adelphi.gh.TREE_BATCH_MAX_BYTES
+		adelphi.gh.TREE_BATCH_MAX_BYTES = 100
+		try:
+			commit_schemas(self.gh, self.repo, self.tmpdir, self.branch_name)
+		finally:
+			adelphi.gh.TREE_BATCH_MAX_BYTES = original
+		self.assertEqual(self.state.files("heads/" + self.branch_name), self.expected_files())
+		self.assertGreater(sum(1 for (_, path) in self.writes() if path.endswith("/git/trees")), 1)
+		self.assertEqual(sum(1 for (_, path) in self.writes() if path.endswith("/git/commits")), 1)
+
+	def test_rate_limit_backoff(self):
+		rate_limited = (403, {"Retry-After": "0"}, {"message": "You have exceeded a secondary rate limit"})
+		self.state.failures[("POST", r".*/git/trees$")] = [rate_limited, rate_limited]
+		commit_schemas(self.gh, self.repo, self.tmpdir, self.branch_name)
+		self.assertEqual(self.state.files("heads/" + self.branch_name), self.expected_files())
+		self.assertEqual(sum(1 for (_, path) in self.writes() if path.endswith("/git/trees")), 3)
+
+	def test_other_errors_not_retried(self):
+		self.state.failures[("POST", r".*/git/trees$")] = [(422, {}, {"message": "Invalid tree"})]
+		self.assertRaises(GithubException, commit_schemas, self.gh, self.repo, self.tmpdir, self.branch_name)
+		self.assertEqual(sum(1 for (_, path) in self.writes() if path.endswith("/git/trees")), 1)
+
+	def test_changed_keyspaces(self):
+		self.assertEqual(get_changed_keyspaces(self.gh, self.origin_repo, self.tmpdir), sorted("ks_{}".format(i) for i in range(KEYSPACE_COUNT)))
+
+		# Simulate a previous contribution being merged into main of the origin via a pull request.  The fork's main
+		# isn't updated unless the user syncs it.
+		commit_schemas(self.gh, self.repo, self.tmpdir, self.branch_name)
+		fork_main = self.state.refs["heads/main"]
+		self.state.origin_refs["heads/main"] = self.state.refs["heads/" + self.branch_name]
+		self.assertEqual(get_changed_keyspaces(self.gh, self.origin_repo, self.tmpdir), [])
+		self.assertEqual(self.state.refs["heads/main"], fork_main)
+
+		# Metadata changes alone (such as a new creation timestamp) don't count
+		with open(os.path.join(self.tmpdir, "ks_1", "metadata.json"), "w") as f:
+			f.write("new metadata for ks_1")
+		with open(os.path.join(self.tmpdir, "ks_2", "schema"), "w") as f:
+			f.write("new schema for ks_2")
+		os.mkdir(os.path.join(self.tmpdir, "ks_new"))
+		with open(os.path.join(self.tmpdir, "ks_new", "schema"), "w") as f:
+			f.write("schema for ks_new")
+		changed = get_changed_keyspaces(self.gh, self.origin_repo, self.tmpdir)
+		self.assertEqual(changed, ["ks_2", "ks_new"])
+
+		# Only changed keyspaces are uploaded but the resulting tree (based on main of the origin rather than the
+		# stale main of the fork) contains everything
+		branch_name = build_branch(self.gh, self.repo, self.origin_repo)
+		self.state.requests = []
+		commit_schemas(self.gh, self.repo, self.tmpdir, branch_name, changed)
+		head = self.state.commits[self.state.refs["heads/" + branch_name]]
+		self.assertEqual(head["parents"], [self.state.origin_refs["heads/main"]])
+		files = self.state.files("heads/" + branch_name)
+		self.assertEqual(files["{}/ks_2/schema".format(USER)], "new schema for ks_2")
+		self.assertEqual(files["{}/ks_new/schema".format(USER)], "schema for ks_new")
+		self.assertEqual(files["{}/ks_1/metadata.json".format(USER)], "metadata.json for ks_1")
+
+	def test_changed_keyspaces_truncated_tree(self):
+		commit_schemas(self.gh, self.repo, self.tmpdir, self.branch_name)
+		self.state.origin_refs["heads/main"] = self.state.refs["heads/" + self.branch_name]
+		with open(os.path.join(self.tmpdir, "ks_2", "schema"), "w") as f:
+			f.write("new schema for ks_2")
+
+		# Github truncates recursive listings of large trees, in which case each keyspace is listed individually
+		self.state.truncate_recursive = True
+		self.state.requests = []
+		self.assertEqual(get_changed_keyspaces(self.gh, self.origin_repo, self.tmpdir), ["ks_2"])
+		self.assertGreater(sum(1 for (_, path) in self.state.requests if "/git/trees/" in path), KEYSPACE_COUNT)
+
+	def test_git_blob_sha(self):
+		# Matches the output of "printf abc | git hash-object --stdin"
+		self.assertEqual(git_blob_sha("abc"), "f2ba8f84ab5c1bce84a7b441cb1959cfc7093b7f")
+
+if __name__ == "__main__":
+    unittest.main()
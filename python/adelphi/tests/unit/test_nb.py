@@ -0,0 +1,542 @@
+import copy
+import os
+import re
+import shutil
+import tempfile
+import yaml
+
+from collections import namedtuple
+from cassandra import InvalidRequest
+from cassandra.metadata import IndexMetadata, Metadata
+
+from adelphi.exceptions import TableSelectionException
+from adelphi.capture import parse_statement
+from adelphi.nb import NbExporter, KeyDistribution, build_capacity_steps, build_captured_mix, build_churn_slots, classify_statement, build_dist, build_json_template, build_hotspot_curve, build_key_dist, build_partition_widths, build_table_ratios, parse_key_distribution, supports_json
+from adelphi.offline import OfflineCluster
+from adelphi.profile import ColumnProfile, MURMUR3_PARTITIONER
+from adelphi.synth import synthesize_keyspaces
+from adelphi.store import fetch_table_traffic, get_column_index, invalidate_column_index
+from tests.util.schema_util import get_schema
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+BINDING_RE = re.compile(r"\{(\w+)\}")
+
+StubHost = namedtuple("StubHost", ["datacenter", "release_version"])
+
+def build_cluster(keyspace):
+	metadata = Metadata()
+	metadata.keyspaces = {keyspace.name: keyspace}
+	return OfflineCluster(metadata)
+
+def build_props(**kwargs):
+	props = {"keyspace-names": None, "rf": None, "anonymize": False, "purpose": None, "maturity": None,
+		"rampup-cycles": 1000, "main-cycles": 1000}
+	props.update(kwargs)
+	return props
+
+def build_config(keyspace, **kwargs):
+	return yaml.safe_load(NbExporter(build_cluster(keyspace), build_props(**kwargs)).export_schema())
+
+class StubSession(object):
+
+	def __init__(self, rows):
+		self.rows = rows
+
+	def execute(self, query, params):
+		if not self.rows:
+			raise InvalidRequest("unconfigured table")
+		return self.rows["read" if "read" in query else "write"]
+
+class StubCluster(OfflineCluster):
+	"""Cluster with a connected session returning the same rows for every query"""
+
+	def __init__(self, keyspace, values):
+		super(StubCluster, self).__init__(build_cluster(keyspace).metadata)
+		self.metadata.partitioner = MURMUR3_PARTITIONER
+		self.sessions = [StubRowsSession(values)]
+
+	def connect(self):
+		return self.sessions[0]
+
+class StubRowsSession(object):
+	"""Builds rows for the selected columns using a dict of column name to a function of the row number"""
+
+	def __init__(self, values):
+		self.values = values
+		self.is_shutdown = False
+		self.row_count = 0
+
+	def execute(self, query, params):
+		names = [name.strip('"') for name in query.split("SELECT ")[1].split(" FROM")[0].split(",")]
+		rows = [tuple(self.values[name](i) if name in self.values else None for name in names) for i in range(self.row_count, self.row_count + params[-1])]
+		self.row_count += params[-1]
+		return rows
+
+class TestNbExporter(unittest.TestCase):
+
+	def setUp(self):
+		self.keyspace = get_schema().keyspaces[0]
+
+	def statements(self, config):
+		return [stmt[k] for block in config["blocks"] for stmt in block["statements"] for k in stmt if k not in ("tags", "params")]
+
+	def assertBindingsDefined(self, config):
+		for stmt in self.statements(config):
+			for binding in BINDING_RE.findall(stmt):
+				self.assertIn(binding, config["bindings"])
+
+	def test_single_table(self):
+		for name in ["my_table_1", "my_table_2"]:
+			del self.keyspace.tables[name]
+		config = build_config(self.keyspace)
+		self.assertEqual([b["name"] for b in config["blocks"]], ["rampup", "main-read", "main-write"])
+		self.assertIn("my_column_0_seq", config["bindings"])
+		self.assertEqual([b["params"].get("ratio") for b in config["blocks"]], [None, 5, 5])
+		self.assertBindingsDefined(config)
+
+	def test_multiple_tables(self):
+		config = build_config(self.keyspace)
+		self.assertEqual([b["name"] for b in config["blocks"]],
+			["rampup-my_table_0", "rampup-my_table_1", "rampup-my_table_2",
+			"main-read-my_table_0", "main-write-my_table_0",
+			"main-read-my_table_1", "main-write-my_table_1",
+			"main-read-my_table_2", "main-write-my_table_2"])
+		for idx in range(len(self.keyspace.tables)):
+			self.assertIn("t{}_my_column_0_seq".format(idx), config["bindings"])
+		self.assertEqual(set(b["tags"]["table"] for b in config["blocks"]), set(self.keyspace.tables.keys()))
+		self.assertBindingsDefined(config)
+		for (stmt, block) in zip(self.statements(config), config["blocks"]):
+			self.assertIn('"{}"'.format(block["tags"]["table"]), stmt)
+
+	def test_binding_prefixes(self):
+		# Prefixing bindings with table names would map both a_b.c and a.b_c to a_b_c_dist
+		table = self.keyspace.tables["my_table_0"]
+		for (table_name, column_name) in [("a_b", "c"), ("a", "b_c")]:
+			copy = get_schema().keyspaces[0].tables["my_table_0"]
+			copy.name = table_name
+			column = copy.columns.pop("my_column_4")
+			column.name = column_name
+			copy.columns[column_name] = column
+			self.keyspace.tables[table_name] = copy
+		config = build_config(self.keyspace, **{"table-weights": {}})
+		bindings = config["bindings"]
+		self.assertIn("t3_c_dist", bindings)
+		self.assertIn("t4_b_c_dist", bindings)
+		self.assertBindingsDefined(config)
+
+	def test_table_weights(self):
+		config = build_config(self.keyspace, **{"table-weights": {"my_table_0": 3, "my_table_2": 0}})
+		ratios = {b["name"]: b["params"]["ratio"] for b in config["blocks"] if b["tags"]["phase"] == "main"}
+		self.assertEqual(ratios, {"main-read-my_table_0": 15, "main-write-my_table_0": 15, "main-read-my_table_1": 5, "main-write-my_table_1": 5})
+
+	def test_unknown_table_weights(self):
+		self.assertRaises(TableSelectionException, build_config, self.keyspace, **{"table-weights": {"foo": 1}})
+
+	def test_sampled_ratios(self):
+		traffic = {"t0": (600, 200), "t1": (0, 200), "other": (1000, 1000)}
+		self.assertEqual(build_table_ratios(["t0", "t1", "t2"], {"t0": 2}, traffic), {"t0": (600, 200), "t1": (0, 200), "t2": (0, 0)})
+		# Without any traffic for the selected tables weights are used instead
+		self.assertEqual(build_table_ratios(["t2"], {"t2": 2}, traffic), {"t2": (10, 10)})
+
+	def test_profiled_bindings(self):
+		for name in ["my_table_1", "my_table_2"]:
+			del self.keyspace.tables[name]
+		values = {"my_column_13": lambda i: "t" * 20 + str(i % 4), "my_column_8": lambda i: i % 3, "my_column_17": lambda i: "v" * 30 + str(i),
+			"my_column_0": lambda i: "k" * 15 + str(i % 7)}
+		exporter = NbExporter(StubCluster(self.keyspace, values), build_props(**{"sample-rows": 100}))
+		bindings = yaml.safe_load(exporter.export_schema())["bindings"]
+		self.assertEqual(bindings["my_column_13_dist"], "Hash(); Mod(4); AlphaNumericString(21) -> String")
+		self.assertEqual(bindings["my_column_8_dist"], "Hash(); Mod(3); ToInt() -> int")
+		# 96 rows are sampled (6 from each of 16 token ranges), 10 of which have a shorter value
+		self.assertEqual(bindings["my_column_17_dist"], "Hash(); Mod(2000000); WeightedFuncs(10, AlphaNumericString(31), 86, AlphaNumericString(32)) -> String")
+		# Distributions of key columns have to select the keys written by the unprofiled sequences
+		self.assertEqual(bindings["my_column_0_dist"], "Hash(); Mod(2000000); ToString() -> String")
+		self.assertEqual(bindings["my_column_0_seq"], "Mod(2000000); ToString() -> String")
+		# Columns without any sampled values keep the default distribution
+		self.assertEqual(bindings["my_column_4_dist"], "Hash(); ModuloToBigDecimal(2000000) -> java.math.BigDecimal")
+		# Sequences used to populate keys aren't affected by the profile
+		self.assertEqual(bindings["my_column_2_seq"], "Mod(2000000); ToByteBuffer() -> java.nio.ByteBuffer")
+
+	def test_build_dist(self):
+		self.assertEqual(build_dist("text", 1000), "Hash(); Mod(1000); ToString() -> String")
+		profile = ColumnProfile()
+		for i in range(10):
+			profile.add("x" * 5 + str(i))
+		# All values were unique so cardinality isn't limited
+		self.assertEqual(build_dist("text", 1000, profile), "Hash(); Mod(1000); AlphaNumericString(6) -> String")
+		for i in range(30):
+			profile.add(b"x" * (i % 3 + 1))
+		self.assertEqual(build_dist("blob", 1000, profile), "Hash(); Mod(13); WeightedFuncs(10, ByteBufferSizedHashed(1), "
+			"10, ByteBufferSizedHashed(2), 10, ByteBufferSizedHashed(3), 10, ByteBufferSizedHashed(6)) -> java.nio.ByteBuffer")
+
+	def test_fixed_rows_per_partition(self):
+		for name in ["my_table_1", "my_table_2"]:
+			del self.keyspace.tables[name]
+		config = build_config(self.keyspace, **{"rows-per-partition": (100, 100)})
+		self.assertIn("seq=concat", config["scenarios"]["TEMPLATE(scenarioname,default)"][0])
+		bindings = config["bindings"]
+		# Partitions are derived from cycle / 100 and clustering columns from cycle % 100
+		self.assertEqual(bindings["my_column_0_seq"], "Div(100); Mod(2000000); ToString() -> String")
+		self.assertEqual(bindings["my_column_2_seq"], "Mod(100); Mod(2000000); ToByteBuffer() -> java.nio.ByteBuffer")
+		# Reads and main phase writes only address rows written during rampup
+		self.assertEqual(bindings["my_column_1_dist"], "Hash(); Mod(10); ToLong() -> long")
+		self.assertEqual(bindings["my_column_3_dist"], "Hash(); Mod(100); ToBoolean() -> java.lang.Boolean")
+		self.assertEqual([b["name"] for b in config["blocks"]], ["rampup", "main-read", "main-write"])
+		self.assertEqual([s["tags"]["name"] for s in config["blocks"][1]["statements"]], ["main-select", "main-select-range"])
+		# Reads are split evenly between point and range reads while reads and writes keep equal shares
+		self.assertEqual([s["params"]["ratio"] for s in config["blocks"][1]["statements"]], [1, 1])
+		self.assertEqual([b["params"]["ratio"] for b in config["blocks"][1:]], [2, 2])
+		self.assertIn('"my_column_2" >= {my_column_2_dist}', self.statements(config)[2])
+		self.assertIn("{my_column_0_dist}", self.statements(config)[3])
+		self.assertBindingsDefined(config)
+
+	def test_rows_per_partition_range(self):
+		config = build_config(self.keyspace, **{"rows-per-partition": (10, 40)})
+		rampup = config["blocks"][0]
+		self.assertEqual([s["params"]["ratio"] for s in rampup["statements"]], [10, 20, 30, 40])
+		bindings = config["bindings"]
+		# Three tables with four partition sizes in each period of the rampup phase
+		self.assertEqual(bindings["t0_my_column_0_seq_10"], "Div(300); Mul(4); Add(0); Mod(2000000); ToString() -> String")
+		self.assertEqual(bindings["t0_my_column_2_seq_10"], "Mod(300); Mod(2000000); ToByteBuffer() -> java.nio.ByteBuffer")
+		self.assertEqual(bindings["t1_my_column_0_seq_20"], "Div(300); Mul(4); Add(1); Mod(2000000); ToString() -> String")
+		self.assertEqual(bindings["t1_my_column_2_seq_20"], "Mod(300); Add(-110); Mod(2000000); ToByteBuffer() -> java.nio.ByteBuffer")
+		self.assertEqual(bindings["t2_my_column_1_dist"], "Hash(); Mod(16); ToLong() -> long")
+		self.assertNotIn("t0_my_column_0_seq", bindings)
+		self.assertBindingsDefined(config)
+
+	def test_build_partition_widths(self):
+		self.assertEqual(build_partition_widths(5, 5), [5])
+		self.assertEqual(build_partition_widths(1, 100), [1, 34, 67, 100])
+		self.assertEqual(build_partition_widths(1, 2), [1, 2])
+
+	def test_key_distributions(self):
+		config = build_config(self.keyspace, **{"key-distributions": {None: parse_key_distribution("zipf:1.5"), "my_table_1": parse_key_distribution("latest")}})
+		bindings = config["bindings"]
+		# Keys are drawn from those written by each table during rampup, every third cycle starting at the table's offset
+		self.assertEqual(bindings["t0_my_column_1_dist"], "Zipf(334, 1.5); Add(-1); Mul(3); Mod(1002); ToLong() -> long")
+		self.assertEqual(bindings["t1_my_column_0_dist"], "Zipf(334, 0.99); Mul(-1); Add(334); Mul(3); Add(1); Mod(1002); ToString() -> String")
+		self.assertEqual(bindings["t2_my_column_3_dist"], "Zipf(334, 1.5); Add(-1); Mul(3); Add(2); Mod(1002); ToBoolean() -> java.lang.Boolean")
+		# Main phase writes update keys selected by the distribution
+		for block in config["blocks"]:
+			if block["name"].startswith("main-write"):
+				self.assertNotIn("_seq}", self.statements({"blocks": [block]})[0])
+		self.assertBindingsDefined(config)
+
+	def test_unknown_table_key_distribution(self):
+		self.assertRaises(TableSelectionException, build_config, self.keyspace, **{"key-distributions": {"foo": parse_key_distribution("zipf")}})
+
+	def test_parse_key_distribution(self):
+		self.assertEqual(parse_key_distribution("zipf"), KeyDistribution("zipf", (0.99,)))
+		self.assertEqual(parse_key_distribution("latest:1.1"), KeyDistribution("latest", (1.1,)))
+		self.assertEqual(parse_key_distribution("hotspot:90:10"), KeyDistribution("hotspot", (90, 10)))
+		for spec in ["hotspot:90", "hotspot:100:10", "zipf:0", "zipf:x", "pareto"]:
+			self.assertRaises(ValueError, parse_key_distribution, spec)
+
+	def test_hotspot(self):
+		# 90% of the unit interval maps onto the first 10% of keys
+		self.assertEqual(build_hotspot_curve(90, 10, 101), [0.0, 1.1, 2.2, 3.3, 4.4, 5.6, 6.7, 7.8, 8.9, 10.0, 100.0])
+		self.assertEqual(build_key_dist("int", 101, parse_key_distribution("hotspot:50:20")), "Hash(); Interpolate(0.0,20.0,100.0); Mod(101); ToInt() -> int")
+		self.assertEqual(build_key_dist("int", 100, KeyDistribution("uniform", ())), "Hash(); Mod(100); ToInt() -> int")
+
+	def test_read_mix(self):
+		del self.keyspace.tables["my_table_2"]
+		# Only the first table has clustering columns
+		self.keyspace.tables["my_table_1"].clustering_key = []
+		config = build_config(self.keyspace, **{"read-mix": {"point": 2, "partition": 1, "range": 1, "paged": 1, "index": 1}})
+		reads = {b["tags"]["table"]: b["statements"] for b in config["blocks"] if b["name"].startswith("main-read")}
+		self.assertEqual([s["tags"]["name"] for s in reads["my_table_0"]],
+			["main-select-my_table_0", "main-select-partition-my_table_0", "main-select-range-my_table_0",
+			"main-select-paged-my_table_0", "main-select-regular_index_my_table_0-my_table_0"])
+		self.assertEqual([s["tags"]["name"] for s in reads["my_table_1"]],
+			["main-select-my_table_1", "main-select-regular_index_my_table_1-my_table_1"])
+		# Reads of each table are divided between its shapes while preserving the share of each table and of writes
+		self.assertEqual([s["params"]["ratio"] for s in reads["my_table_0"]], [2, 1, 1, 1, 1])
+		self.assertEqual([s["params"]["ratio"] for s in reads["my_table_1"]], [4, 2])
+		self.assertEqual(set(b["params"]["ratio"] for b in config["blocks"] if b["name"].startswith("main-write")), set([6]))
+		self.assertEqual(reads["my_table_0"][3]["params"]["fetchsize"], 10)
+		self.assertTrue(self.statements({"blocks": [{"statements": reads["my_table_0"]}]})[2].endswith("limit 10"))
+		self.assertIn('where "my_column_0" = {t1_my_column_0_dist}', self.statements({"blocks": [{"statements": reads["my_table_1"]}]})[1])
+		self.assertBindingsDefined(config)
+
+	def test_read_mix_multiple_indexes(self):
+		for name in ["my_table_1", "my_table_2"]:
+			del self.keyspace.tables[name]
+		table = self.keyspace.tables["my_table_0"]
+		table.indexes["int_index"] = IndexMetadata(self.keyspace.name, table.name, "int_index", "COMPOSITES", {"target": "my_column_8"})
+		config = build_config(self.keyspace, **{"read-mix": {"point": 1, "index": 1}})
+		reads = [b for b in config["blocks"] if b["name"].startswith("main-read")][0]["statements"]
+		self.assertEqual([s["tags"]["name"] for s in reads], ["main-select", "main-select-int_index", "main-select-regular_index_my_table_0"])
+		# Index reads as a whole keep the weight of the index shape
+		ratios = [s["params"]["ratio"] for s in reads]
+		self.assertEqual(ratios[0], ratios[1] + ratios[2])
+		self.assertEqual(ratios[1], ratios[2])
+		self.assertBindingsDefined(config)
+
+	def test_read_mix_index_counts(self):
+		template = self.keyspace.tables["my_table_0"]
+		self.keyspace.tables = {}
+		for idx in range(6):
+			table = copy.deepcopy(template)
+			table.name = "my_table_{}".format(idx)
+			columns = [col for col in get_column_index(table).regular if "<" not in col.cql_type]
+			table.indexes = {"idx_{}".format(col.name): IndexMetadata(self.keyspace.name, table.name, "idx_{}".format(col.name), "COMPOSITES", {"target": col.name})
+				for col in columns[:idx + 1]}
+			self.keyspace.tables[table.name] = table
+		config = build_config(self.keyspace, **{"read-mix": {"point": 1, "index": 1}})
+		reads = [b for b in config["blocks"] if b["name"].startswith("main-read")]
+		self.assertEqual([len(b["statements"]) for b in reads], [2, 3, 4, 5, 6, 7])
+		# Tables keep equal shares however many indexes they have, without scaling ratios by every index count
+		self.assertEqual(set(b["params"]["ratio"] for b in reads), set([sum(s["params"]["ratio"] for s in reads[0]["statements"])]))
+		self.assertLessEqual(reads[0]["params"]["ratio"], 120)
+		self.assertBindingsDefined(config)
+
+	def test_classify_statement(self):
+		table = self.keyspace.tables["my_table_0"]
+		def classify(query):
+			return classify_statement(parse_statement(query), table)
+		pk = "my_column_0 = ? and my_column_1 = ?"
+		self.assertEqual(classify("select * from t where {} and my_column_2 = ? and my_column_3 = ?".format(pk)), (True, "point"))
+		self.assertEqual(classify("select * from t where {} and my_column_2 = ?".format(pk)), (True, "partition"))
+		self.assertEqual(classify("select * from t where {} and my_column_2 > ? limit 10".format(pk)), (True, "range"))
+		self.assertEqual(classify("select * from t where my_column_0 = ?"), (True, "index"))
+		self.assertIsNone(classify("select * from t"))
+		self.assertEqual(classify("insert into t (my_column_0) values (?) using ttl 10"), (False, "ttl"))
+		self.assertEqual(classify("update t set my_column_4 = ? where {}".format(pk)), (False, "update"))
+		self.assertEqual(classify("delete from t where {}".format(pk)), (False, "range-delete"))
+		self.assertEqual(classify("begin batch insert into t (my_column_0) values (?); apply batch"), (False, "logged-batch"))
+		self.assertEqual(build_captured_mix({"point": 90, "range": 9, "index": 1}), {"point": 18, "range": 1, "index": 1})
+		# Mixes always sum to the same total, with the remainder going to the shapes rounded down the most
+		self.assertEqual(build_captured_mix({"point": 1, "range": 1, "paged": 1}), {"point": 7, "range": 6, "paged": 7})
+
+	def test_traffic_capture(self):
+		tmpdir = tempfile.mkdtemp()
+		try:
+			path = os.path.join(tmpdir, "capture.txt")
+			with open(path, "w") as f:
+				pk = "my_column_0 = '{}' and my_column_1 = {}"
+				for i in range(2000):
+					# Reads of my_table_0 concentrate on a few partitions while its writes are spread evenly
+					key = int(1000 / (1 + i % 50))
+					f.write('"{{\'query\': \'SELECT * FROM my_ks_0.my_table_0 WHERE {}\'}}"\n'.format(pk.format(key, key).replace("'", "''")))
+					if i % 4 == 0:
+						f.write("\"{'query': 'DELETE FROM my_table_0 WHERE my_column_0 = ? and my_column_1 = ?'}\"\n")
+					if i % 2 == 0:
+						f.write("\"{'query': 'INSERT INTO other_ks.my_table_1 (my_column_0) VALUES (?)'}\"\n")
+			del self.keyspace.tables["my_table_2"]
+			config = build_config(self.keyspace, **{"traffic-capture": path, "key-distributions": {"my_table_1": parse_key_distribution("latest")}})
+		finally:
+			shutil.rmtree(tmpdir)
+		blocks = {b["name"]: b for b in config["blocks"]}
+		# Only traffic against the exported keyspace counts, so my_table_1 gets no main phase reads
+		self.assertEqual(blocks["main-read-my_table_0"]["params"]["ratio"], 4)
+		self.assertEqual(blocks["main-write-my_table_0"]["params"]["ratio"], 1)
+		self.assertNotIn("main-read-my_table_1", blocks)
+		self.assertEqual([s["tags"]["name"] for s in blocks["main-read-my_table_0"]["statements"]], ["main-select-partition-my_table_0"])
+		self.assertEqual([s["tags"]["name"] for s in blocks["main-write-my_table_0"]["statements"]], ["main-delete-range-my_table_0"])
+		# Skewed reads are reproduced with a zipf distribution while explicit distributions take precedence
+		self.assertTrue(config["bindings"]["t0_my_column_0_dist"].startswith("Zipf("))
+		self.assertTrue(config["bindings"]["t1_my_column_0_dist"].startswith("Zipf(500, 0.99); Mul(-1)"))
+		self.assertBindingsDefined(config)
+
+	def test_fql_capture_keyspaces(self):
+		record = "Type: single-query\nQuery start time: 1600000000000\nProtocol version: 5\nKeyspace: {}\nQuery: {}\nValues:\n"
+		tmpdir = tempfile.mkdtemp()
+		try:
+			path = os.path.join(tmpdir, "fql.txt")
+			with open(path, "w") as f:
+				# Unqualified queries against a table of the same name in another keyspace don't count
+				for i in range(10):
+					f.write(record.format("my_ks_0", "SELECT * FROM my_table_0 WHERE my_column_0 = '{}'".format(i)))
+					for _ in range(3):
+						f.write(record.format("other_ks", "INSERT INTO my_table_0 (my_column_0) VALUES ('{}')".format(i)))
+						f.write(record.format("other_ks", "INSERT INTO my_table_1 (my_column_0) VALUES ('{}')".format(i)))
+			del self.keyspace.tables["my_table_2"]
+			config = build_config(self.keyspace, **{"traffic-capture": path})
+		finally:
+			shutil.rmtree(tmpdir)
+		blocks = {b["name"]: b for b in config["blocks"]}
+		self.assertEqual([s["tags"]["name"] for s in blocks["main-read-my_table_0"]["statements"]], ["main-select-regular_index_my_table_0-my_table_0"])
+		self.assertNotIn("main-write-my_table_0", blocks)
+		self.assertNotIn("main-read-my_table_1", blocks)
+		self.assertNotIn("main-write-my_table_1", blocks)
+
+	def test_multi_table_traffic_capture(self):
+		keyspace = synthesize_keyspaces([self.keyspace], 1, 5)[0]
+		tmpdir = tempfile.mkdtemp()
+		try:
+			path = os.path.join(tmpdir, "sessions.csv")
+			with open(path, "w") as f:
+				pk = "col_0 = ? and col_1 = ? and col_2 = ? and col_3 = ?"
+				queries = ["SELECT * FROM ks_0.tbl_{} WHERE " + pk, "SELECT * FROM ks_0.tbl_{} WHERE col_0 = ? and col_1 = ?",
+					"SELECT * FROM ks_0.tbl_{} WHERE col_0 = ? and col_1 = ? and col_2 > ?",
+					"INSERT INTO ks_0.tbl_{} (col_0, col_1, col_2, col_3) VALUES (?, ?, ?, ?)",
+					"INSERT INTO ks_0.tbl_{} (col_0, col_1, col_2, col_3) VALUES (?, ?, ?, ?) USING TTL 60",
+					"DELETE FROM ks_0.tbl_{} WHERE " + pk]
+				# Rare shapes of every table round to different shares of the captured mix total
+				for i in range(5):
+					for (query, count) in zip(queries, [50 + 7 * i, 1, 1 + i % 2, 30 + 5 * i, 1, 1 + i]):
+						for _ in range(count):
+							f.write("\"{{'query': '{}'}}\"\n".format(query.format(i)))
+			config = build_config(keyspace, **{"traffic-capture": path})
+		finally:
+			shutil.rmtree(tmpdir)
+		blocks = [b for b in config["blocks"] if b["tags"]["phase"] == "main"]
+		self.assertEqual(len(blocks), 10)
+		# Statements divide the ratio of their block, while ratios are scaled by at most the shape weight total (120)
+		# rather than by a multiple of every table's total
+		for block in blocks:
+			self.assertEqual(sum(s["params"]["ratio"] for s in block["statements"]), block["params"]["ratio"])
+		self.assertLessEqual(sum(b["params"]["ratio"] for b in blocks), 1000 * 120)
+		self.assertBindingsDefined(config)
+
+	def test_write_mix(self):
+		del self.keyspace.tables["my_table_2"]
+		self.keyspace.tables["my_table_1"].clustering_key = []
+		config = build_config(self.keyspace, **{"write-mix": {"insert": 2, "ttl": 1, "update": 1, "delete": 1, "range-delete": 1, "batch": 1, "logged-batch": 1}})
+		writes = {b["tags"]["table"]: b["statements"] for b in config["blocks"] if b["name"].startswith("main-write")}
+		self.assertEqual([s["tags"]["name"] for s in writes["my_table_0"]],
+			["main-insert-my_table_0", "main-insert-ttl-my_table_0", "main-update-my_table_0", "main-delete-my_table_0",
+			"main-delete-range-my_table_0", "main-batch-my_table_0", "main-batch-logged-my_table_0"])
+		# Range deletes and batches require clustering columns
+		self.assertEqual([s["tags"]["name"] for s in writes["my_table_1"]],
+			["main-insert-my_table_1", "main-insert-ttl-my_table_1", "main-update-my_table_1", "main-delete-my_table_1"])
+		self.assertEqual([s["params"]["ratio"] for s in writes["my_table_0"]], [10, 5, 5, 5, 5, 5, 5])
+		self.assertEqual([s["params"]["ratio"] for s in writes["my_table_1"]], [16, 8, 8, 8])
+		self.assertEqual(set(b["params"]["ratio"] for b in config["blocks"] if b["name"].startswith("main-read")), set([40]))
+
+		stmts = self.statements({"blocks": [{"statements": writes["my_table_0"]}]})
+		self.assertTrue(stmts[1].endswith("using ttl 3600"))
+		self.assertTrue(stmts[3].startswith('delete "my_column_4" from'))
+		self.assertTrue(stmts[5].startswith("begin unlogged batch insert"))
+		self.assertTrue(stmts[6].startswith("begin batch insert"))
+		# Each insert in a batch writes a different row of the same partition
+		self.assertEqual(BINDING_RE.findall(stmts[5]).count("t0_my_column_0_dist"), 5)
+		self.assertEqual(len(set(b for b in BINDING_RE.findall(stmts[5]) if "_batch" in b)), 5)
+		self.assertBindingsDefined(config)
+
+	def test_append_writes(self):
+		del self.keyspace.tables["my_table_2"]
+		# Frozen collections can only be overwritten
+		for name in ["my_column_9", "my_column_10", "my_column_11"]:
+			del self.keyspace.tables["my_table_1"].columns[name]
+		config = build_config(self.keyspace, **{"write-mix": {"update": 1, "append": 1}})
+		writes = {b["tags"]["table"]: b["statements"] for b in config["blocks"] if b["name"].startswith("main-write")}
+		self.assertEqual([s["tags"]["name"] for s in writes["my_table_0"]], ["main-update-my_table_0", "main-append-my_table_0"])
+		self.assertEqual([s["tags"]["name"] for s in writes["my_table_1"]], ["main-update-my_table_1"])
+		stmts = self.statements({"blocks": [{"statements": writes["my_table_0"]}]})
+		self.assertTrue(stmts[1].startswith('update "my_ks_0"."my_table_0" set "my_column_9" = "my_column_9" + fromJson({t0_my_column_9_dist}) where'))
+		self.assertBindingsDefined(config)
+
+	def test_composite_bindings(self):
+		for name in ["my_table_1", "my_table_2"]:
+			del self.keyspace.tables[name]
+		table = self.keyspace.tables["my_table_0"]
+		# Composite primary keys are supported as well
+		table.partition_key = [table.columns["my_column_12"]]
+		config = build_config(self.keyspace, **{"collection-size": 3})
+		bindings = config["bindings"]
+		self.assertEqual(bindings["my_column_9_dist"], "Hash(); Mod(2000000); Template('[{},{},{}]', ToInt(), ToInt(), ToInt()) -> String")
+		self.assertEqual(bindings["my_column_12_seq"], "Mod(2000000); Template('[{},[\"{}\",{}]]', ToInt(), ToString(), ToDouble()) -> String")
+		self.assertEqual(bindings["user_dist"], "Hash(); Mod(2000000); Template('{\"name\":[\"{}\",\"{}\"],\"address\":{\"street\":\"{}\",\"number\":{}}}', ToString(), ToString(), ToString(), ToInt()) -> String")
+		# Maps with composite keys can't be rendered as JSON
+		self.assertNotIn("collections_dist", bindings)
+		stmts = self.statements(config)
+		self.assertIn('"my_column_12" = fromJson({my_column_12_dist})', stmts[1])
+		self.assertIn("fromJson({my_column_10_dist})", stmts[0])
+		self.assertNotIn('"collections"', stmts[0])
+		self.assertBindingsDefined(config)
+
+	def test_composite_bindings_before_json(self):
+		for name in ["my_table_1", "my_table_2"]:
+			del self.keyspace.tables[name]
+		cluster = build_cluster(self.keyspace)
+		cluster.metadata.all_hosts = lambda: [StubHost("dc1", "2.1.22")]
+		config = yaml.safe_load(NbExporter(cluster, build_props()).export_schema())
+		# fromJson() requires Cassandra 2.2 so composite columns are left out
+		self.assertNotIn("my_column_9_dist", config["bindings"])
+		self.assertFalse(any("fromJson" in stmt for stmt in self.statements(config)))
+		self.assertIn('"my_column_8"', self.statements(config)[0])
+		self.assertBindingsDefined(config)
+
+	def test_supports_json(self):
+		self.assertTrue(supports_json(""))
+		self.assertTrue(supports_json("2.2.19,4.0-rc1"))
+		self.assertFalse(supports_json("2.1.22,3.11.10"))
+
+	def test_json_template(self):
+		self.assertEqual(build_json_template("map<int, frozen<set<text>>>", {}, 1), ('{"{}":["{}"]}', ["ToInt()", "ToString()"]))
+		self.assertEqual(build_json_template("frozen<list<uuid>>", {}, 2), ('["{}","{}"]', ["ToHashedUUID()", "ToHashedUUID()"]))
+		self.assertIsNone(build_json_template("list<blob>", {}, 2))
+		self.assertIsNone(build_json_template("frozen<unknown_udt>", {}, 2))
+
+	def test_capacity_search(self):
+		config = build_config(self.keyspace, **{"capacity-search": "threads", "capacity-steps": 2})
+		scenarios = config["scenarios"]
+		self.assertEqual(scenarios["capacity"][0], scenarios["TEMPLATE(scenarioname,default)"][0])
+		# Offline clusters have no hosts but are treated as a single host
+		self.assertEqual(scenarios["capacity"][1:], [
+			"run driver=cql tags=phase:main cycles=1000 threads=8 alias=step1",
+			"run driver=cql tags=phase:main cycles=1000 threads=16 alias=step2"])
+		self.assertNotIn("capacity", build_config(self.keyspace)["scenarios"])
+
+	def test_schema_churn(self):
+		del self.keyspace.tables["my_table_2"]
+		config = build_config(self.keyspace, **{"schema-churn": {"create-table": 2, "add-column": 3, "alter-type": 1, "drop-table": 2}, "churn-cycles": 50})
+		self.assertEqual(config["scenarios"]["churn"], ["run driver=cql tags=phase:churn-setup cycles=1 threads=1",
+			"run driver=cql tags=phase:churn-ddl cycles=50 threads=1 seq=concat"])
+		blocks = {b["name"]: b for b in config["blocks"]}
+		self.assertEqual(blocks["churn-setup"]["statements"][0]["churn-create-type"], 'create type if not exists "my_ks_0"."churn_type" (churn_field int)')
+		stmts = self.statements({"blocks": [blocks["churn-my_table_1"]]})
+		self.assertTrue(stmts[0].startswith('create table if not exists "my_ks_0".churn_1_{churn_round}_{t1_churn_create_table_slot} ("my_column_0" ascii,'))
+		self.assertTrue(stmts[0].endswith('primary key (("my_column_0","my_column_1"),"my_column_2","my_column_3"))'))
+		self.assertEqual(stmts[1], 'alter table "my_ks_0".churn_1_{churn_round}_{t1_churn_add_column_slot} add "churn_column_{churn_cycle}" int')
+		self.assertEqual(stmts[3], 'drop table if exists "my_ks_0".churn_1_{churn_round}_{t1_churn_drop_table_slot}')
+		self.assertEqual([s["params"]["ratio"] for s in blocks["churn-my_table_1"]["statements"]], [2, 3, 1, 2])
+		# Each round of 16 cycles creates two tables per exported table, which later statements of the round target
+		bindings = config["bindings"]
+		self.assertEqual(bindings["churn_round"], "Div(16); ToString() -> String")
+		self.assertEqual(bindings["t1_churn_create_table_slot"], "Mod(16); Add(-8); ToString() -> String")
+		self.assertEqual(bindings["t1_churn_drop_table_slot"], "Mod(16); Add(-14); Mod(2); ToString() -> String")
+		self.assertBindingsDefined(config)
+		self.assertNotIn("churn", build_config(self.keyspace)["scenarios"])
+
+	def test_schema_churn_column_kinds(self):
+		del self.keyspace.tables["my_table_2"]
+		self.keyspace.tables["my_table_0"].columns["my_column_13"].is_static = True
+		# Counter tables can only have counter regular columns
+		counters = self.keyspace.tables["my_table_1"]
+		for col in list(get_column_index(counters).regular):
+			if col.name != "my_column_4":
+				del counters.columns[col.name]
+		counters.columns["my_column_4"].cql_type = "counter"
+		invalidate_column_index(counters)
+		config = build_config(self.keyspace, **{"schema-churn": {"create-table": 1, "add-column": 1}})
+		blocks = {b["name"]: b for b in config["blocks"]}
+		stmts = self.statements({"blocks": [blocks["churn-my_table_0"]]})
+		self.assertIn('"my_column_13" text static,', stmts[0])
+		self.assertTrue(stmts[1].endswith(" int"))
+		stmts = self.statements({"blocks": [blocks["churn-my_table_1"]]})
+		self.assertIn('"my_column_4" counter,', stmts[0])
+		self.assertTrue(stmts[1].endswith('add "churn_column_{churn_cycle}" counter'))
+
+	def test_churn_slots(self):
+		self.assertEqual(build_churn_slots([("a", [("create-table", 2), ("drop-table", 2)]), ("b", [("create-table", 1)])]),
+			(5, {("a", "create-table"): 0, ("a", "drop-table"): 2, ("b", "create-table"): 4}))
+
+	def test_capacity_steps(self):
+		self.assertEqual(build_capacity_steps("rate", 3, 2, 1000), [
+			"run driver=cql tags=phase:main cycles=180000 threads=auto alias=step1 cyclerate=3000",
+			"run driver=cql tags=phase:main cycles=360000 threads=auto alias=step2 cyclerate=6000"])
+		self.assertEqual(build_capacity_steps("threads", 3, 1, 1000), ["run driver=cql tags=phase:main cycles=3000 threads=24 alias=step1"])
+
+	def test_fetch_table_traffic(self):
+		session = StubSession({"read": [("t0", 10), ("t1", 5)], "write": [("t0", 1), ("t2", 3)]})
+		self.assertEqual(fetch_table_traffic(session, "ks"), {"t0": (10, 1), "t1": (5, 0), "t2": (0, 3)})
+		self.assertIsNone(fetch_table_traffic(StubSession(None), "ks"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+
+from adelphi.exceptions import SchemaParseException
+from adelphi.offline import NON_TEXT_COLUMNS, build_offline_cluster, load_cql_file, split_statements
+from tests.util.schemadiff import cqlDigestGenerator
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+CQL_REFERENCE_SCHEMA_PATH = "tests/integration/resources/cql-schemas/{}.cql"
+
+class TestOffline(unittest.TestCase):
+
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpdir)
+
+	def export(self, cluster):
+		return "\n\n".join(ks.export_as_string() for ks in cluster.metadata.keyspaces.values())
+
+	def digests(self, path):
+		return set(digest for (_, digest) in cqlDigestGenerator(path))
+
+	def assertMatchesReference(self, version):
+		reference_path = CQL_REFERENCE_SCHEMA_PATH.format(version)
+		export_path = os.path.join(self.tmpdir, "export.cql")
+		with open(export_path, "w") as f:
+			# Reference schemas were generated by export-cql so account for the IF NOT EXISTS rewrite
+			f.write(self.export(build_offline_cluster(reference_path))\
+				.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS")\
+				.replace("CREATE KEYSPACE", "CREATE KEYSPACE IF NOT EXISTS")\
+				.replace("CREATE TYPE", "CREATE TYPE IF NOT EXISTS")\
+				.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS"))
+		self.assertEqual(self.digests(reference_path), self.digests(export_path))
+
+	def test_cql_file_cass2(self):
+		self.assertMatchesReference("2.1.22")
+
+	def test_cql_file_cass4(self):
+		self.assertMatchesReference("4.0-rc1")
+
+	def test_keyspace_and_table_selection(self):
+		cluster = build_offline_cluster(CQL_REFERENCE_SCHEMA_PATH.format("4.0-rc1"), tables=["ks_1.tbl_2"])
+		self.assertEqual(list(cluster.metadata.keyspaces.keys()), ["ks_1"])
+		self.assertEqual(list(cluster.metadata.keyspaces["ks_1"].tables.keys()), ["tbl_2"])
+
+	def test_json_dump(self):
+		reference_path = CQL_REFERENCE_SCHEMA_PATH.format("4.0-rc1")
+		for (table, rows) in load_cql_file(reference_path).items():
+			with open(os.path.join(self.tmpdir, table + ".json"), "w") as f:
+				for row in rows:
+					f.write(json.dumps({k: (sorted(v) if isinstance(v, set) else v) for (k, v) in row.items()}) + "\n")
+		self.assertEqual(self.export(build_offline_cluster(self.tmpdir)), self.export(build_offline_cluster(reference_path)))
+
+	def test_csv_dump(self):
+		reference_path = CQL_REFERENCE_SCHEMA_PATH.format("4.0-rc1")
+		for (table, rows) in load_cql_file(reference_path).items():
+			if not rows:
+				continue
+			with open(os.path.join(self.tmpdir, table + ".csv"), "w") as f:
+				writer = csv.DictWriter(f, fieldnames=sorted(set(k for row in rows for k in row.keys())))
+				writer.writeheader()
+				for row in rows:
+					writer.writerow({k: (repr(v) if k in NON_TEXT_COLUMNS else v) for (k, v) in row.items()})
+		self.assertEqual(self.export(build_offline_cluster(self.tmpdir)), self.export(build_offline_cluster(reference_path)))
+
+	def test_missing_dump(self):
+		self.assertRaises(SchemaParseException, build_offline_cluster, self.tmpdir)
+
+	def test_unsupported_statements(self):
+		cql_path = os.path.join(self.tmpdir, "schema.cql")
+		with open(cql_path, "w") as f:
+			f.write("""CREATE KEYSPACE ks WITH replication = {'class': 'SimpleStrategy', 'replication_factor': '1'};
+CREATE TABLE ks.t (a int PRIMARY KEY, "C" map<text, int>);
+CREATE INDEX ON ks.t ("C");
+CREATE INDEX t_keys_idx ON ks.t (keys("C"));
+CREATE MATERIALIZED VIEW ks.v AS SELECT * FROM ks.t WHERE a IS NOT NULL PRIMARY KEY (a);
+CREATE FUNCTION ks.f (a int) RETURNS NULL ON NULL INPUT RETURNS int LANGUAGE java AS $$ return a * 2; $$;
+""")
+		table = build_offline_cluster(cql_path).metadata.keyspaces["ks"].tables["t"]
+		self.assertEqual(list(table.columns.keys()), ["a", "C"])
+		self.assertEqual(sorted(index.index_options["target"] for index in table.indexes.values()), ["\"C\"", "keys(\"C\")"])
+		self.assertIn("CREATE INDEX t_keys_idx ON ks.t (keys(\"C\"))", table.export_as_string())
+
+	def test_split_statements(self):
+		lines = ["CREATE KEYSPACE ks WITH replication = {'class': 'Simple;Strategy'}; -- comment;\n",
+			"/* multi-line;\n",
+			"comment; */ USE \"k;s\";\n",
+			"USE ks"]
+		self.assertEqual(list(split_statements(lines)),
+			["CREATE KEYSPACE ks WITH replication = {'class': 'Simple;Strategy'}",
+			"/* multi-line;\ncomment; */ USE \"k;s\"",
+			"USE ks"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+from adelphi.profile import sample_table, token_ranges, ColumnProfile, MURMUR3_PARTITIONER
+from tests.util.schema_util import get_schema
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+class StubSession(object):
+	"""Returns rows_per_query rows for every query, each containing a text value and a blob value"""
+
+	def __init__(self, rows_per_query):
+		self.rows_per_query = rows_per_query
+		self.queries = []
+
+	def execute(self, query, params):
+		self.queries.append((query, params))
+		return [("v{}".format(i % 3), b"x" * (10 + i % 2)) for i in range(min(self.rows_per_query, params[-1]))]
+
+class TestProfile(unittest.TestCase):
+
+	def setUp(self):
+		self.keyspace = get_schema().keyspaces[0]
+		self.table = self.keyspace.tables["my_table_0"]
+		self.columns = [self.table.columns["my_column_13"], self.table.columns["my_column_2"]]
+
+	def test_token_ranges(self):
+		ranges = token_ranges(MURMUR3_PARTITIONER, 4)
+		self.assertEqual(len(ranges), 4)
+		self.assertEqual(ranges[0][0], -2 ** 63)
+		self.assertEqual(ranges[-1][1], 2 ** 63 - 1)
+		for (prev, curr) in zip(ranges, ranges[1:]):
+			self.assertEqual(prev[1], curr[0])
+		self.assertIsNone(token_ranges("org.apache.cassandra.dht.ByteOrderedPartitioner", 4))
+
+	def test_sample_table(self):
+		session = StubSession(100)
+		profiles = sample_table(session, self.keyspace, self.table, MURMUR3_PARTITIONER, max_rows=40, range_count=8, columns=self.columns)
+
+		# Each range is limited to its share of the rows
+		self.assertEqual(len(session.queries), 8)
+		self.assertTrue(all(params[-1] == 5 for (_, params) in session.queries))
+		self.assertIn('token("my_column_0","my_column_1") >', session.queries[0][0])
+
+		text = profiles["my_column_13"]
+		self.assertEqual(text.count, 40)
+		self.assertEqual(text.cardinality, 3)
+		self.assertFalse(text.is_unique())
+		self.assertEqual(profiles["my_column_2"].cardinality, 2)
+
+	def test_sample_stops_at_max_rows(self):
+		session = StubSession(100)
+		sample_table(session, self.keyspace, self.table, MURMUR3_PARTITIONER, max_rows=10, range_count=2, columns=self.columns)
+		self.assertEqual(len(session.queries), 2)
+		session = StubSession(100)
+		sample_table(session, self.keyspace, self.table, "org.apache.cassandra.dht.ByteOrderedPartitioner", max_rows=10, columns=self.columns)
+		self.assertEqual(session.queries[0][1], (10,))
+		self.assertNotIn("token", session.queries[0][0])
+
+	def test_column_profile(self):
+		profile = ColumnProfile()
+		for value in ["a", "bb", "bb", None, "cccc"]:
+			profile.add(value)
+		self.assertEqual((profile.count, profile.cardinality), (4, 3))
+		self.assertEqual(profile.length_weights(), [(1, 1), (2, 2), (4, 1)])
+		self.assertEqual(ColumnProfile().length_weights(), [])
+
+	def test_length_quantiles(self):
+		profile = ColumnProfile()
+		for i in range(1000):
+			profile.add("x" * (i % 100 + 1))
+		weights = profile.length_weights(max_lengths=4)
+		self.assertEqual(weights, [(13, 250), (38, 250), (63, 250), (88, 250)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+import logging
+import time
+
+from cassandra import InvalidRequest
+from cassandra.metadata import KeyspaceMetadata
+
+from adelphi.exceptions import TableSelectionException
+from adelphi.offline import CqlSchemaReader
+from adelphi.store import fetch_keyspace_metadata, group_table_names, get_column_index, invalidate_column_index,\
+	PARTITION_KEY, CLUSTERING, REGULAR
+from tests.util.schema_util import get_schema
+
+log = logging.getLogger('adelphi')
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+class StubMetadata(object):
+
+	def __init__(self):
+		self.keyspaces = {}
+
+class StubCluster(object):
+	"""Records the refresh calls made against it.  Only keyspaces in known_keyspaces can be refreshed."""
+
+	def __init__(self, known_keyspaces):
+		self.known_keyspaces = known_keyspaces
+		self.metadata = StubMetadata()
+		self.refreshed = []
+
+	def refresh_keyspace_metadata(self, keyspace, max_schema_agreement_wait=None):
+		self.refreshed.append(("keyspace", keyspace))
+		if keyspace in self.known_keyspaces:
+			self.metadata.keyspaces[keyspace] = KeyspaceMetadata(keyspace, True, "SimpleStrategy", {"replication_factor": 1})
+
+	def refresh_user_type_metadata(self, keyspace, user_type, max_schema_agreement_wait=None):
+		self.refreshed.append(("type", keyspace, user_type))
+
+	def refresh_table_metadata(self, keyspace, table, max_schema_agreement_wait=None):
+		self.refreshed.append(("table", keyspace, table))
+
+	def refresh_materialized_view_metadata(self, keyspace, view, max_schema_agreement_wait=None):
+		self.refreshed.append(("view", keyspace, view))
+
+	def refresh_user_function_metadata(self, keyspace, function, max_schema_agreement_wait=None):
+		self.refreshed.append(("function", keyspace, function.name))
+
+	def refresh_user_aggregate_metadata(self, keyspace, aggregate, max_schema_agreement_wait=None):
+		self.refreshed.append(("aggregate", keyspace, aggregate.name))
+
+class StubRow(dict):
+
+	def _asdict(self):
+		return self
+
+class StubSession(object):
+	"""Returns canned rows for system_schema queries and rejects everything else.  Queries for entire rows are
+	answered from schema_rows (rows built from DDL) and are rejected if it isn't provided, as they would be by
+	clusters without system_schema."""
+
+	def __init__(self, rows, schema_rows=None):
+		self.rows = rows
+		self.schema_rows = schema_rows
+		self.queries = []
+
+	def execute(self, query, params):
+		self.queries.append((query, params))
+		if "system_schema" not in query:
+			raise InvalidRequest("Keyspace system does not exist")
+		table = query.split("FROM system_schema.")[1].split()[0]
+		if query.startswith("SELECT *"):
+			if self.schema_rows is None:
+				raise InvalidRequest("Keyspace system_schema does not exist")
+			return [StubRow(row) for row in self.schema_rows.get(table, []) if row["keyspace_name"] == params[0]]
+		return self.rows.get((table, params[0]), [])
+
+def build_schema_rows(table_count):
+	ddl = ["CREATE KEYSPACE ks0 WITH replication = {'class': 'SimpleStrategy', 'replication_factor': '1'};",
+		"CREATE TYPE ks0.address (street text);"]
+	for idx in range(table_count):
+		ddl.append("CREATE TABLE ks0.tbl{0} (id int PRIMARY KEY, a frozen<address>, b text);".format(idx))
+		ddl.append("CREATE INDEX ON ks0.tbl{} (b);".format(idx))
+	return CqlSchemaReader().read(ddl)
+
+class TestStore(unittest.TestCase):
+
+	def setUp(self):
+		self.session = StubSession({
+			("types", "ks0"): [("address",)],
+			("tables", "ks0"): [("tbl0",), ("tbl1",)],
+			("views", "ks0"): [("view0", "tbl0"), ("view1", "tbl1")],
+			("functions", "ks0"): [("fn0", ["int"])]
+		})
+		self.cluster = StubCluster(["ks0", "ks1"])
+
+	def test_group_table_names(self):
+		self.assertEqual(group_table_names(["ks0.tbl0", "ks0.tbl1", "ks1.tbl0"]), {"ks0": ["tbl0", "tbl1"], "ks1": ["tbl0"]})
+		self.assertEqual(group_table_names(None), {})
+		self.assertRaises(TableSelectionException, group_table_names, ["tbl0"])
+		self.assertRaises(TableSelectionException, group_table_names, ["ks0."])
+
+	def test_fetch_keyspace(self):
+		session = StubSession({}, build_schema_rows(3))
+		fetch_keyspace_metadata(self.cluster, session, ["ks0"])
+		keyspace = self.cluster.metadata.keyspaces["ks0"]
+		self.assertEqual(sorted(keyspace.tables.keys()), ["tbl0", "tbl1", "tbl2"])
+		self.assertEqual(list(keyspace.user_types.keys()), ["address"])
+		self.assertEqual(list(keyspace.tables["tbl1"].indexes.keys()), ["tbl1_b_idx"])
+		self.assertEqual(self.cluster.refreshed, [("keyspace", "ks0")])
+		self.assertTrue(all(params == ("ks0",) for (_, params) in session.queries))
+
+	def test_fetch_tables(self):
+		session = StubSession({}, build_schema_rows(3))
+		fetch_keyspace_metadata(self.cluster, session, None, ["ks0.tbl1"])
+		self.assertEqual(list(self.cluster.metadata.keyspaces["ks0"].tables.keys()), ["tbl1"])
+
+	def test_fetch_query_count(self):
+		# The number of queries (and so round trips) needed for a keyspace doesn't depend on the number of tables
+		counts = []
+		for table_count in (1, 500):
+			session = StubSession({}, build_schema_rows(table_count))
+			start = time.time()
+			fetch_keyspace_metadata(StubCluster(["ks0"]), session, ["ks0"])
+			counts.append(len(session.queries))
+			log.info("Fetched {} tables in {:.3f}s".format(table_count, time.time() - start))
+		self.assertEqual(counts[0], counts[1])
+
+	def test_fetch_keyspace_elements(self):
+		fetch_keyspace_metadata(self.cluster, self.session, ["ks0"])
+		self.assertEqual(self.cluster.refreshed, [
+			("keyspace", "ks0"),
+			("type", "ks0", "address"),
+			("table", "ks0", "tbl0"),
+			("table", "ks0", "tbl1"),
+			("view", "ks0", "view0"),
+			("view", "ks0", "view1"),
+			("function", "ks0", "fn0")])
+		# No query should ever be issued for keyspaces which weren't requested
+		self.assertTrue(all(params == ("ks0",) for (_, params) in self.session.queries))
+
+	def test_fetch_table_elements(self):
+		fetch_keyspace_metadata(self.cluster, self.session, None, ["ks0.tbl0"])
+		tables = [r for r in self.cluster.refreshed if r[0] in ("table", "view")]
+		self.assertEqual(tables, [("table", "ks0", "tbl0"), ("view", "ks0", "view0")])
+
+	def test_fetch_missing_keyspace(self):
+		fetch_keyspace_metadata(self.cluster, self.session, ["ks2"])
+		self.assertEqual(self.cluster.refreshed, [("keyspace", "ks2")])
+
+class TestTableColumnIndex(unittest.TestCase):
+
+	def setUp(self):
+		self.table = get_schema().keyspaces[0].tables["my_table_0"]
+
+	def test_roles(self):
+		columns = get_column_index(self.table)
+		self.assertEqual([c.name for c in columns.partition_key], ["my_column_0", "my_column_1"])
+		self.assertEqual([c.name for c in columns.clustering_key], ["my_column_2", "my_column_3"])
+		self.assertEqual(len(columns.non_key), len(self.table.columns) - 4)
+		self.assertEqual(columns.static, [])
+		self.assertEqual(columns.role("my_column_1").kind, PARTITION_KEY)
+		self.assertEqual(columns.role("my_column_1").position, 1)
+		self.assertEqual(columns.role("my_column_3").kind, CLUSTERING)
+		self.assertEqual(columns.role("my_column_4").kind, REGULAR)
+		self.assertTrue(columns.is_primary_key("my_column_2"))
+		self.assertFalse(columns.is_primary_key("my_column_4"))
+		self.assertIsNone(columns.role("not_a_column"))
+
+	def test_index_is_shared(self):
+		columns = get_column_index(self.table)
+		self.assertIs(get_column_index(self.table), columns)
+		self.table.partition_key[0].name = "renamed"
+		invalidate_column_index(self.table)
+		self.assertTrue(get_column_index(self.table).is_primary_key("renamed"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+from cassandra.metadata import Metadata
+
+from adelphi.exceptions import KeyspaceSelectionException
+from adelphi.offline import OfflineCluster
+from adelphi.store import get_column_index
+from adelphi.synth import synthesize_cluster, synthesize_keyspaces
+from tests.util.schema_util import get_schema
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest  # noqa
+
+class TestSynth(unittest.TestCase):
+
+	def setUp(self):
+		self.keyspace = get_schema().keyspaces[0]
+
+	def test_synthesize_keyspaces(self):
+		keyspaces = synthesize_keyspaces([self.keyspace], 2, 5)
+		self.assertEqual([ks.name for ks in keyspaces], ["ks_0", "ks_1"])
+		for ks in keyspaces:
+			self.assertEqual(list(ks.tables.keys()), ["tbl_{}".format(i) for i in range(5)])
+			self.assertEqual(sorted(ks.user_types.keys()), ["udt_0", "udt_1", "udt_2"])
+			# Index names must be unique within a keyspace
+			index_names = [index.name for table in ks.tables.values() for index in table.indexes.values()]
+			self.assertEqual(len(index_names), len(set(index_names)))
+			for table in ks.tables.values():
+				self.assertEqual(table.keyspace_name, ks.name)
+				self.assertEqual(table.options["comment"], "")
+		# Tables are copies of the source tables taken in turn, with the same primary key structure
+		source = sorted(self.keyspace.tables.values(), key=lambda t: t.name)
+		for (idx, table) in enumerate(keyspaces[0].tables.values()):
+			(copied, original) = (get_column_index(table), get_column_index(source[idx % len(source)]))
+			self.assertEqual([c.cql_type for c in copied.partition_key], [c.cql_type for c in original.partition_key])
+			self.assertEqual(len(copied.clustering_key), len(original.clustering_key))
+			self.assertEqual(len(table.columns), len(source[idx % len(source)].columns))
+		# The source keyspace is left untouched
+		self.assertEqual(self.keyspace.name, "my_ks_0")
+		self.assertEqual(sorted(self.keyspace.tables.keys()), ["my_table_0", "my_table_1", "my_table_2"])
+
+	def test_synthesized_cql(self):
+		cql = synthesize_keyspaces([self.keyspace], 1, 2)[0].export_as_string()
+		self.assertIn("CREATE TABLE ks_0.tbl_1", cql)
+		self.assertNotIn("my_", cql)
+
+	def test_synthesize_cluster(self):
+		metadata = Metadata()
+		metadata.keyspaces = {self.keyspace.name: self.keyspace}
+		cluster = synthesize_cluster(OfflineCluster(metadata), None, 3, 1)
+		self.assertEqual(sorted(cluster.metadata.keyspaces.keys()), ["ks_0", "ks_1", "ks_2"])
+		self.assertIn("my_ks_0", metadata.keyspaces)
+
+	def test_no_tables(self):
+		self.keyspace.tables = {}
+		self.assertRaises(KeyspaceSelectionException, synthesize_keyspaces, [self.keyspace], 1, 1)
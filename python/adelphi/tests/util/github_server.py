@@ -0,0 +1,184 @@
+# A minimal local stand-in for the parts of the Github API used by adelphi.gh
+import hashlib
+import json
+import re
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+USER = "user"
+REPO = "adelphi-schemas"
+ORIGIN_USER = "datastax"
+
+# Full names of the user's fork and the origin repository it was forked from
+FORK_REPO = "{}/{}".format(USER, REPO)
+ORIGIN_REPO = "{}/{}".format(ORIGIN_USER, REPO)
+
+def fake_sha(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def blob_sha(content):
+    data = content.encode("utf-8")
+    return hashlib.sha1("blob {}\0".format(len(data)).encode("utf-8") + data).hexdigest()
+
+
+class GithubState(object):
+    """Git objects known to the stand-in along with every request it has received.  Git objects are shared by the
+    fork and origin repositories (as they are on Github) but each has its own refs; refs holds the refs of the
+    fork."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.trees = {}
+        self.commits = {}
+        self.refs = {}
+        self.origin_refs = {}
+        self.repo_refs = {FORK_REPO: self.refs, ORIGIN_REPO: self.origin_refs}
+        self.requests = []
+        # (method, path regex) -> list of (status, headers, body) returned before the request is actually handled
+        self.failures = {}
+        # If set recursive tree listings only include top-level entries and are flagged as truncated
+        self.truncate_recursive = False
+
+        root_tree = self.add_tree({})
+        self.refs["heads/main"] = self.add_commit("Initial commit", root_tree, [])
+        self.origin_refs["heads/main"] = self.refs["heads/main"]
+
+    def repo_url(self, repo=FORK_REPO):
+        return "{}/repos/{}".format(self.base_url, repo)
+
+    def add_tree(self, files):
+        sha = fake_sha("tree", files)
+        self.trees[sha] = files
+        return sha
+
+    def add_commit(self, message, tree_sha, parent_shas):
+        sha = fake_sha("commit", message, tree_sha, parent_shas)
+        self.commits[sha] = {"message": message, "tree": tree_sha, "parents": parent_shas}
+        return sha
+
+    def files(self, ref, repo=FORK_REPO):
+        return self.trees[self.commits[self.repo_refs[repo][ref]]["tree"]]
+
+    def tree_json(self, sha, recursive=False, repo=FORK_REPO):
+        """Trees are stored as flat dicts of path -> content; directories are returned as subtrees which are
+        registered on demand"""
+        files = self.trees[sha]
+        truncated = recursive and self.truncate_recursive
+        recursive = recursive and not truncated
+        entries = []
+        parts = [path.split("/")[:-1] for path in files]
+        dirs = sorted(set("/".join(p[:i]) for p in parts for i in range(1, len(p) + 1)))
+        for dir_path in dirs:
+            if recursive or "/" not in dir_path:
+                subtree = self.add_tree({p[len(dir_path) + 1:]: c for (p, c) in files.items() if p.startswith(dir_path + "/")})
+                entries.append({"path": dir_path, "mode": "040000", "type": "tree", "sha": subtree})
+        for (path, content) in sorted(files.items()):
+            if recursive or "/" not in path:
+                entries.append({"path": path, "mode": "100644", "type": "blob", "sha": blob_sha(content)})
+        return {"sha": sha, "url": "{}/git/trees/{}".format(self.repo_url(repo), sha), "tree": entries, "truncated": truncated}
+
+    def commit_json(self, sha, repo=FORK_REPO):
+        commit = self.commits[sha]
+        repo_url = self.repo_url(repo)
+        return {"sha": sha, "url": "{}/git/commits/{}".format(repo_url, sha), "message": commit["message"],
+                "tree": {"sha": commit["tree"], "url": "{}/git/trees/{}".format(repo_url, commit["tree"])},
+                "parents": [{"sha": p, "url": "{}/git/commits/{}".format(repo_url, p)} for p in commit["parents"]]}
+
+    def ref_json(self, ref, repo=FORK_REPO):
+        sha = self.repo_refs[repo][ref]
+        return {"ref": "refs/" + ref, "url": "{}/git/refs/{}".format(self.repo_url(repo), ref),
+                "object": {"sha": sha, "type": "commit", "url": "{}/git/commits/{}".format(self.repo_url(repo), sha)}}
+
+
+class GithubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers={}):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for (k, v) in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_request(self, method):
+        state = self.server.state
+        path = self.path.split("?")[0]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length).decode("utf-8")) if length else None
+        state.requests.append((method, path))
+
+        for ((fail_method, fail_path), responses) in state.failures.items():
+            if fail_method == method and re.match(fail_path, path) and responses:
+                (status, headers, fail_body) = responses.pop(0)
+                return self.send_json(status, fail_body, headers)
+
+        if method == "GET" and path == "/user":
+            return self.send_json(200, {"login": USER, "url": state.base_url + "/users/" + USER})
+        match = re.match(r"/repos/([^/]+/[^/]+)(/.*)?$", path)
+        if not match or match.group(1) not in state.repo_refs:
+            return self.send_json(404, {"message": "Not Found"})
+        (repo, path) = (match.group(1), match.group(2) or "")
+        refs = state.repo_refs[repo]
+        if method == "GET" and not path:
+            return self.send_json(200, {"name": REPO, "full_name": repo, "url": state.repo_url(repo)})
+
+        match = re.match(r"/branches/(.+)$", path)
+        if method == "GET" and match:
+            sha = refs["heads/" + match.group(1)]
+            return self.send_json(200, {"name": match.group(1), "commit": {"sha": sha, "url": "{}/commits/{}".format(state.repo_url(repo), sha)}})
+        match = re.match(r"/git/trees/(\w+)$", path)
+        if method == "GET" and match:
+            sha = match.group(1)
+            # Trees can also be looked up by commit SHA
+            sha = state.commits[sha]["tree"] if sha in state.commits else sha
+            return self.send_json(200, state.tree_json(sha, "recursive" in self.path, repo))
+        match = re.match(r"/git/commits/(\w+)$", path)
+        if method == "GET" and match:
+            return self.send_json(200, state.commit_json(match.group(1), repo))
+        if method == "POST" and path == "/git/refs":
+            refs[body["ref"][len("refs/"):]] = body["sha"]
+            return self.send_json(201, state.ref_json(body["ref"][len("refs/"):], repo))
+        match = re.match(r"/git/refs?/(.+)$", path)
+        if method == "GET" and match:
+            return self.send_json(200, state.ref_json(match.group(1), repo))
+        if method == "PATCH" and match:
+            refs[match.group(1)] = body["sha"]
+            return self.send_json(200, state.ref_json(match.group(1), repo))
+        if method == "POST" and path == "/git/trees":
+            files = dict(state.trees[body["base_tree"]]) if "base_tree" in body else {}
+            files.update({e["path"]: e["content"] for e in body["tree"]})
+            return self.send_json(201, state.tree_json(state.add_tree(files), repo=repo))
+        if method == "POST" and path == "/git/commits":
+            sha = state.add_commit(body["message"], body["tree"], body["parents"])
+            return self.send_json(201, state.commit_json(sha, repo))
+        return self.send_json(404, {"message": "Not Found"})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PATCH(self):
+        self.handle_request("PATCH")
+
+
+def start_github_server():
+    """Start a stand-in Github API server on a free local port in a background thread.  Returns the server, whose
+    state attribute records all requests and git objects."""
+    server = HTTPServer(("127.0.0.1", 0), GithubHandler)
+    server.state = GithubState("http://127.0.0.1:{}".format(server.server_address[1]))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server